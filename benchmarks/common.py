@@ -0,0 +1,68 @@
+"""Helpers shared by the benchmark scripts"""
+import os
+import sys
+import json
+import time
+import platform
+import resource
+import subprocess
+from pathlib import Path
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process and its finished children (parse workers)"""
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(own / scale, 1), round(children / scale, 1)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def offline_environment(workdir, backend="hash", cache=False):
+    """Point storage at workdir and pick the embedding backend, before basicmcp is imported"""
+    os.environ["BASICMCP_EMBEDDING_BACKEND"] = backend
+    os.environ["BASICMCP_STORAGE_DIR"] = str(Path(workdir) / "indices")
+    if not cache:
+        os.environ["BASICMCP_EMBEDDING_CACHE"] = "0"
+
+
+def percentiles(samples, points=(50, 95, 99)):
+    """Nearest-rank percentiles in milliseconds of samples in seconds"""
+    ordered = sorted(samples)
+    if not ordered:
+        return {}
+    return {
+        f"p{point}": round(ordered[min(len(ordered) - 1, max(0, -(-point * len(ordered) // 100) - 1))] * 1000, 3)
+        for point in points
+    }
+
+
+def run_metadata(benchmark, args):
+    return {
+        "benchmark": benchmark,
+        "commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+    }
+
+
+def write_results(results, output=None):
+    """Write results as JSON, by default to benchmarks/results/<benchmark>-<commit>-<time>.json"""
+    output = Path(output) if output else RESULTS_DIR / f"{results['benchmark']}-{results['commit']}-{int(time.time())}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(f"Results written to {output}")
+    return output
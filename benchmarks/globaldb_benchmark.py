@@ -0,0 +1,142 @@
+"""
+Request latency benchmark for the global database tools.
+
+Replays globaldb_ingest and globaldb_query requests twice: once creating a new GlobalDB per request,
+which loads the model and opens the table every time as get_global_table used to, and once
+through the process-wide GlobalDB. Queries go through query_db and result_content like the tool.
+Reports p50/p95/p99 per request type in milliseconds and writes JSON. With --bulk N it also ingests a directory of N images, once as a single globaldb_ingest
+request listing every file (ingest_data, which reads and embeds them in the calling thread) and once
+with ingest_images, and reports images per second. Needs the multimodal model, by default
+open-clip (pip install open-clip-torch).
+
+    python benchmarks/globaldb_benchmark.py --requests 20
+    python benchmarks/globaldb_benchmark.py --modes shared --batch 16
+    python benchmarks/globaldb_benchmark.py --requests 0 --bulk 2000 --image-size 1024
+    python benchmarks/globaldb_benchmark.py --model-options '{"pretrained": "", "max_retries": 0}'
+"""
+import io
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+from common import peak_rss_mb, percentiles, run_metadata, write_results
+
+MODES = ("per-request", "shared")
+
+
+def random_image(rng, size=64):
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    color = tuple(rng.randrange(256) for _ in range(3))
+    Image.new("RGB", (size, size), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def open_db(uri, args):
+    from basicmcp.global_db.service import GlobalDB
+
+    return GlobalDB(uri=uri, model_name=args.model, model_options=args.model_options)
+
+
+def run_mode(mode, workdir, args):
+    from basicmcp.global_db import ops
+
+    rng = random.Random(args.seed)
+    shared = open_db(workdir / mode, args) if mode == "shared" else None
+
+    def service():
+        return shared or open_db(workdir / mode, args)
+
+    # query_db gets its GlobalDB from get_global_db, point it at this mode's
+    ops.get_global_db = service
+
+    ingest, query = [], []
+    for i in range(args.requests):
+        texts = [f"note {i}-{j} about {rng.choice(('cats', 'boats', 'maps', 'code'))}" for j in range(args.batch)]
+        images = [random_image(rng) for _ in range(args.batch)]
+        start = time.perf_counter()
+        service().add(texts, images)
+        ingest.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        ops.result_content(*ops.query_db(rng.choice(texts), limit=10))
+        query.append(time.perf_counter() - start)
+    result = {"ingest_ms": percentiles(ingest), "query_ms": percentiles(query)}
+    if shared is not None:
+        result["operations"] = shared.latency()
+    return result
+
+
+def run_bulk(workdir, args):
+    """Images per second of ingest_data and of ingest_images on the same directory"""
+    from basicmcp.global_db import ops
+
+    rng = random.Random(args.seed)
+    images = workdir / "images"
+    images.mkdir()
+    for i in range(args.bulk):
+        (images / f"{i}.png").write_bytes(random_image(rng, size=args.image_size))
+    files = ops.image_files(str(images))
+
+    serial = open_db(workdir / "bulk-ingest-data", args)
+    _ = serial.model
+    ops.get_global_db = lambda: serial
+    start = time.perf_counter()
+    message = ops.ingest_data(None, [str(path) for path in files])
+    serial_seconds = time.perf_counter() - start
+    if message.startswith("Error"):
+        raise RuntimeError(message)
+
+    bulk = open_db(workdir / "bulk", args)
+    _ = bulk.model
+    start = time.perf_counter()
+    bulk.ingest_images(files, total=len(files))
+    bulk_seconds = time.perf_counter() - start
+    return {
+        "images": len(files),
+        "ingest_data_images_per_second": round(len(files) / serial_seconds, 1),
+        "bulk_images_per_second": round(len(files) / bulk_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=10, help="Ingest and query requests per mode")
+    parser.add_argument("--batch", type=int, default=4, help="Text/image pairs per ingest request")
+    parser.add_argument("--modes", default=",".join(MODES))
+    parser.add_argument("--bulk", type=int, default=0, help="Images of the bulk ingestion comparison, 0 skips it")
+    parser.add_argument("--image-size", type=int, default=512, help="Side of the bulk ingestion images")
+    parser.add_argument("--model", default="open-clip", help="lancedb embedding registry name")
+    parser.add_argument("--model-options", type=json.loads, default={"max_retries": 0},
+                        help='JSON keyword arguments of the model, e.g. \'{"pretrained": ""}\' for random '
+                             'open-clip weights without downloading a checkpoint')
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON results path, defaults to benchmarks/results/")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="basicmcp-bench-"))
+    results = {**run_metadata("globaldb", args), "modes": {}}
+    try:
+        for mode in args.modes.split(",") if args.requests else ():
+            result = run_mode(mode, workdir, args)
+            results["modes"][mode] = result
+            print(f"{mode:<12} ingest p50 {result['ingest_ms']['p50']:>10} p95 {result['ingest_ms']['p95']:>10}  "
+                  f"query p50 {result['query_ms']['p50']:>10} p95 {result['query_ms']['p95']:>10} ms", flush=True)
+        if args.bulk:
+            results["bulk"] = run_bulk(workdir, args)
+            print(f"bulk         {results['bulk']['ingest_data_images_per_second']} images/s with ingest_data, "
+                  f"{results['bulk']['bulk_images_per_second']} images/s with ingest_images", flush=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results["peak_rss_mb"], _ = peak_rss_mb()
+    write_results(results, args.output)
+
+
+if __name__ == "__main__":
+    main()
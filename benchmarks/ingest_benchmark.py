@@ -0,0 +1,216 @@
+"""
+Ingestion throughput benchmark.
+
+Times each ingestion stage on a synthetic (or existing) codebase and writes the results as
+JSON, so runs can be compared across commits. Embeddings come from the offline, deterministic
+"hash" backend unless --backend says otherwise, and the embedding cache is off by default.
+
+    python benchmarks/ingest_benchmark.py --files 1000 --workers 4
+    python benchmarks/ingest_benchmark.py --repo ~/src/some-project --output results/project.json
+    python benchmarks/ingest_benchmark.py --files 1000 --compare results/before.json
+"""
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+from contextlib import contextmanager
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic_repo import generate_repo, LANGUAGES  # noqa: E402
+from common import peak_rss_mb, offline_environment, run_metadata, write_results  # noqa: E402
+
+
+class StageTimer:
+    def __init__(self):
+        self.stages = {}
+
+    @contextmanager
+    def stage(self, name, unit="rows"):
+        """Time a stage, the body sets result["items"] to the number of processed items"""
+        result = {}
+        start = time.perf_counter()
+        yield result
+        seconds = time.perf_counter() - start
+        items = result.get("items", 0)
+        rss, children_rss = peak_rss_mb()
+        self.stages[name] = {
+            "seconds": round(seconds, 4),
+            "items": items,
+            "unit": unit,
+            f"{unit}_per_sec": round(items / seconds, 1) if seconds else None,
+            "peak_rss_mb": rss,
+            "peak_children_rss_mb": children_rss,
+        }
+        print(f"{name:<22} {seconds:8.3f}s {items:>9} {unit:<6} peak rss {rss} MB", flush=True)
+
+
+def import_stages():
+    """Import the ingestion modules, which takes seconds the first time and is not part of any stage"""
+    import lancedb  # noqa: F401
+    from basicmcp.codeqa.index import ingest, preprocess, vector_index  # noqa: F401
+
+
+def run_stages(repo, workdir, timer, workers, batch_size):
+    # Imported here so the environment set up in main() applies to the modules' configuration
+    import lancedb
+    from basicmcp.codeqa.index import ingest
+    from basicmcp.codeqa.index.preprocess import (
+        load_files, extract_code_files, collect_definitions, resolve_references, attach_references,
+        iter_rows_to_csv, CLASS_FIELDNAMES, METHOD_FIELDNAMES,
+    )
+    from basicmcp.codeqa.index.vector_index import ensure_vector_index
+
+    with timer.stage("load_files", unit="files") as stage:
+        files = load_files(repo)
+        special_files = ingest.get_special_files(repo)
+        stage["items"] = len(files)
+
+    with timer.stage("parse", unit="files") as stage:
+        # Definitions and references come out of the same tree-sitter pass
+        extractions = extract_code_files(files, workers=workers)
+        stage["items"] = len(extractions)
+
+    with timer.stage("resolve_references", unit="files") as stage:
+        class_data, method_data, class_names, method_names = collect_definitions(extractions)
+        references = resolve_references(extractions, class_names, method_names)
+        stage["items"] = len(extractions)
+
+    with timer.stage("map_references") as stage:
+        class_rows = list(attach_references(class_data, references["class"], "class_name"))
+        method_rows = list(attach_references(method_data, references["method"], "name"))
+        stage["items"] = len(class_rows) + len(method_rows)
+
+    with timer.stage("write_csv") as stage:
+        list(iter_rows_to_csv(class_rows, workdir / "class_data.csv", CLASS_FIELDNAMES))
+        list(iter_rows_to_csv(method_rows, workdir / "method_data.csv", METHOD_FIELDNAMES))
+        stage["items"] = len(class_rows) + len(method_rows)
+
+    Method, Class = ingest.get_schemas()
+    with timer.stage("embed") as stage:
+        ingest.get_model()
+        special_rows = list(ingest.special_file_rows(ingest.iter_special_files(special_files)))
+        method_batches = list(ingest.embed_batches(
+            ingest._method_rows(method_rows), Method, "code", "method_embeddings", batch_size))
+        class_batches = list(ingest.embed_batches(
+            ingest.assign_row_ids(class_rows + special_rows, ("file_path", "class_name")),
+            Class, "source_code", "class_embeddings", batch_size))
+        stage["items"] = sum(batch.num_rows for batch in method_batches + class_batches)
+
+    with timer.stage("write_database") as stage:
+        db = lancedb.connect(workdir / "lancedb")
+        method_table = db.create_table("bench_method", schema=Method, mode="overwrite")
+        class_table = db.create_table("bench_class", schema=Class, mode="overwrite")
+        ingest.write_batches(method_table, method_batches, Method.to_arrow_schema())
+        ingest.write_batches(class_table, class_batches, Class.to_arrow_schema())
+        method_table.create_fts_index("code", use_tantivy=False)
+        class_table.create_fts_index("source_code", use_tantivy=False)
+        ensure_vector_index(method_table, "method_embeddings", ingest.get_embedding_dim())
+        ensure_vector_index(class_table, "class_embeddings", ingest.get_embedding_dim())
+        stage["items"] = method_table.count_rows() + class_table.count_rows()
+
+    return len(files), len(class_rows) + len(method_rows)
+
+
+def run_end_to_end(repo, timer, num_files, touch_fraction):
+    from basicmcp.codeqa.index.run_ingestion import run_ingestion
+    from basicmcp.codeqa.index.preprocess import load_files
+
+    with timer.stage("run_ingestion_full", unit="files") as stage:
+        run_ingestion(str(repo), full=True)
+        stage["items"] = num_files
+
+    with timer.stage("run_ingestion_noop", unit="files") as stage:
+        run_ingestion(str(repo))
+        stage["items"] = num_files
+
+    touched = [path for path, _ in load_files(repo)][::max(1, round(1 / touch_fraction))]
+    for path in touched:
+        with open(path, "a") as f:
+            f.write("\n")
+    with timer.stage("run_ingestion_touched", unit="files") as stage:
+        run_ingestion(str(repo))
+        stage["items"] = len(touched)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}):")
+    for name, stage in results["stages"].items():
+        before = baseline["stages"].get(name)
+        if before and before["seconds"]:
+            print(f"{name:<22} {before['seconds']:8.3f}s -> {stage['seconds']:8.3f}s "
+                  f"({stage['seconds'] / before['seconds']:.2f}x)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repo", help="Benchmark an existing codebase instead of a synthetic one")
+    parser.add_argument("--files", type=int, default=500)
+    parser.add_argument("--languages", default=",".join(LANGUAGES))
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--classes-per-file", type=int, default=2)
+    parser.add_argument("--methods-per-class", type=int, default=5)
+    parser.add_argument("--body-lines", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="Parse workers, 0 for one per CPU")
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--backend", default="hash", help="Embedding backend, 'hash' runs offline")
+    parser.add_argument("--cache", action="store_true", help="Use the embedding cache")
+    parser.add_argument("--touch-fraction", type=float, default=0.01,
+                        help="Fraction of files modified before the incremental run")
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument("--output", help="JSON results path, defaults to benchmarks/results/")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="basicmcp-bench-"))
+    offline_environment(workdir, args.backend, args.cache)
+
+    try:
+        if args.repo:
+            repo = Path(args.repo).resolve()
+        else:
+            repo = workdir / "synthetic"
+            generate_repo(repo, files=args.files, languages=args.languages.split(","), depth=args.depth,
+                          classes_per_file=args.classes_per_file, methods_per_class=args.methods_per_class,
+                          body_lines=args.body_lines, seed=args.seed)
+
+        timer = StageTimer()
+        # Before the clock starts, files/s and rows/s cover the stages only
+        import_stages()
+        start = time.perf_counter()
+        num_files, num_rows = run_stages(repo, workdir, timer, args.workers, args.batch_size)
+        staged_seconds = time.perf_counter() - start
+        if not args.skip_end_to_end:
+            if args.repo:
+                # Never modify a real codebase, incremental runs need a copy
+                repo = Path(shutil.copytree(repo, workdir / repo.name))
+            run_end_to_end(repo, timer, num_files, args.touch_fraction)
+
+        rss, children_rss = peak_rss_mb()
+        results = {
+            **run_metadata("ingest", args),
+            "files": num_files,
+            "rows": num_rows,
+            "files_per_sec": round(num_files / staged_seconds, 1),
+            "rows_per_sec": round(num_rows / staged_seconds, 1),
+            "peak_rss_mb": rss,
+            "peak_children_rss_mb": children_rss,
+            "stages": timer.stages,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print(f"\n{num_files} files, {num_rows} rows: {results['files_per_sec']} files/s, "
+          f"{results['rows_per_sec']} rows/s, peak rss {rss} MB")
+    write_results(results, args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
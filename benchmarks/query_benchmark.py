@@ -0,0 +1,189 @@
+"""
+Query latency benchmark for generate_context.
+
+Ingests synthetic codebases of several sizes with the offline "hash" embedding backend, then
+replays a query set through generate_context in vector, FTS and hybrid mode, with reranking on
+and off, before and after building ANN indices. Reports p50/p95/p99 latency in milliseconds in
+total and per stage (setup_database, embed_query, search, rerank, format) and writes JSON.
+
+    python benchmarks/query_benchmark.py --sizes 200,2000 --repeat 5
+    python benchmarks/query_benchmark.py --queries my_queries.txt --rerank off
+"""
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import tempfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+from synthetic_repo import generate_repo, NOUNS, VERBS  # noqa: E402
+from common import offline_environment, percentiles, peak_rss_mb, run_metadata, write_results  # noqa: E402
+
+STAGES = ("setup_database", "embed_query", "search", "rerank", "retrieval", "format")
+# Product quantization needs enough rows to train its codebooks
+MIN_INDEX_ROWS = 256
+
+
+def default_queries(count, seed=0):
+    rng = random.Random(seed)
+    templates = [
+        "How does {Noun}{i} {verb} the {noun}?",
+        "where is {verb}_{noun} called",
+        "{Noun}{i} constructor",
+        "code that validates a {noun} before saving it",
+        "{verb} {noun} {Noun}{i}",
+    ]
+    return [
+        rng.choice(templates).format(Noun=rng.choice(NOUNS), noun=rng.choice(NOUNS).lower(),
+                                     verb=rng.choice(VERBS), i=rng.randrange(100))
+        for _ in range(count)
+    ]
+
+
+def load_reranker():
+    """Load the reranker once, rerank configurations are skipped when it is unavailable"""
+    from basicmcp.codeqa.chat.rerank import get_reranker
+
+    try:
+        get_reranker()
+        return None
+    except Exception as e:
+        return str(e)
+
+
+def run_config(codebase, queries, repeat, warmup, **options):
+    from basicmcp.codeqa.chat.search import generate_context
+
+    for query in queries[:warmup]:
+        generate_context(codebase, query, cache=False, **options)
+
+    totals, stages = [], {name: [] for name in STAGES}
+    for _ in range(repeat):
+        for query in queries:
+            timings = {}
+            start = time.perf_counter()
+            context = generate_context(codebase, query, timings=timings, cache=False, **options)
+            totals.append(time.perf_counter() - start)
+            if context.startswith("Error generating context"):
+                return {"error": context}
+            timings["retrieval"] = timings.get("search", 0.0) - timings.get("rerank", 0.0)
+            for name in STAGES:
+                stages[name].append(timings.get(name, 0.0))
+    return {
+        "queries": len(totals),
+        "total_ms": percentiles(totals),
+        "stages_ms": {name: percentiles(samples) for name, samples in stages.items() if any(samples)},
+    }
+
+
+def build_indices(codebase):
+    """ANN indices on both tables, False if a table is too small to train one"""
+    import lancedb
+    from basicmcp.codeqa.util import get_central_storage_dir
+    from basicmcp.codeqa.index.embeddings import get_embedding_dim
+    from basicmcp.codeqa.index.vector_index import ensure_vector_index
+
+    db = lancedb.connect(get_central_storage_dir() / codebase)
+    tables = [(db.open_table(f"{codebase}_method"), "method_embeddings"),
+              (db.open_table(f"{codebase}_class"), "class_embeddings")]
+    if any(table.count_rows() < MIN_INDEX_ROWS for table, _ in tables):
+        return False
+    for table, column in tables:
+        ensure_vector_index(table, column, get_embedding_dim(), min_rows=0)
+    return True
+
+
+def print_result(label, result):
+    if "error" in result:
+        print(f"{label:<44} error: {result['error'][:80]}")
+        return
+    total = result["total_ms"]
+    breakdown = ", ".join(f"{name} {values['p50']}" for name, values in result["stages_ms"].items())
+    print(f"{label:<44} p50 {total['p50']:>8} p95 {total['p95']:>8} p99 {total['p99']:>8} ms  [{breakdown}]",
+          flush=True)
+
+
+def compare(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} ({baseline.get('commit')}), p50 ms:")
+    for label, result in results["configs"].items():
+        before = baseline.get("configs", {}).get(label)
+        if before and "total_ms" in before and "total_ms" in result:
+            print(f"{label:<44} {before['total_ms']['p50']:>8} -> {result['total_ms']['p50']:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="200,2000", help="Comma separated file counts of the fixture codebases")
+    parser.add_argument("--queries", help="File with one query per line, defaults to generated queries")
+    parser.add_argument("--num-queries", type=int, default=20)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--modes", default="vector,fts,hybrid")
+    parser.add_argument("--rerank", choices=("both", "on", "off"), default="both")
+    parser.add_argument("--skip-indexed", action="store_true", help="Only benchmark unindexed tables")
+    parser.add_argument("--nprobes", type=int)
+    parser.add_argument("--refine-factor", type=int)
+    parser.add_argument("--backend", default="hash", help="Embedding backend, 'hash' runs offline")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="JSON results path, defaults to benchmarks/results/")
+    parser.add_argument("--compare", help="Earlier JSON results to compare against")
+    args = parser.parse_args()
+
+    workdir = Path(tempfile.mkdtemp(prefix="basicmcp-bench-"))
+    offline_environment(workdir, args.backend)
+    from basicmcp.codeqa.index.run_ingestion import run_ingestion
+    from basicmcp.codeqa.index.embeddings import get_model
+
+    if args.queries:
+        queries = [line.strip() for line in Path(args.queries).read_text().splitlines() if line.strip()]
+    else:
+        queries = default_queries(args.num_queries, args.seed)
+    rerank_options = {"both": (False, True), "on": (True,), "off": (False,)}[args.rerank]
+    reranker_error = load_reranker() if True in rerank_options else None
+    if reranker_error:
+        print(f"Reranker unavailable, skipping rerank=True: {reranker_error}")
+        rerank_options = tuple(option for option in rerank_options if not option)
+
+    results = {**run_metadata("query", args), "num_queries": len(queries), "fixtures": {}, "configs": {}}
+    try:
+        # Registers the embedding function the fixture tables are created with
+        get_model()
+        for size in map(int, args.sizes.split(",")):
+            codebase = f"synthetic_{size}"
+            repo = workdir / codebase
+            generate_repo(repo, files=size, seed=args.seed)
+            start = time.perf_counter()
+            run_ingestion(str(repo), full=True)
+            results["fixtures"][codebase] = {"files": size, "ingest_seconds": round(time.perf_counter() - start, 3)}
+
+            index_states = ["unindexed"] if args.skip_indexed else ["unindexed", "indexed"]
+            for index_state in index_states:
+                if index_state == "indexed" and not build_indices(codebase):
+                    print(f"{codebase}: fewer than {MIN_INDEX_ROWS} rows, no indexed run")
+                    continue
+                for mode in args.modes.split(","):
+                    for rerank in rerank_options:
+                        label = f"{codebase}/{index_state}/{mode}/rerank={'on' if rerank else 'off'}"
+                        result = run_config(codebase, queries, args.repeat, args.warmup, rerank=rerank,
+                                            query_type=mode, nprobes=args.nprobes,
+                                            refine_factor=args.refine_factor)
+                        results["configs"][label] = result
+                        print_result(label, result)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    results["peak_rss_mb"], _ = peak_rss_mb()
+    if reranker_error:
+        results["reranker_error"] = reranker_error
+    write_results(results, args.output)
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
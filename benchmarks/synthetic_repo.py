@@ -0,0 +1,176 @@
+"""
+Synthetic codebases for benchmarks.
+
+Generates Python, Java, JavaScript and Rust files with classes, methods, doc comments and
+cross-file references (constructor calls, type uses, method calls), spread over a nested
+directory tree. Output is deterministic for a given seed.
+
+    python benchmarks/synthetic_repo.py /tmp/synthetic --files 500 --languages python,java
+"""
+import argparse
+import random
+from pathlib import Path
+
+LANGUAGES = ("python", "java", "javascript", "rust")
+EXTENSIONS = {"python": ".py", "java": ".java", "javascript": ".js", "rust": ".rs"}
+
+NOUNS = ["Account", "Buffer", "Cache", "Channel", "Config", "Document", "Engine", "Event",
+         "Index", "Ledger", "Matrix", "Node", "Order", "Parser", "Queue", "Record",
+         "Router", "Session", "Stream", "Token", "Vector", "Worker"]
+VERBS = ["apply", "build", "compute", "fetch", "flush", "load", "merge", "parse",
+         "refresh", "render", "resolve", "save", "scan", "split", "update", "validate"]
+
+
+def _camel(name):
+    head, *rest = name.split("_")
+    return head + "".join(part.title() for part in rest)
+
+
+class _Symbols:
+    """Class and method names handed out so far, referenced by later files"""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.classes = []
+
+    def new_class(self, index, methods_per_class):
+        name = f"{self.rng.choice(NOUNS)}{index}"
+        methods = [f"{self.rng.choice(VERBS)}_{self.rng.choice(NOUNS).lower()}"
+                   for _ in range(methods_per_class)]
+        self.classes.append((name, methods))
+        return name, methods
+
+    def pick(self):
+        return self.rng.choice(self.classes)
+
+
+def _body_lines(rng, count, comment):
+    return [f"{comment} step {i}: {rng.choice(VERBS)} the {rng.choice(NOUNS).lower()}" for i in range(count)]
+
+
+def _python_class(name, methods, symbols, rng, body_lines):
+    lines = [f"class {name}:", f'    """{name} keeps track of its {rng.choice(NOUNS).lower()}."""', "",
+             "    def __init__(self, value):", "        self.value = value", ""]
+    for method in methods:
+        other, other_methods = symbols.pick()
+        lines += [f"    def {method}(self, other: {other}):",
+                  f'        """{method.replace("_", " ").capitalize()} using {other}."""',
+                  *("        " + line for line in _body_lines(rng, body_lines, "#")),
+                  f"        helper = {other}(self.value)",
+                  f"        return helper.{rng.choice(other_methods)}(other) + {rng.randint(1, 99)}", ""]
+    return lines
+
+
+def _java_class(name, methods, symbols, rng, body_lines, public):
+    lines = [f"/** {name} keeps track of its {rng.choice(NOUNS).lower()}. */",
+             f"{'public ' if public else ''}class {name} {{", "    private int value;", "",
+             f"    public {name}(int value) {{", "        this.value = value;", "    }", ""]
+    for method in methods:
+        other, other_methods = symbols.pick()
+        lines += [f"    /** {method.replace('_', ' ')} using {other}. */",
+                  f"    public int {_camel(method)}({other} other) {{",
+                  *("        " + line for line in _body_lines(rng, body_lines, "//")),
+                  f"        {other} helper = new {other}(this.value);",
+                  f"        return helper.{_camel(rng.choice(other_methods))}(other) + {rng.randint(1, 99)};",
+                  "    }", ""]
+    return lines + ["}", ""]
+
+
+def _javascript_class(name, methods, symbols, rng, body_lines):
+    lines = [f"/** {name} keeps track of its {rng.choice(NOUNS).lower()}. */",
+             f"class {name} {{", "  constructor(value) {", "    this.value = value;", "  }", ""]
+    for method in methods:
+        other, other_methods = symbols.pick()
+        lines += [f"  /** {method.replace('_', ' ')} using {other}. */",
+                  f"  {_camel(method)}(other) {{",
+                  *("    " + line for line in _body_lines(rng, body_lines, "//")),
+                  f"    const helper = new {other}(this.value);",
+                  f"    return helper.{_camel(rng.choice(other_methods))}(other) + {rng.randint(1, 99)};",
+                  "  }", ""]
+    return lines + ["}", ""]
+
+
+def _rust_struct(name, methods, symbols, rng, body_lines):
+    lines = [f"/// {name} keeps track of its {rng.choice(NOUNS).lower()}.",
+             f"pub struct {name} {{", "    value: i64,", "}", "", f"impl {name} {{"]
+    for method in methods:
+        other, other_methods = symbols.pick()
+        lines += [f"    /// {method.replace('_', ' ')} using {other}.",
+                  f"    pub fn {method}(&self, other: &{other}) -> i64 {{",
+                  *("        " + line for line in _body_lines(rng, body_lines, "//")),
+                  f"        other.{rng.choice(other_methods)}(self.value) + {rng.randint(1, 99)}",
+                  "    }", ""]
+    return lines + ["}", ""]
+
+
+def _file_lines(language, classes, symbols, rng, body_lines):
+    lines = []
+    for i, (name, methods) in enumerate(classes):
+        if language == "python":
+            lines += _python_class(name, methods, symbols, rng, body_lines)
+        elif language == "java":
+            lines += _java_class(name, methods, symbols, rng, body_lines, public=i == 0)
+        elif language == "javascript":
+            lines += _javascript_class(name, methods, symbols, rng, body_lines)
+        else:
+            lines += _rust_struct(name, methods, symbols, rng, body_lines)
+    return lines
+
+
+def generate_repo(root, files=200, languages=LANGUAGES, depth=3, fanout=4, classes_per_file=2,
+                  methods_per_class=5, body_lines=4, markdown_files=5, seed=0):
+    """
+    Write a synthetic codebase under root
+    Args:
+        root: Directory to create, its name becomes the project slug
+        files: Number of source files
+        languages: Languages to cycle through
+        depth: Directory nesting depth of the source files
+        fanout: Subdirectories per directory
+        classes_per_file: Classes (structs for Rust) per file
+        methods_per_class: Methods per class
+        body_lines: Filler lines per method body, controls file size
+        markdown_files: Number of .md files, ingested as special files
+        seed: Random seed
+    Returns:
+        list of the written source file paths
+    """
+    rng = random.Random(seed)
+    root = Path(root)
+    symbols = _Symbols(rng)
+    paths = []
+    class_index = 0
+    for i in range(files):
+        language = languages[i % len(languages)]
+        parts = [f"pkg{(i // fanout ** level) % fanout}" for level in range(depth)]
+        path = root.joinpath(*parts) / f"module_{i}{EXTENSIONS[language]}"
+        classes = []
+        for _ in range(classes_per_file):
+            classes.append(symbols.new_class(class_index, methods_per_class))
+            class_index += 1
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("\n".join(_file_lines(language, classes, symbols, rng, body_lines)))
+        paths.append(path)
+    for i in range(markdown_files):
+        name, methods = symbols.pick()
+        (root / f"NOTES_{i}.md").write_text(
+            f"# Notes {i}\n\n{name} exposes {', '.join(methods)}.\n" + "\n".join(_body_lines(rng, 20, "-"))
+        )
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("root")
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--languages", default=",".join(LANGUAGES))
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--classes-per-file", type=int, default=2)
+    parser.add_argument("--methods-per-class", type=int, default=5)
+    parser.add_argument("--body-lines", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    written = generate_repo(args.root, files=args.files, languages=args.languages.split(","), depth=args.depth,
+                            classes_per_file=args.classes_per_file, methods_per_class=args.methods_per_class,
+                            body_lines=args.body_lines, seed=args.seed)
+    print(f"Wrote {len(written)} files to {args.root}")
@@ -1,8 +1,8 @@
-from basicmcp.mcp_server import mcp
-
-
 def main():
     """Main entry point for the package."""
+    from basicmcp.mcp_server import mcp
+
+    # The server's lifespan starts the warm-up once the transport is up
     mcp.run(transport='stdio')
 
 
@@ -0,0 +1,4 @@
+from dotenv import load_dotenv
+
+# Modules read their BASICMCP_ settings when they are imported, .env has to be loaded before any of them
+load_dotenv()
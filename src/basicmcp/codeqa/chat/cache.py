@@ -0,0 +1,153 @@
+import os
+import re
+import time
+import logging
+import threading
+from collections import OrderedDict
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Contexts kept per process, 0 disables the cache
+QUERY_CACHE_SIZE = int(os.getenv("BASICMCP_QUERY_CACHE_SIZE", "256"))
+# Seconds a cached context stays valid, 0 keeps it until evicted or the tables change
+QUERY_CACHE_TTL = float(os.getenv("BASICMCP_QUERY_CACHE_TTL", "600"))
+# Cosine similarity at which a differently worded query reuses a cached context, 0 disables the semantic tier
+QUERY_CACHE_SIMILARITY = float(os.getenv("BASICMCP_QUERY_CACHE_SIMILARITY", "0"))
+
+
+def normalize_query(query):
+    """Case and whitespace insensitive form of a query"""
+    return re.sub(r"\s+", " ", query).strip().casefold()
+
+
+class QueryCache:
+    """
+    Bounded LRU cache of generated contexts with a TTL. Entries are scoped by codebase, table version
+    and search options, so a new table version never sees contexts of the old one
+    """
+
+    def __init__(self, max_size=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL, similarity=QUERY_CACHE_SIMILARITY):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity = similarity
+        # (scope, normalized query) -> (context, unit query vector or None, expiry)
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_size > 0
+
+    def _drop_stale(self, codebase, version):
+        # A new table version makes every context of the codebase stale
+        if self._versions.get(codebase) != version:
+            stale = [key for key in self._entries if key[0][0] == codebase]
+            for key in stale:
+                del self._entries[key]
+            self._versions[codebase] = version
+
+    def _alive(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[2] is not None and entry[2] < now:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, scope, query):
+        """
+        Exact lookup
+        Args:
+            scope: (codebase, table version, *search options)
+            query: Query text
+        Returns:
+            Cached context or None
+        """
+        if not self.enabled:
+            return None
+        key = (scope, normalize_query(query))
+        with self._lock:
+            self._drop_stale(scope[0], scope[1])
+            entry = self._alive(key, time.monotonic())
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def get_similar(self, scope, vector):
+        """
+        Semantic lookup: the context of the most similar cached query in scope, if its cosine
+        similarity reaches the threshold
+        """
+        if not self.enabled or not self.similarity or vector is None:
+            return None
+        vector = _unit(vector)
+        now = time.monotonic()
+        with self._lock:
+            best_key, best_score = None, self.similarity
+            for key in list(self._entries):
+                if key[0] != scope:
+                    continue
+                entry = self._alive(key, now)
+                if entry is None or entry[1] is None:
+                    continue
+                score = float(np.dot(entry[1], vector))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.semantic_hits += 1
+            logger.debug("Semantic cache hit (%.3f) for %s", best_score, best_key[1])
+            return self._entries[best_key][0]
+
+    def miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def put(self, scope, query, context, vector=None):
+        if not self.enabled:
+            return
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        key = (scope, normalize_query(query))
+        with self._lock:
+            self._drop_stale(scope[0], scope[1])
+            self._entries[key] = (context, None if vector is None else _unit(vector), expiry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._versions.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.hits + self.semantic_hits) / lookups, 3) if lookups else None,
+            }
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+QUERY_CACHE = QueryCache()
@@ -0,0 +1,95 @@
+import os
+import logging
+from basicmcp.codeqa.index.tokens import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+# Approximate token budget of a codeqa answer
+CONTEXT_TOKENS = int(os.getenv("BASICMCP_CONTEXT_TOKENS", "6000"))
+# Lines a signature may span, e.g. a def with one parameter per line
+SIGNATURE_LINES = 6
+# Separator of method_declarations in the class table
+DECLARATION_SEPARATOR = "\n-----\n"
+SECTION_SEPARATOR = "\n below is class or constructor related code \n"
+
+
+def signature(code):
+    """Header of a class or function: its lines up to the one that opens the body"""
+    lines = code.strip().splitlines()[:SIGNATURE_LINES]
+    for i, line in enumerate(lines):
+        stripped = line.rstrip()
+        if stripped.endswith(":") or "{" in stripped:
+            return "\n".join(lines[:i + 1])
+    return "\n".join(lines)
+
+
+def relevance(row):
+    """Higher is better: rerank/RRF score, else negated vector distance, else FTS score"""
+    for column, sign in (("_relevance_score", 1), ("_distance", -1), ("_score", 1)):
+        if row.get(column) is not None:
+            return sign * row[column]
+    return 0.0
+
+
+def method_snippets(row):
+    """Full and compact rendering of a method row"""
+    full = f"File: {row['file_path']}\nCode:\n{row['source_code']}"
+    compact = f"File: {row['file_path']}\nCode (body elided):\n{signature(row['source_code'])}\n    ..."
+    return full, compact
+
+
+def class_snippets(row):
+    """Full and compact (signatures only) rendering of a class row"""
+    full = f"File: {row['file_path']}\nClass Info:\n{row['source_code']} References: \n{row.get('references', '')}"
+    declarations = [d for d in (row.get("method_declarations") or "").split(DECLARATION_SEPARATOR) if d.strip()]
+    signatures = "\n".join(signature(declaration) for declaration in declarations)
+    compact = f"File: {row['file_path']}\nClass Info (signatures only):\n{signature(row['source_code'])}\n{signatures}"
+    return full, compact
+
+
+def assemble_context(method_rows, class_rows, max_tokens=CONTEXT_TOKENS):
+    """
+    Fill a token budget with the best results of both tables. Candidates are taken greedily by
+    score, in full while they fit and as signatures once the budget gets tight. Methods of a class
+    that is included in full are left out
+    Args:
+        method_rows: Method table rows (dicts) in retrieval order
+        class_rows: Class table rows (dicts) in retrieval order
+        max_tokens: Approximate token budget
+    Returns:
+        str: Methods, then the class section
+    """
+    candidates = [("method", rank, row) for rank, row in enumerate(method_rows)]
+    candidates += [("class", rank, row) for rank, row in enumerate(class_rows)]
+    candidates.sort(key=lambda candidate: (-relevance(candidate[2]), candidate[1]))
+
+    remaining = max_tokens
+    chosen = []  # (kind, rank, row, text, tokens)
+    full_classes = set()
+    for kind, rank, row in candidates:
+        owner = (row["file_path"], row.get("class_name"))
+        if kind == "method" and owner in full_classes:
+            continue
+        full, compact = (method_snippets if kind == "method" else class_snippets)(row)
+        for text, is_full in ((full, True), (compact, False)):
+            tokens = estimate_tokens(text)
+            if tokens <= remaining:
+                break
+        else:
+            continue
+        if kind == "class" and is_full:
+            full_classes.add(owner)
+            # Methods already taken from this class are part of its body
+            for item in [item for item in chosen if item[0] == "method"
+                         and (item[2]["file_path"], item[2].get("class_name")) == owner]:
+                chosen.remove(item)
+                remaining += item[4]
+        chosen.append((kind, rank, row, text, tokens))
+        remaining -= tokens
+
+    logger.debug("Context uses %d of %d tokens with %d snippets", max_tokens - remaining, max_tokens, len(chosen))
+    methods = [item for item in chosen if item[0] == "method"]
+    classes = [item for item in chosen if item[0] == "class"]
+    methods_combined = "\n\n".join(text for _, _, _, text, _ in methods)
+    classes_combined = "\n\n".join(f"{text}  \n END OF ROW {i}" for i, (_, _, _, text, _) in enumerate(classes))
+    return methods_combined + SECTION_SEPARATOR + classes_combined
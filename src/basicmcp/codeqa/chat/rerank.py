@@ -0,0 +1,162 @@
+import os
+import time
+import logging
+import threading
+import pyarrow as pa
+from lancedb.rerankers import Reranker, RRFReranker
+from basicmcp.codeqa.index.tokens import WordClipper, clip_texts
+
+logger = logging.getLogger(__name__)
+
+# "colbert" (answerdotai's small ColBERT) or "flashrank" (quantized ONNX cross-encoders, CPU friendly),
+# any other rerankers model type works with BASICMCP_RERANK_MODEL set
+RERANK_BACKEND = os.getenv("BASICMCP_RERANKER", "colbert")
+RERANK_MODELS = {
+    "colbert": "answerdotai/answerai-colbert-small-v1",
+    "flashrank": "ms-marco-MiniLM-L-12-v2",
+}
+RERANK_MODEL = os.getenv("BASICMCP_RERANK_MODEL") or RERANK_MODELS.get(RERANK_BACKEND)
+# Candidates per retriever handed to the reranker, the fused list is cut to this many as well
+RERANK_DEPTH = int(os.getenv("BASICMCP_RERANK_DEPTH", "10"))
+# Candidates scored per model call
+RERANK_BATCH_SIZE = int(os.getenv("BASICMCP_RERANK_BATCH_SIZE", "16"))
+# Candidate text is clipped to about this many tokens before scoring
+RERANK_MAX_LENGTH = int(os.getenv("BASICMCP_RERANK_MAX_LENGTH", "512"))
+# Milliseconds a rerank may take, 0 for no limit. Over budget the fused RRF ordering is kept
+RERANK_BUDGET_MS = float(os.getenv("BASICMCP_RERANK_BUDGET_MS", "0"))
+# Queries predicted over budget between two re-measurements on a single batch
+RERANK_PROBE_EVERY = int(os.getenv("BASICMCP_RERANK_PROBE_EVERY", "10"))
+# Load the reranker at server start instead of on the first reranked query
+RERANK_WARM_UP = os.getenv("BASICMCP_RERANK_WARM_UP", "1") != "0"
+
+
+class BudgetedReranker(Reranker):
+    """
+    Scores the top candidates with a rerankers model in batches. Candidates keep their retrieval
+    order (RRF for hybrid search) when the model is predicted to exceed the latency budget, or does.
+    While predicted over budget, every probe_every-th query scores one batch to re-measure the model
+    """
+
+    def __init__(self, ranker, column="source_code", depth=RERANK_DEPTH, batch_size=RERANK_BATCH_SIZE,
+                 max_length=RERANK_MAX_LENGTH, budget_ms=RERANK_BUDGET_MS, probe_every=RERANK_PROBE_EVERY):
+        """
+        Args:
+            ranker: Object with rank(query, docs, doc_ids), e.g. rerankers.Reranker
+            column: Column with the candidate text
+            depth: Candidates scored per query
+            batch_size: Candidates per rank() call
+            max_length: Approximate token limit of a candidate
+            budget_ms: Latency budget per rerank, 0 for none
+            probe_every: Skipped queries between re-measurements while over budget
+        """
+        super().__init__("relevance")
+        self.ranker = ranker
+        self.column = column
+        self.depth = depth
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self.budget_ms = budget_ms
+        self.probe_every = max(1, probe_every)
+        self.fused = RRFReranker()
+        # Moving average of the seconds spent per candidate, predicts whether a rerank fits the budget
+        self.seconds_per_doc = None
+        self.fallbacks = 0
+        self.skipped = 0
+        self._lock = threading.Lock()
+
+    def _scores(self, query, docs):
+        """Model scores of docs, None when the budget runs out"""
+        budget = self.budget_ms / 1000
+        probe = False
+        if budget and self.seconds_per_doc is not None and len(docs) * self.seconds_per_doc > budget:
+            with self._lock:
+                self.skipped += 1
+                probe = self.skipped % self.probe_every == 0
+            if not probe:
+                return None
+        docs = clip_texts(docs, self.max_length, WordClipper())
+        start = time.perf_counter()
+        scores = []
+        for offset in range(0, len(docs), self.batch_size):
+            if budget and time.perf_counter() - start > budget:
+                return None
+            if probe and offset and len(docs) * self.seconds_per_doc > budget:
+                # The probe batch confirmed the model is still too slow
+                return None
+            batch = docs[offset:offset + self.batch_size]
+            batch_start = time.perf_counter()
+            result = self.ranker.rank(query, batch, doc_ids=list(range(len(batch))))
+            scores += [result.get_result_by_docid(i).score for i in range(len(batch))]
+            # A probe replaces the estimate, one slow call (e.g. the cold start) must not outweigh it
+            self._observe((time.perf_counter() - batch_start) / len(batch), reset=probe and not offset)
+        if budget and time.perf_counter() - start > budget:
+            # Too late for this query, the candidates keep the retrieval order
+            return None
+        return scores
+
+    def _observe(self, seconds, reset=False):
+        with self._lock:
+            if self.seconds_per_doc is None or reset:
+                self.seconds_per_doc = seconds
+            else:
+                self.seconds_per_doc = 0.8 * self.seconds_per_doc + 0.2 * seconds
+
+    def _rerank(self, query, results):
+        """
+        Args:
+            results: Candidates in retrieval order, with a _relevance_score column
+        """
+        results = results.slice(0, self.depth)
+        if len(results) == 0:
+            return results
+        scores = self._scores(query, results[self.column].to_pylist())
+        if scores is None:
+            with self._lock:
+                self.fallbacks += 1
+            logger.info("Rerank over the %.0f ms budget, keeping the retrieval order", self.budget_ms)
+            return results
+        score_i = results.column_names.index("_relevance_score")
+        results = results.set_column(score_i, "_relevance_score", pa.array(scores, type=pa.float32()))
+        return results.sort_by([("_relevance_score", "descending")])
+
+    def rerank_hybrid(self, query, vector_results, fts_results):
+        return self._rerank(query, self.fused.rerank_hybrid(query, vector_results, fts_results))
+
+    def rerank_vector(self, query, vector_results):
+        return self._rerank(query, _with_rank_score(vector_results.drop_columns(["_distance"])))
+
+    def rerank_fts(self, query, fts_results):
+        return self._rerank(query, _with_rank_score(fts_results.drop_columns(["_score"])))
+
+
+def _with_rank_score(results):
+    # Retrieval rank as the fallback relevance score
+    return results.append_column(
+        "_relevance_score", pa.array([1 / (rank + 1) for rank in range(len(results))], type=pa.float32())
+    )
+
+
+_RERANKER = None
+_RERANKER_LOCK = threading.Lock()
+
+
+def get_reranker():
+    """The process-wide reranker, loaded on first use"""
+    global _RERANKER
+    with _RERANKER_LOCK:
+        if _RERANKER is None:
+            from rerankers import Reranker as Ranker
+            logger.info("Loading %s reranker %s", RERANK_BACKEND, RERANK_MODEL)
+            ranker = Ranker(model_name=RERANK_MODEL, model_type=RERANK_BACKEND, verbose=0)
+            _RERANKER = BudgetedReranker(ranker)
+        return _RERANKER
+
+
+def warm_up():
+    """Load the reranker and run it once so the first query does not pay for it"""
+    if not RERANK_WARM_UP:
+        return
+    try:
+        get_reranker().ranker.rank("warm up", ["def warm_up(): pass"], doc_ids=[0])
+    except Exception as e:
+        logger.warning("Reranker warm-up failed: %s", str(e))
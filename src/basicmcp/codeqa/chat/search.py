@@ -1,35 +1,37 @@
-from dotenv import load_dotenv
-load_dotenv()
 import os
 import re
-import lancedb
+import time
 import logging
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from openai import OpenAI
-from lancedb.rerankers import AnswerdotaiRerankers
+from lancedb.rerankers import RRFReranker, Reranker
 from .prompt import HYDE_SYSTEM_PROMPT, HYDE_V2_SYSTEM_PROMPT, CHAT_SYSTEM_PROMPT
-from basicmcp.codeqa.index.ingest import get_name_and_input_dir
-from basicmcp.codeqa.util import get_project_slug, get_central_storage_dir
+from basicmcp.codeqa.index.handles import get_table
+from basicmcp.codeqa.index.manifest import read_build_id
+from basicmcp.codeqa.chat.cache import QUERY_CACHE
+from basicmcp.codeqa.chat.rerank import RERANK_DEPTH, get_reranker
+from basicmcp.codeqa.chat.context import CONTEXT_TOKENS, assemble_context
+from basicmcp.codeqa.index.vector_index import tune_search
+from basicmcp.codeqa.util import get_project_slug, get_central_storage_dir, sql_string, SPECIAL_ROWS
 
 # Database setup
 def setup_database(codebase_path):
-    codebase_folder_name, output_path = get_name_and_input_dir(codebase_path)
-    
-    db = lancedb.connect(output_path)
+    """Method and class tables of an ingested codebase, from the process-wide handle cache"""
+    codebase_folder_name = get_project_slug(codebase_path)
+    output_path = get_central_storage_dir() / codebase_folder_name
+
     tables = [ codebase_folder_name + "_method", codebase_folder_name + "_class"]
-    if not all(table in db.table_names() for table in tables):
+    try:
+        method_table, class_table = (get_table(output_path, table) for table in tables)
+    except ValueError:
         raise ValueError(f"Tables {tables} not found in the database. Please index the codebase first")
 
-    method_table = db.open_table(codebase_folder_name + "_method")
-    class_table = db.open_table(codebase_folder_name + "_class")
-
     return method_table, class_table
 
 # OpenAI client setup
 OAI_CLIENT = None
 
-# reranker
-RERANKER = None
-
 def check_and_init_openai():
     if os.environ.get('OPENAI_API_KEY'):
         global OAI_CLIENT
@@ -96,14 +98,184 @@ def process_input(input_text):
     
     return processed_text
 
-def generate_context(codebase_path, query, rerank=True):
+QUERY_TYPES = ("vector", "fts", "hybrid")
+
+# Candidates of each table the context is assembled from
+CONTEXT_ROWS = int(os.getenv("BASICMCP_CONTEXT_ROWS", "3"))
+# Columns the context is built from, source_code is also what the reranker scores
+# (in the method table it holds the same text as code)
+METHOD_COLUMNS = ["file_path", "class_name", "source_code"]
+CLASS_COLUMNS = ["file_path", "class_name", "source_code", "method_declarations", "references"]
+
+# Runs the method and class searches of a query concurrently
+SEARCH_EXECUTOR = None
+
+
+def search_executor():
+    global SEARCH_EXECUTOR
+    if SEARCH_EXECUTOR is None:
+        # Two legs per query, room for a few concurrent codeqa calls
+        SEARCH_EXECUTOR = ThreadPoolExecutor(max_workers=8, thread_name_prefix="search")
+    return SEARCH_EXECUTOR
+
+
+@contextmanager
+def stage(timings, name):
+    """Add the wall time of the block to timings[name], a no-op when timings is None"""
+    if timings is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class TimedReranker(Reranker):
+    """Delegates to a reranker and records the time spent in it as the "rerank" stage"""
+
+    def __init__(self, reranker, timings):
+        super().__init__(reranker.score)
+        self.reranker = reranker
+        self.timings = timings
+
+    def rerank_hybrid(self, query, vector_results, fts_results):
+        with stage(self.timings, "rerank"):
+            return self.reranker.rerank_hybrid(query, vector_results, fts_results)
+
+    def rerank_vector(self, query, vector_results):
+        with stage(self.timings, "rerank"):
+            return self.reranker.rerank_vector(query, vector_results)
+
+    def rerank_fts(self, query, fts_results):
+        with stage(self.timings, "rerank"):
+            return self.reranker.rerank_fts(query, fts_results)
+
+
+def embedding_config(table):
+    """Embedding function config of a table: .function and .vector_column"""
+    return next(iter(table.embedding_functions.values()))
+
+
+def embed_query(tables, query):
+    """
+    Embed query once for several tables. Tables share a vector unless they were created with
+    different embedding functions
+    Returns:
+        list of (vector, vector column name) per table
+    """
+    vectors = []
+    for table in tables:
+        config = embedding_config(table)
+        vector = next((v for function, v, _ in vectors if function == config.function), None)
+        if vector is None:
+            vector = config.function.compute_query_embeddings(query)[0]
+        vectors.append((config.function, vector, config.vector_column))
+    return [(vector, column) for _, vector, column in vectors]
+
+
+def build_search(table, query, vector, vector_column, query_type="hybrid", nprobes=None, refine_factor=None,
+                 columns=None):
+    """
+    Args:
+        columns: Columns to return, all of them (including the vectors) when None
+    """
+    # The score a result is ranked by is selected explicitly, hybrid search adds its own
+    if query_type == "fts":
+        builder = table.search(query, query_type="fts")
+        score_columns = ["_score"]
+    elif query_type == "vector":
+        builder = tune_search(table.search(vector, vector_column_name=vector_column), nprobes, refine_factor)
+        score_columns = ["_distance"]
+    else:
+        builder = table.search(query_type="hybrid", vector_column_name=vector_column).vector(vector).text(query)
+        builder = tune_search(builder, nprobes, refine_factor)
+        score_columns = []
+    return builder if columns is None else builder.select(columns + score_columns)
+
+
+# A bare identifier or Class.method, optionally quoted or followed by ()
+SYMBOL_QUERY = re.compile(r"^[`'\"]?([A-Za-z_]\w*)(?:\.([A-Za-z_]\w*))?(?:\(\))?[`'\"]?$")
+# Answer identifier queries with an exact lookup before trying semantic search
+ROUTE_SYMBOLS = os.getenv("BASICMCP_ROUTE_SYMBOLS", "1") != "0"
+# Rows per table an exact lookup returns, before the token budget applies
+SYMBOL_ROWS = 10
+
+
+def is_identifier_shaped(query, name):
+    """Code-looking tokens: quoted in backticks, dotted, called, snake_case or CamelCase, not plain words"""
+    return (query.startswith("`") or "." in query or "(" in query or "_" in name.strip("_")
+            or name != name.lower())
+
+
+def parse_symbol_query(query):
+    """
+    Returns:
+        tuple: (class name or None, name) for identifier-shaped queries, else None
+    """
+    query = query.strip()
+    match = SYMBOL_QUERY.match(query)
+    if match is None:
+        return None
+    first, second = match.groups()
+    if second:
+        return first, second
+    return (None, first) if is_identifier_shaped(query, first) else None
+
+
+def lookup_symbol_rows(method_table, class_table, class_name, name):
+    """
+    Method and class rows defining the symbol, found through the scalar indices on name and class_name
+    Returns:
+        tuple: (method rows, class rows) as lists of dicts
+    """
+    def _query(table, where, columns):
+        return table.search().where(where).select(columns).limit(SYMBOL_ROWS).to_arrow().to_pylist()
+
+    if class_name is not None:
+        where = f"name = {sql_string(name)} AND class_name = {sql_string(class_name)}"
+        return _query(method_table, where, METHOD_COLUMNS), []
+    return (
+        _query(method_table, f"name = {sql_string(name)}", METHOD_COLUMNS),
+        # Markdown/shell rows have the class name "empty"
+        _query(class_table, f"class_name = {sql_string(name)} AND NOT ({SPECIAL_ROWS})", CLASS_COLUMNS),
+    )
+
+
+def table_version(codebase_path, method_table, class_table):
+    """Changes whenever an ingestion rewrites the tables of the codebase"""
+    artifacts_dir = get_central_storage_dir() / get_project_slug(codebase_path)
+    return read_build_id(artifacts_dir), method_table.version, class_table.version
+
+
+def generate_context(codebase_path, query, rerank=True, nprobes=None, refine_factor=None,
+                     query_type="hybrid", timings=None, cache=True, max_tokens=None, on_chunk=None,
+                     route_symbols=ROUTE_SYMBOLS):
+    """
+    Search the method and class tables and format the results as context for the query
+    Args:
+        nprobes: IVF partitions probed when the tables have an ANN index
+        refine_factor: Re-rank refine_factor * limit ANN candidates with the full vectors
+        query_type: One of QUERY_TYPES
+        timings: Optional dict that receives the seconds spent per stage: setup_database,
+            embed_query, search (both tables, including rerank), rerank (slower table) and format.
+            cache_hit is set to "exact" or "semantic" when the context came from the query cache
+        cache: Look up and store the context in QUERY_CACHE
+        max_tokens: Approximate token budget of the context, defaults to BASICMCP_CONTEXT_TOKENS
+        on_chunk: Called with a preview of the results of each table as soon as its search finishes
+        route_symbols: Answer identifier and Class.method queries from an exact name lookup when it
+            finds a definition, timings then has route set to "symbol"
+    """
     try:
+        if query_type not in QUERY_TYPES:
+            raise ValueError(f"Unknown query type {query_type}, expected one of {QUERY_TYPES}")
         check_and_init_openai()
-        method_table, class_table = setup_database(codebase_path)
+        max_tokens = max_tokens or CONTEXT_TOKENS
+        with stage(timings, "setup_database"):
+            method_table, class_table = setup_database(codebase_path)
         #hyde_query = openai_hyde(query) if OAI_CLIENT is not None else query
         hyde_query = query
-        method_docs = method_table.search(hyde_query, query_type="hybrid")
-        class_docs = class_table.search(hyde_query, query_type="hybrid")
 
         #temp_context = '\n'.join(method_docs['code'].tolist() + class_docs['source_code'].tolist())
         #if OAI_CLIENT:
@@ -114,28 +286,88 @@ def generate_context(codebase_path, query, rerank=True):
         #    method_search = method_table.search(hyde_query_v2)
         #    class_search = class_table.search(hyde_query_v2)
 
+        symbol = parse_symbol_query(hyde_query) if route_symbols else None
+        if symbol is not None:
+            with stage(timings, "symbol_lookup"):
+                method_rows, class_rows = lookup_symbol_rows(method_table, class_table, *symbol)
+            if method_rows or class_rows:
+                if timings is not None:
+                    timings["route"] = "symbol"
+                with stage(timings, "format"):
+                    return assemble_context(method_rows, class_rows, max_tokens)
+
+        scope = None
+        if cache and QUERY_CACHE.enabled:
+            scope = (get_project_slug(codebase_path), table_version(codebase_path, method_table, class_table),
+                     rerank, query_type, nprobes, refine_factor, max_tokens)
+            context = QUERY_CACHE.get(scope, hyde_query)
+            if context is not None:
+                if timings is not None:
+                    timings["cache_hit"] = "exact"
+                return context
+
+        tables = ((method_table, METHOD_COLUMNS), (class_table, CLASS_COLUMNS))
+        searches = [(table, columns, None, None) for table, columns in tables]
+        if query_type != "fts":
+            with stage(timings, "embed_query"):
+                vectors = embed_query((method_table, class_table), hyde_query)
+            searches = [(table, columns, vector, vector_column)
+                        for (table, columns), (vector, vector_column) in zip(tables, vectors)]
+
+        query_vector = searches[0][2]
+        if scope is not None:
+            context = QUERY_CACHE.get_similar(scope, query_vector)
+            if context is not None:
+                if timings is not None:
+                    timings["cache_hit"] = "semantic"
+                return context
+            QUERY_CACHE.miss()
+
+        reranker = None
         if rerank:
-            global RERANKER
-            if RERANKER is None:
-                RERANKER = AnswerdotaiRerankers(column="source_code")
-            method_docs = method_docs.rerank(RERANKER)
-            class_docs = class_docs.rerank(RERANKER)
+            reranker = get_reranker()
+        elif query_type == "hybrid" and timings is not None:
+            # lancedb's default for hybrid search, made explicit so its time is recorded
+            reranker = RRFReranker()
 
-        method_docs = method_docs.limit(5).to_pandas()
-        class_docs = class_docs.limit(5).to_pandas()
+        def retrieve(table, columns, vector, vector_column):
+            leg_timings = None if timings is None else {}
+            docs = build_search(table, hyde_query, vector, vector_column, query_type, nprobes, refine_factor,
+                                columns=columns)
+            if reranker is not None:
+                leg_reranker = reranker if leg_timings is None else TimedReranker(reranker, leg_timings)
+                if query_type == "vector":
+                    # A query vector carries no text, the reranker needs it spelled out
+                    docs = docs.rerank(leg_reranker, query_string=hyde_query)
+                else:
+                    docs = docs.rerank(leg_reranker)
+            # Give the reranker RERANK_DEPTH candidates per retriever to choose from
+            limit = max(CONTEXT_ROWS, RERANK_DEPTH) if rerank else CONTEXT_ROWS
+            return docs.limit(limit).to_arrow().slice(0, CONTEXT_ROWS), leg_timings
 
-        top_3_methods = method_docs.to_dict('records')[:3]
-        methods_combined = "\n\n".join(f"File: {doc['file_path']}\nCode:\n{doc['code']}" 
-                                     for doc in top_3_methods)
+        # Method and class retrieval (each with its rerank) run side by side
+        rows = [[], []]
+        with stage(timings, "search"):
+            futures = {search_executor().submit(retrieve, *args): leg for leg, args in enumerate(searches)}
+            for done, future in enumerate(as_completed(futures), 1):
+                docs, leg_timings = future.result()
+                leg = futures[future]
+                rows[leg] = docs.to_pylist()
+                if timings is not None:
+                    # The legs overlap, so a stage costs as much as its slower leg
+                    for name, seconds in leg_timings.items():
+                        timings[name] = max(timings.get(name, 0.0), seconds)
+                if on_chunk is not None and done < len(futures):
+                    # The final context follows once the other table is searched too
+                    on_chunk(assemble_context(rows[0], rows[1], max_tokens))
 
-        top_3_classes = class_docs.to_dict('records')[:3]
-        classes_combined = "\n\n".join(f"File: {doc['file_path']}\nClass Info:\n{doc['source_code']} "
-                                     f"References: \n{doc.get('references', '')}  \n END OF ROW {i}" 
-                                     for i, doc in enumerate(top_3_classes))
+        with stage(timings, "format"):
+            context = assemble_context(rows[0], rows[1], max_tokens)
 
-        return methods_combined + "\n below is class or constructor related code \n" + classes_combined
+        if scope is not None:
+            QUERY_CACHE.put(scope, hyde_query, context, query_vector)
+        return context
 
     except Exception as e:
         logging.error("Error in generate_context: %s", str(e))
         return f"Error generating context: {str(e)}"
-
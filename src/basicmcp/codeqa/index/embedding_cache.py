@@ -0,0 +1,173 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from pathlib import Path
+import pyarrow as pa
+import lancedb
+from basicmcp.codeqa.util import in_filter
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = Path.home() / ".basicmcp" / "embedding_cache"
+CACHE_TABLE = "embeddings"
+# Set BASICMCP_EMBEDDING_CACHE=0 to always call the embedding model
+CACHE_ENABLED = os.getenv("BASICMCP_EMBEDDING_CACHE", "1") != "0"
+CACHE_MAX_ENTRIES = int(os.getenv("BASICMCP_EMBEDDING_CACHE_SIZE", "2000000"))
+# Keys per update/delete filter when touching or evicting entries
+CACHE_WRITE_CHUNK = 10000
+
+CACHE_SCHEMA = pa.schema([
+    pa.field("key", pa.string(), nullable=False),
+    pa.field("model_name", pa.string()),
+    pa.field("vector", pa.list_(pa.float32())),
+    pa.field("last_used", pa.int64()),
+])
+
+
+class EmbeddingCache:
+    """
+    Content-addressed store of embeddings shared by every ingestion and codebase.
+    Entries are keyed by (model name, dims, sha256 of the embedded text) and evicted
+    least-recently-used first once the table grows past max_entries. Hits are only noted in
+    memory, flush() writes their last_used once per ingestion
+    """
+
+    def __init__(self, model_name, dims, uri=None, max_entries=None):
+        self.model_name = model_name
+        self.dims = dims
+        self.max_entries = CACHE_MAX_ENTRIES if max_entries is None else max_entries
+        self.hits = 0
+        self.misses = 0
+        self._touched = set()
+        # Concurrent ingestions share the instance, its writes go one at a time
+        self._lock = threading.Lock()
+
+        uri = Path(uri or CACHE_DIR)
+        uri.mkdir(parents=True, exist_ok=True)
+        db = lancedb.connect(uri)
+        if CACHE_TABLE in db.table_names():
+            self._table = db.open_table(CACHE_TABLE)
+        else:
+            self._table = db.create_table(CACHE_TABLE, schema=CACHE_SCHEMA, exist_ok=True)
+
+    def key(self, text):
+        digest = hashlib.sha256(text.encode("utf-8", "surrogatepass")).hexdigest()
+        return f"{self.model_name}:{self.dims}:{digest}"
+
+    def get_many(self, keys):
+        """Return a key -> vector dict for the keys present in the cache"""
+        unique_keys = sorted(set(keys))
+        if not unique_keys:
+            return {}
+        found = (
+            self._table.search()
+            .where(in_filter("key", unique_keys))
+            .select(["key", "vector"])
+            .limit(len(unique_keys))
+            .to_arrow()
+        )
+        vectors = dict(zip(found["key"].to_pylist(), found["vector"].to_pylist()))
+        with self._lock:
+            self._touched.update(vectors)
+        return vectors
+
+    def put_many(self, keys, vectors):
+        if not keys:
+            return
+        now = time.time_ns()
+        data = pa.table({
+            "key": pa.array(keys, pa.string()),
+            "model_name": pa.array([self.model_name] * len(keys), pa.string()),
+            "vector": pa.array([list(map(float, vector)) for vector in vectors], pa.list_(pa.float32())),
+            "last_used": pa.array([now] * len(keys), pa.int64()),
+        }, schema=CACHE_SCHEMA)
+        with self._lock:
+            (
+                self._table.merge_insert("key")
+                .when_matched_update_all()
+                .when_not_matched_insert_all()
+                .execute(data)
+            )
+
+    def embed(self, texts, compute):
+        """
+        Embed texts, only calling compute for the ones missing from the cache
+        Args:
+            texts: List of texts
+            compute: Embedding function taking a list of texts, e.g. compute_source_embeddings_with_retry
+        Returns:
+            list of vectors aligned with texts, None where compute failed
+        """
+        keys = [self.key(text) for text in texts]
+        cached = self.get_many(keys)
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in cached and key not in missing:
+                missing[key] = i
+        with self._lock:
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+
+        if missing:
+            computed = compute([texts[i] for i in missing.values()])
+            new_keys, new_vectors = [], []
+            for key, vector in zip(missing, computed):
+                if vector is not None and len(vector) == self.dims:
+                    cached[key] = vector
+                    new_keys.append(key)
+                    new_vectors.append(vector)
+            self.put_many(new_keys, new_vectors)
+
+        return [cached.get(key) for key in keys]
+
+    def flush(self):
+        """Write the last_used time of the entries hit since the previous flush"""
+        with self._lock:
+            touched, self._touched = sorted(self._touched), set()
+            now = time.time_ns()
+            for offset in range(0, len(touched), CACHE_WRITE_CHUNK):
+                self._table.update(where=in_filter("key", touched[offset:offset + CACHE_WRITE_CHUNK]),
+                                   values={"last_used": now})
+
+    def counts(self):
+        """(hits, misses) since the cache was opened, ingestions log the difference over their run"""
+        with self._lock:
+            return self.hits, self.misses
+
+    def evict(self):
+        """Drop the least recently used entries above max_entries and compact the table when any were"""
+        with self._lock:
+            overflow = self._table.count_rows() - self.max_entries
+            if overflow > 0:
+                entries = self._table.search().select(["key", "last_used"]).limit(None).to_arrow()
+                # Entries written by one batch share a timestamp, the key breaks the tie
+                oldest = entries.sort_by([("last_used", "ascending"), ("key", "ascending")])["key"]
+                oldest = oldest.slice(0, overflow).to_pylist()
+                for offset in range(0, len(oldest), CACHE_WRITE_CHUNK):
+                    self._table.delete(in_filter("key", oldest[offset:offset + CACHE_WRITE_CHUNK]))
+                logger.info("Evicted %d embedding cache entries", len(oldest))
+            if self._table.count_rows() and not any(
+                index.columns == ["key"] for index in self._table.list_indices()
+            ):
+                self._table.create_scalar_index("key", index_type="BTREE")
+            if overflow > 0:
+                self._table.optimize()
+
+
+_CACHES = {}
+_CACHES_LOCK = threading.Lock()
+
+
+def get_embedding_cache(model_name, dims):
+    """Process-wide cache instance for a model, None when caching is disabled"""
+    if not CACHE_ENABLED:
+        return None
+    with _CACHES_LOCK:
+        cache = _CACHES.get((model_name, dims))
+        if cache is None:
+            cache = EmbeddingCache(model_name, dims)
+            _CACHES[(model_name, dims)] = cache
+    return cache
@@ -0,0 +1,181 @@
+import os
+import logging
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# name -> backend config. The model itself is only created on first use, so importing
+# this module (and the MCP server) never loads torch or talks to an embedding API
+BACKENDS = {}
+
+
+def register_backend(name, model_name, create, max_tokens=8000, dims=None, tokenizer="cl100k_base"):
+    """
+    Register an embedding backend
+    Args:
+        name: Backend name
+        model_name: Name of the embedding model, recorded in manifests and the embedding cache
+        create: Function taking the lancedb embedding registry and returning the embedding function
+        max_tokens: Token limit texts are clipped to before embedding, or a function taking the
+            created model and returning it
+        dims: Embedding dimension if known up front, otherwise taken from the created model
+        tokenizer: tiktoken encoding name used for clipping, or a function taking the created
+            model and returning its Hugging Face fast tokenizer or a clipper
+    """
+    BACKENDS[name] = {
+        "model_name": model_name,
+        "create": create,
+        "max_tokens": max_tokens,
+        "dims": dims,
+        "tokenizer": tokenizer,
+    }
+
+
+register_backend(
+    "jina",
+    "jina-embeddings-v3",
+    lambda registry: registry.get("jina").create(name="jina-embeddings-v3", max_retries=2),
+    max_tokens=4000,  # Jina uses a different tokenizer, counted conservatively with cl100k_base
+    dims=1024,  # Jina's dimension
+)
+register_backend(
+    "openai",
+    "text-embedding-3-large",
+    lambda registry: registry.get("openai").create(
+        name="text-embedding-3-large", max_retries=2, api_key=os.environ.get("OPENAI_API_KEY")
+    ),
+    max_tokens=8000,
+)
+def _sentence_transformers_max_tokens(model):
+    # Longer inputs are truncated inside the model, the special tokens it adds count against the limit
+    embedding_model = model.embedding_model
+    return embedding_model.max_seq_length - embedding_model.tokenizer.num_special_tokens_to_add()
+
+
+register_backend(
+    "sentence-transformers",
+    "BAAI/bge-small-en-v1.5",
+    lambda registry: registry.get("sentence-transformers").create(name="BAAI/bge-small-en-v1.5"),
+    max_tokens=_sentence_transformers_max_tokens,
+    tokenizer=lambda model: model.embedding_model.tokenizer,
+)
+
+
+def _create_hash_embeddings(registry):
+    import basicmcp.codeqa.index.hash_embedding  # noqa: F401, registers "basicmcp-hash"
+
+    return registry.get("basicmcp-hash").create()
+
+
+def _word_clipper(model):
+    from basicmcp.codeqa.index.tokens import WordClipper
+
+    return WordClipper()
+
+
+# Offline and deterministic, only selected explicitly (benchmarks, tests)
+register_backend("hash", "basicmcp-hash-384", _create_hash_embeddings, dims=384,
+                 tokenizer=_word_clipper)
+
+
+def select_backend():
+    """Pick the backend from the environment, cheap enough to run at import time"""
+    if os.getenv("BASICMCP_EMBEDDING_BACKEND"):
+        return os.getenv("BASICMCP_EMBEDDING_BACKEND")
+    if os.getenv("JINA_API_KEY"):
+        return "jina"
+    if os.getenv("OPENAI_API_KEY"):
+        return "openai"
+    return "sentence-transformers"
+
+
+BACKEND = select_backend()
+MODEL_NAME = BACKENDS[BACKEND]["model_name"]
+# Used when a backend's limit can't be read from its model, the sequence length of most local models
+FALLBACK_MAX_TOKENS = 512
+
+_MODEL = None
+_LOCK = threading.Lock()
+
+
+def get_model():
+    """The embedding function of the active backend, created on first call"""
+    global _MODEL
+    if _MODEL is None:
+        with _LOCK:
+            if _MODEL is None:
+                from lancedb.embeddings import EmbeddingFunctionRegistry
+
+                logger.info("Using %s", BACKEND)
+                _MODEL = BACKENDS[BACKEND]["create"](EmbeddingFunctionRegistry.get_instance())
+    return _MODEL
+
+
+def get_embedding_dim():
+    return BACKENDS[BACKEND]["dims"] or get_model().ndims()
+
+
+_MAX_TOKENS = None
+
+
+def get_max_tokens():
+    """Token limit of the active backend, read from the model on first call for local models"""
+    global _MAX_TOKENS
+    if _MAX_TOKENS is None:
+        max_tokens = BACKENDS[BACKEND]["max_tokens"]
+        if callable(max_tokens):
+            try:
+                max_tokens = max_tokens(get_model())
+            except Exception as e:
+                logger.warning("Clipping to %d tokens, the model's limit is unknown: %s",
+                               FALLBACK_MAX_TOKENS, str(e))
+                max_tokens = FALLBACK_MAX_TOKENS
+        _MAX_TOKENS = max_tokens
+    return _MAX_TOKENS
+
+
+_CLIPPER = None
+
+
+def get_clipper():
+    """Token clipper matching the active backend's tokenizer, created on first call"""
+    global _CLIPPER
+    if _CLIPPER is None:
+        from basicmcp.codeqa.index.tokens import TiktokenClipper, OffsetsClipper
+
+        tokenizer = BACKENDS[BACKEND]["tokenizer"]
+        clipper = None
+        if callable(tokenizer):
+            try:
+                clipper = tokenizer(get_model())
+                if not hasattr(clipper, "clip_batch"):
+                    clipper = OffsetsClipper(clipper)
+            except Exception as e:
+                logger.warning("Falling back to cl100k_base for clipping: %s", str(e))
+        _CLIPPER = clipper or TiktokenClipper(tokenizer if isinstance(tokenizer, str) else "cl100k_base")
+    return _CLIPPER
+
+
+def warm_up(background=True):
+    """
+    Load the embedding backend ahead of the first request
+    Args:
+        background: Load in a daemon thread instead of blocking the caller
+    """
+    def _load():
+        try:
+            get_model()
+            get_embedding_dim()
+            get_max_tokens()
+        except Exception as e:
+            logger.warning("Embedding backend warm-up failed: %s", str(e))
+
+    if not background:
+        _load()
+        return None
+    thread = threading.Thread(target=_load, name="embedding-warm-up", daemon=True)
+    thread.start()
+    return thread
@@ -0,0 +1,112 @@
+import os
+import logging
+from pathlib import Path
+from urllib.parse import urlparse
+import git
+from basicmcp.codeqa.util import repo_path, repo_name
+
+logger = logging.getLogger(__name__)
+
+MIRRORS_DIR = Path.home() / ".basicmcp" / "mirrors"
+CHECKOUTS_DIR = Path.home() / ".basicmcp" / "checkouts"
+
+# mirror: cached bare mirror + reused worktree, fetches only the delta on re-ingestion
+# shallow: throwaway depth-1 blobless clone for one-off repos
+# tree: cached bare mirror, files are read from the object store without a worktree
+CLONE_MODES = ("mirror", "shallow", "tree")
+DEFAULT_CLONE_MODE = os.getenv("BASICMCP_CLONE_MODE", "mirror")
+
+
+def mirror_dir(url):
+    return MIRRORS_DIR / urlparse(url).netloc / (repo_path(url) + ".git")
+
+
+def update_mirror(url):
+    """
+    Create or incrementally fetch the bare mirror of a repository
+    Returns:
+        git.Repo of the mirror
+    """
+    path = mirror_dir(url)
+    if path.exists():
+        logger.info("Fetching updates into mirror %s", path)
+        repo = git.Repo(path)
+        repo.git.fetch("--prune", "origin")
+    else:
+        logger.info("Mirroring repository: %s", url)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        repo = git.Repo.clone_from(url, path, mirror=True)
+    return repo
+
+
+def resolve_ref(repo, ref=None):
+    """Commit SHA of a branch, tag or SHA, defaulting to the remote HEAD"""
+    return repo.commit(ref or "HEAD").hexsha
+
+
+def checkout_worktree(url, ref=None):
+    """
+    Check out ref from the cached mirror into a worktree that is reused across runs,
+    so the checkout path (and therefore the ingestion manifest) stays stable
+    Returns:
+        Path of the worktree
+    """
+    repo = update_mirror(url)
+    sha = resolve_ref(repo, ref)
+    path = CHECKOUTS_DIR / repo_path(url)
+    if (path / ".git").exists():
+        worktree = git.Repo(path)
+        worktree.git.checkout("--detach", "--force", sha)
+        worktree.git.clean("-ffdx")
+    else:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        repo.git.worktree("prune")
+        repo.git.worktree("add", "--detach", "--force", str(path), sha)
+    logger.info("Checked out %s at %s", url, sha)
+    return path
+
+
+def shallow_clone(url, target, ref=None):
+    """
+    Depth-1, blobless clone of a single ref (branch, tag or commit SHA) into target
+    """
+    repo = git.Repo.init(target)
+    repo.create_remote("origin", url)
+    repo.git.fetch("--depth=1", "--filter=blob:none", "origin", ref or "HEAD")
+    repo.git.checkout("--detach", "FETCH_HEAD")
+    return Path(target)
+
+
+class GitTree:
+    """
+    Files of a single commit, read straight from a repository's object store.
+    Paths are prefixed with the repository name so they read like paths of a checkout
+    """
+
+    def __init__(self, repo, sha, name, root):
+        self.name = name
+        # Recorded in the manifest instead of a checkout directory
+        self.root = root
+        self.sha = sha
+        tree = repo.commit(sha).tree
+        self._blobs = {
+            f"{name}/{item.path}": item
+            for item in tree.traverse()
+            if item.type == "blob"
+        }
+
+    def paths(self):
+        return sorted(self._blobs)
+
+    def hash(self, path):
+        # The blob SHA already identifies the content, no need to read it
+        return self._blobs[path].hexsha
+
+    def read(self, path):
+        return self._blobs[path].data_stream.read()
+
+
+def open_tree(url, ref=None):
+    repo = update_mirror(url)
+    sha = resolve_ref(repo, ref)
+    return GitTree(repo, sha, repo_name(url), root=f"{url}@tree")
@@ -0,0 +1,71 @@
+import os
+import logging
+import threading
+from pathlib import Path
+import lancedb
+from basicmcp.codeqa.index.manifest import MANIFEST_FILE, read_build_id
+
+logger = logging.getLogger(__name__)
+
+# str(uri) -> {"db", "stamp", "tables"}
+_HANDLES = {}
+_LOCK = threading.Lock()
+
+
+def _stamp(uri):
+    """
+    Identifies the state of an artifacts directory: a full ingestion writes a new build id,
+    every ingestion ends by replacing the manifest (new inode and mtime)
+    """
+    try:
+        manifest = os.stat(Path(uri) / MANIFEST_FILE)
+    except FileNotFoundError:
+        return read_build_id(uri), None
+    return read_build_id(uri), (manifest.st_ino, manifest.st_mtime_ns)
+
+
+def get_table(uri, table_name):
+    """
+    Open table handle, reused across calls. After an ingestion of the directory the cached
+    handles check out the latest version, or are reopened if the directory was rebuilt
+    Args:
+        uri: LanceDB directory, e.g. the artifacts directory of a codebase
+        table_name: Name of the table
+    """
+    key = str(uri)
+    stamp = _stamp(uri)
+    with _LOCK:
+        entry = _HANDLES.get(key)
+        if entry is not None and entry["stamp"] != stamp:
+            if entry["stamp"][0] == stamp[0]:
+                _checkout_latest(entry)
+                entry["stamp"] = stamp
+            else:
+                entry = None
+        if entry is None:
+            entry = {"db": lancedb.connect(uri), "stamp": stamp, "tables": {}}
+            _HANDLES[key] = entry
+
+        table = entry["tables"].get(table_name)
+        if table is None:
+            table = entry["db"].open_table(table_name)
+            entry["tables"][table_name] = table
+        return table
+
+
+def _checkout_latest(entry):
+    for name, table in list(entry["tables"].items()):
+        try:
+            table.checkout_latest()
+        except Exception as e:
+            logger.info("Reopening table %s: %s", name, str(e))
+            del entry["tables"][name]
+
+
+def invalidate(uri=None):
+    """Drop the cached handles of a directory, or of every directory when uri is None"""
+    with _LOCK:
+        if uri is None:
+            _HANDLES.clear()
+        else:
+            _HANDLES.pop(str(uri), None)
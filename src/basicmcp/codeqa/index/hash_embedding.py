@@ -0,0 +1,28 @@
+import hashlib
+import numpy as np
+from lancedb.embeddings import register, TextEmbeddingFunction
+from basicmcp.codeqa.index.tokens import WORD_PATTERN
+
+
+@register("basicmcp-hash")
+class HashEmbeddings(TextEmbeddingFunction):
+    """
+    Deterministic offline embeddings: hashed bag of words, L2 normalized.
+    Meant for benchmarks and tests, texts sharing identifiers still land close together
+    """
+
+    dims: int = 384
+
+    def ndims(self):
+        return self.dims
+
+    def generate_embeddings(self, texts):
+        embeddings = []
+        for text in texts:
+            vector = np.zeros(self.dims, dtype=np.float32)
+            for token in WORD_PATTERN.findall(text.lower()):
+                digest = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+                vector[digest % self.dims] += 1.0 if digest >> 63 else -1.0
+            norm = np.linalg.norm(vector)
+            embeddings.append(vector / norm if norm else vector)
+        return embeddings
@@ -1,14 +1,21 @@
 import os
 import sys
+import hashlib
 import pandas as pd
+import pyarrow as pa
 import lancedb
 import logging
 from pathlib import Path
-from lancedb.embeddings import EmbeddingFunctionRegistry
+from itertools import chain
 from lancedb.pydantic import LanceModel, Vector
-import tiktoken
 from dotenv import load_dotenv
-from basicmcp.codeqa.util import get_central_storage_dir
+from basicmcp.codeqa.util import get_central_storage_dir, file_filter, in_filter, SPECIAL_ROWS
+from basicmcp.codeqa.index.stream import batched, INGEST_BATCH_SIZE
+from basicmcp.codeqa.index.embedding_cache import get_embedding_cache
+from basicmcp.codeqa.index.embeddings import MODEL_NAME, get_model, get_embedding_dim, get_clipper, get_max_tokens
+from basicmcp.codeqa.index.tokens import get_encoding, fits_without_encoding, clip_texts
+from basicmcp.codeqa.index.vector_index import ensure_vector_index, ensure_scalar_indices
+from basicmcp.codeqa.index.jobs import no_progress
 
 load_dotenv()
 
@@ -39,147 +46,345 @@ def get_special_files(directory):
                 md_files.append(full_path)
     return md_files
 
-def process_special_files(md_files):
-    contents = {}
+def iter_special_files(md_files, read=None):
+    """
+    Yield (file_path, content) of markdown/shell files
+    Args:
+        read: Optional function returning the bytes of a file_path, for files that are not on disk
+    """
     for file_path in md_files:
+        if read is not None:
+            yield file_path, read(file_path).decode('utf-8')
+            continue
         with open(file_path, 'r', encoding='utf-8') as file:
-            contents[file_path] = file.read()  # Store the content against the file path
-    return contents
+            yield file_path, file.read()
 
+def process_special_files(md_files):
+    # Store the content against the file path
+    return dict(iter_special_files(md_files))
 
-def create_markdown_dataframe(markdown_contents):
-    # Create a DataFrame from markdown_contents dictionary
-    df = pd.DataFrame(list(markdown_contents.items()), columns=['file_path', 'source_code'])
-    
-    # Format the source_code with file information and apply clipping
-    df['source_code'] = df.apply(lambda row: f"File: {row['file_path']}\n\nContent:\n{clip_text_to_max_tokens(row['source_code'], MAX_TOKENS)}\n\n", axis=1)
-    
-    # Add placeholder "empty" for the other necessary columns
-    for col in ['class_name', 'constructor_declaration', 'method_declarations', 'references']:
-        df[col] = "empty"
-    return df
-
-
-# Check for environment variables and select embedding model
-registry = EmbeddingFunctionRegistry.get_instance()
-MAX_TOKENS = 8000  # Reduced default
-if os.getenv("JINA_API_KEY"):
-    logger.info("Using Jina")
-    MODEL_NAME = "jina-embeddings-v3"
-    model = registry.get("jina").create(name=MODEL_NAME, max_retries=2)
-    EMBEDDING_DIM = 1024  # Jina's dimension
-    MAX_TOKENS = 4000   # Jina uses a different tokenizer
-elif os.getenv("OPENAI_API_KEY"):
-    logger.info("Using OpenAI")
-    MAX_TOKENS = 8000  # Further reduced from 7000 to handle large files safely
-    MODEL_NAME = "text-embedding-3-large"
-    model = registry.get("openai").create(name=MODEL_NAME, max_retries=2, api_key=os.environ.get("OPENAI_API_KEY"))
-    EMBEDDING_DIM = model.ndims()  # OpenAI's dimension
-else:
-    logger.info("Using sentence-transformers")
-    MAX_TOKENS = 8000
-    MODEL_NAME = "BAAI/bge-small-en-v1.5"
-    model = registry.get("sentence-transformers").create(name=MODEL_NAME)
-    EMBEDDING_DIM = model.ndims()
-
-
-class Method(LanceModel):
-    code: str = model.SourceField()
-    method_embeddings: Vector(EMBEDDING_DIM) = model.VectorField()
-    file_path: str
-    class_name: str
-    name: str
-    doc_comment: str
-    source_code: str
-    references: str
-
-class Class(LanceModel):
-    source_code: str = model.SourceField()
-    class_embeddings: Vector(EMBEDDING_DIM) = model.VectorField()
-    file_path: str
-    class_name: str
-    constructor_declaration: str
-    method_declarations: str
-    references: str
+
+def special_file_rows(special_contents):
+    """
+    Class table rows for markdown/shell files
+    Args:
+        special_contents: dict or iterable of (file_path, content) pairs
+    """
+    items = special_contents.items() if isinstance(special_contents, dict) else special_contents
+    for batch in batched(items, INGEST_BATCH_SIZE):
+        # Clip the contents of a whole batch at once, only long files get tokenized
+        contents = clip_texts([content for _, content in batch], get_max_tokens(), get_clipper())
+        for (file_path, _), content in zip(batch, contents):
+            # Format the source_code with file information
+            yield {
+                'id': row_id(file_path, "special"),
+                'file_path': file_path,
+                'source_code': f"File: {file_path}\n\nContent:\n{content}\n\n",
+                # Add placeholder "empty" for the other necessary columns
+                'class_name': "empty",
+                'constructor_declaration': "empty",
+                'method_declarations': "empty",
+                'references': "empty",
+            }
+
+
+_SCHEMAS = None
+
+def get_schemas():
+    """
+    The Method and Class table models, built on first use since they need the embedding backend
+    Returns:
+        tuple: (Method, Class)
+    """
+    global _SCHEMAS
+    if _SCHEMAS is None:
+        model = get_model()
+        embedding_dim = get_embedding_dim()
+
+        class Method(LanceModel):
+            id: str
+            code: str = model.SourceField()
+            method_embeddings: Vector(embedding_dim) = model.VectorField()
+            file_path: str
+            class_name: str
+            name: str
+            doc_comment: str
+            source_code: str
+            references: str
+
+        class Class(LanceModel):
+            id: str
+            source_code: str = model.SourceField()
+            class_embeddings: Vector(embedding_dim) = model.VectorField()
+            file_path: str
+            class_name: str
+            constructor_declaration: str
+            method_declarations: str
+            references: str
+
+        _SCHEMAS = (Method, Class)
+    return _SCHEMAS
 
 def clip_text_to_max_tokens(text, max_tokens, encoding_name='cl100k_base'):
-    encoding = tiktoken.get_encoding(encoding_name)
-    tokens = encoding.encode(text)
-    original_token_count = len(tokens)
-    
-    logger.debug("\nOriginal text (%d tokens):", original_token_count)
-    logger.debug("=" * 50)
-    logger.debug(text[:200] + "..." if len(text) > 200 else text)
-    
-    if original_token_count > max_tokens:
-        tokens = tokens[:max_tokens]
-        clipped_text = encoding.decode(tokens)
-        logger.debug("\nClipped text (%d tokens):", len(tokens))
-        logger.debug("=" * 50)
-        logger.debug(clipped_text[:200] + "..." if len(clipped_text) > 200 else clipped_text)
-        return clipped_text
-    
-    return text
+    if fits_without_encoding(text, max_tokens):
+        return text
+    encoding = get_encoding(encoding_name)
+    tokens = encoding.encode(text, disallowed_special=())
+    if len(tokens) <= max_tokens:
+        return text
+    logger.debug("Clipping text from %d to %d tokens", len(tokens), max_tokens)
+    return encoding.decode(tokens[:max_tokens])
+
+def row_id(*parts):
+    """Stable row key used to upsert rows with merge_insert"""
+    return hashlib.sha1("\x00".join(str(part) for part in parts).encode()).hexdigest()
 
-def ingest_to_database(uri: str, table_name: str, method_data: list, class_data: list, special_contents: dict = None):
+def assign_row_ids(rows, key_fields):
+    # Same-named definitions in a file (overloads, nested functions) are told apart by their order
+    seen = {}
+    for row in rows:
+        key = tuple(row.get(field) or "" for field in key_fields)
+        ordinal = seen.get(key, 0)
+        seen[key] = ordinal + 1
+        row['id'] = row_id(*key, ordinal)
+        yield row
+
+def tables_exist(uri, table_name):
     db = lancedb.connect(uri)
+    existing = db.table_names()
+    return all(f"{table_name}{suffix}" in existing for suffix in ("_method", "_class"))
+
+def _fill_empty(value):
+    if value is None or (isinstance(value, float) and value != value):
+        return 'empty'
+    return value
+
+def embed_texts(texts):
+    """Embed texts with the active model, reusing cached embeddings of identical texts"""
+    model = get_model()
+    cache = get_embedding_cache(MODEL_NAME, get_embedding_dim())
+    if cache is None:
+        return model.compute_source_embeddings_with_retry(texts)
+    return cache.embed(texts, model.compute_source_embeddings_with_retry)
+
+def embed_batches(rows, model_cls, source_column, vector_column, batch_size=None):
+    """
+    Embed rows in fixed-size batches and yield them as Arrow record batches
+    Texts are clipped to the model's token limit for embedding only, the stored text is kept whole.
+    Rows whose embedding fails are dropped, matching on_bad_vectors='drop'
+    """
+    schema = model_cls.to_arrow_schema()
+    embedding_dim = get_embedding_dim()
+    for batch in batched(rows, batch_size or INGEST_BATCH_SIZE):
+        texts = clip_texts([row[source_column] for row in batch], get_max_tokens(), get_clipper())
+        vectors = embed_texts(texts)
+        records = []
+        for row, vector in zip(batch, vectors):
+            if vector is None or len(vector) != embedding_dim:
+                logger.warning("Dropping row from %s with a bad embedding", row.get('file_path'))
+                continue
+            record = {name: _fill_empty(row.get(name)) for name in schema.names}
+            record[vector_column] = vector
+            records.append(record)
+        if records:
+            yield pa.RecordBatch.from_pylist(records, schema=schema)
+
+def write_batches(table, batches, schema, replaced_files=None):
+    """
+    Stream record batches into a table. With replaced_files, upsert them keyed on `id`
+    and delete rows of replaced_files that are no longer present
+    """
+    batches = iter(batches)
+    first = next(batches, None)
+    if first is None:
+        if replaced_files:
+            table.delete(file_filter(replaced_files))
+        return
+    reader = pa.RecordBatchReader.from_batches(schema, chain([first], batches))
+    if replaced_files is None:
+        table.add(reader)
+        return
+    builder = table.merge_insert("id").when_matched_update_all().when_not_matched_insert_all()
+    if replaced_files:
+        builder = builder.when_not_matched_by_source_delete(file_filter(replaced_files))
+    builder.execute(reader)
+
+def _method_rows(method_data):
+    for row in assign_row_ids(method_data, ('file_path', 'class_name', 'name')):
+        row['code'] = row['source_code']
+        yield row
+
+def _with_placeholder(rows):
+    # An empty class table still gets one row so its FTS index can be built
+    empty = True
+    for row in rows:
+        empty = False
+        yield row
+    if empty:
+        columns = ['source_code', 'file_path', 'class_name', 'constructor_declaration',
+                   'method_declarations', 'references']
+        placeholder = {col: "empty" for col in columns}
+        placeholder['id'] = row_id("empty")
+        yield placeholder
+
+# Columns filtered on by exact symbol lookups and file deletes. BTREE rather than bitmap, the
+# columns have one distinct value per few rows
+SCALAR_INDEX_COLUMNS = {
+    "method": ("name", "class_name", "file_path"),
+    "class": ("class_name", "file_path"),
+}
+
+
+def refresh_references(uri, table_name, references, exclude_files):
+    """
+    Rewrite the references of rows outside exclude_files, for definitions in unchanged files
+    that changed files started or stopped referencing. Vectors are kept as they are
+    Args:
+        references: {'class': {name: references}, 'method': {name: references}} with the
+            formatted references of every name to refresh
+        exclude_files: Files whose rows were rewritten by the ingestion
+    Returns:
+        int: Number of rows updated
+    """
+    db = lancedb.connect(uri)
+    updated = 0
+    for suffix, kind, key in (("_method", "method", "name"), ("_class", "class", "class_name")):
+        names = references[kind]
+        if not names:
+            continue
+        table = db.open_table(table_name + suffix)
+        where = in_filter(key, sorted(names))
+        if exclude_files:
+            where += f" AND NOT ({file_filter(exclude_files)})"
+        if kind == "class":
+            where += f" AND NOT ({SPECIAL_ROWS})"
+        rows = table.search().where(where).limit(None).to_arrow()
+        if rows.num_rows == 0:
+            continue
+        current = rows.column("references").to_pylist()
+        new = [names[name] for name in rows.column(key).to_pylist()]
+        changed = [i for i, (old, value) in enumerate(zip(current, new)) if old != value]
+        if not changed:
+            continue
+        rows = rows.take(changed)
+        rows = rows.set_column(rows.schema.get_field_index("references"), "references",
+                               pa.array([new[i] for i in changed], type=pa.string()))
+        table.merge_insert("id").when_matched_update_all().execute(rows)
+        updated += len(changed)
+    logger.info("Updated the references of %d rows in unchanged files", updated)
+    return updated
+
+def _reported(batches, progress, embedded):
+    """Pass record batches through, reporting the rows embedded so far across both tables"""
+    for batch in batches:
+        embedded[0] += batch.num_rows
+        progress("embedding", rows_embedded=embedded[0])
+        yield batch
+
+def ingest_to_database(uri: str, table_name: str, method_data, class_data, special_contents=None, replaced_files: list = None, batch_size: int = None, progress=None):
+    """
+    Write parsed methods and classes to the <table_name>_method and <table_name>_class tables.
+    Rows are consumed lazily and embedded in batches, so peak memory depends on batch_size
+    rather than on the size of the codebase
+    Args:
+        uri: LanceDB directory
+        table_name: Prefix of the tables, usually the project slug
+        method_data: Iterable of method rows
+        class_data: Iterable of class rows
+        special_contents: dict or iterable of (file_path, content) pairs of markdown/shell files
+        replaced_files: If given, the existing tables are updated in place with merge_insert
+            and rows of these files that are absent from the new data are deleted.
+            Otherwise both tables are recreated.
+        batch_size: Rows per embedding call and record batch, defaults to BASICMCP_INGEST_BATCH_SIZE
+        progress: Optional callback progress(stage, **counts), see jobs.IngestionJob
+    """
+    progress = progress or no_progress
+    embedded = [0]
+    db = lancedb.connect(uri)
+    incremental = replaced_files is not None
+    Method, Class = get_schemas()
+    cache = get_embedding_cache(MODEL_NAME, get_embedding_dim())
+    # The cache counts for the whole process, this ingestion logs what it added to them
+    cache_counts = cache.counts() if cache is not None else None
 
     try:
-        # Create and populate method table
-        table = db.create_table(
-            table_name + "_method", 
-            schema=Method, 
-            mode="overwrite",
-            on_bad_vectors='drop'
-        )
+        if incremental:
+            table = db.open_table(table_name + "_method")
+        else:
+            # Create and populate method table
+            table = db.create_table(
+                table_name + "_method", 
+                schema=Method, 
+                mode="overwrite",
+                on_bad_vectors='drop'
+            )
 
-        method_df = pd.DataFrame(method_data)
-        method_df['code'] = method_df['source_code']
-        method_df = method_df.fillna('empty')
         logger.info("Adding method data to table")
-        table.add(method_df)
-    
-        # Create and populate class table
-        class_table = db.create_table(
-            table_name + "_class", 
-            schema=Class, 
-            mode="overwrite",
-            on_bad_vectors='drop'
+        write_batches(
+            table,
+            _reported(embed_batches(_method_rows(method_data), Method, 'code', 'method_embeddings', batch_size),
+                      progress, embedded),
+            Method.to_arrow_schema(),
+            replaced_files,
         )
-        # Convert list to DataFrame
-        class_df = pd.DataFrame(class_data)
-        class_df = class_df.fillna('empty')
-
-        class_df['source_code'] = class_df.apply(
-            lambda row: "File: " + row['file_path'] + "\n\n" +
-                    "Class: " + row['class_name'] + "\n\n" +
-                    "Source Code:\n" + 
-                    clip_text_to_max_tokens(row['source_code'], MAX_TOKENS) + "\n\n",
-            axis=1
+    
+        if incremental:
+            class_table = db.open_table(table_name + "_class")
+        else:
+            # Create and populate class table
+            class_table = db.create_table(
+                table_name + "_class", 
+                schema=Class, 
+                mode="overwrite",
+                on_bad_vectors='drop'
+            )
+
+        class_rows = chain(
+            assign_row_ids(class_data, ('file_path', 'class_name')),
+            special_file_rows(special_contents or {}),
         )
+        if not incremental:
+            class_rows = _with_placeholder(class_rows)
 
-        if len(class_data) == 0:
-            columns = ['source_code', 'file_path', 'class_name', 'constructor_declaration', 
-                      'method_declarations', 'references']
-            class_data = pd.DataFrame({col: ["empty"] for col in columns})
-            
         logger.info("Adding class data to table")
-        class_table.add(class_data)
-
-        if special_contents and len(special_contents) > 0:
-            markdown_df = create_markdown_dataframe(special_contents)
-            logger.info("Adding %d special files to table", len(markdown_df))
-            class_table.add(markdown_df)
-        class_table.create_fts_index("source_code", use_tantivy=False)
-        table.create_fts_index("code", use_tantivy=False)
+        write_batches(
+            class_table,
+            _reported(embed_batches(class_rows, Class, 'source_code', 'class_embeddings', batch_size),
+                      progress, embedded),
+            Class.to_arrow_schema(),
+            replaced_files,
+        )
+
+        progress("indexing")
+        if incremental:
+            # Brings the FTS and vector indices up to date with the new fragments
+            class_table.optimize()
+            table.optimize()
+        else:
+            class_table.create_fts_index("source_code", use_tantivy=False)
+            table.create_fts_index("code", use_tantivy=False)
+
+        ensure_scalar_indices(table, SCALAR_INDEX_COLUMNS["method"])
+        ensure_scalar_indices(class_table, SCALAR_INDEX_COLUMNS["class"])
+        # Tables that grew past the threshold get an ANN index instead of a flat scan
+        ensure_vector_index(table, 'method_embeddings', get_embedding_dim())
+        ensure_vector_index(class_table, 'class_embeddings', get_embedding_dim())
+
+        if cache is not None:
+            hits, misses = (now - before for now, before in zip(cache.counts(), cache_counts))
+            logger.info("Embedding cache: %d hits, %d misses", hits, misses)
+            cache.flush()
+            cache.evict()
         logger.info("Data ingestion completed successfully")
 
     except Exception as e:
         logger.error("Error during ingestion: %s", str(e))
-        if f"{table_name}_method" in db:
-            db.drop_table(f"{table_name}_method")
-        if f"{table_name}_class" in db:
-            db.drop_table(f"{table_name}_class")
+        # An in-place update leaves the previous index usable, only a fresh one is dropped
+        if not incremental:
+            if f"{table_name}_method" in db:
+                db.drop_table(f"{table_name}_method")
+            if f"{table_name}_class" in db:
+                db.drop_table(f"{table_name}_class")
         raise e
 
 if __name__ == "__main__":
@@ -201,4 +406,5 @@ if __name__ == "__main__":
 
     logger.info(class_data.head())
 
-    ingest_to_database(table_name, method_data, class_data, special_contents)
\ No newline at end of file
+    ingest_to_database(input_directory, table_name, method_data.to_dict('records'),
+                       class_data.to_dict('records'), special_contents)
\ No newline at end of file
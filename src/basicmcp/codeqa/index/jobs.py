@@ -0,0 +1,194 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Ingestions running at once, further jobs wait in the queue
+MAX_INGESTIONS = int(os.getenv("BASICMCP_MAX_INGESTIONS", "2"))
+# Finished jobs kept around for ingestion_status
+MAX_FINISHED_JOBS = 100
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = (SUCCEEDED, FAILED, CANCELLED)
+
+
+class IngestionCancelled(Exception):
+    pass
+
+
+def no_progress(stage, **counts):
+    """Progress callback used when nobody is listening"""
+
+
+class IngestionJob:
+    """
+    State of one background ingestion. The ingestion reports progress by calling the job,
+    which raises IngestionCancelled once cancel() was requested
+    """
+
+    def __init__(self, codebase, options, ingest=None, after=None):
+        self.id = uuid.uuid4().hex[:12]
+        self.codebase = codebase
+        self.options = options
+        self.ingest = ingest
+        # Codebase and image ingestions of one path are different jobs
+        self.key = (_qualified_name(ingest), codebase)
+        # Earlier job of the same key with other options, this one starts once it has finished
+        self.after = after
+        self.status = QUEUED
+        self.stage = None
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._changed = threading.Condition()
+
+    def __call__(self, stage, **counts):
+        if self._cancel.is_set():
+            raise IngestionCancelled(f"Ingestion of {self.codebase} was cancelled")
+        with self._changed:
+            if stage != self.stage:
+                logger.info("Ingestion %s: %s", self.id, stage)
+            self.stage = stage
+            self.progress.update(counts)
+            self._changed.notify_all()
+
+    def cancel(self):
+        """Request cancellation, a running ingestion stops at its next progress report"""
+        self._cancel.set()
+        if self.future is not None and self.future.cancel():
+            self._finish(CANCELLED, error="Cancelled before it started")
+
+    def wait(self, timeout=None):
+        """Block until the job finishes or its progress changes"""
+        with self._changed:
+            if self.status not in FINISHED:
+                self._changed.wait(timeout)
+
+    def _wait_for_finish(self, timeout=None):
+        with self._changed:
+            return self._changed.wait_for(lambda: self.status in FINISHED, timeout)
+
+    def _run(self):
+        if self.after is not None:
+            # Two ingestions would write the same tables, wait unless this one gets cancelled
+            self("waiting", waiting_for=self.after.id)
+            while not self.after._wait_for_finish(0.1):
+                if self._cancel.is_set():
+                    self._finish(CANCELLED, error=f"Ingestion of {self.codebase} was cancelled")
+                    return
+        self.status = RUNNING
+        self.started = time.time()
+        try:
+            self(self.stage or "starting")
+            result = self.ingest(self.codebase, progress=self, **self.options)
+            if isinstance(result, tuple):
+                project_slug, artifacts_dir = result
+                result = {"project_slug": project_slug, "artifacts_dir": str(artifacts_dir)}
+            self._finish(SUCCEEDED, result=result)
+        except IngestionCancelled as e:
+            self._finish(CANCELLED, error=str(e))
+        except Exception as e:
+            logger.error("Ingestion %s of %s failed: %s", self.id, self.codebase, str(e))
+            self._finish(FAILED, error=str(e))
+
+    def _finish(self, status, result=None, error=None):
+        with self._changed:
+            self.status = status
+            self.result = result
+            self.error = error
+            self.finished = time.time()
+            self._changed.notify_all()
+
+    def percent(self):
+        """Rough overall completion: parsing is weighted up to 50%, embedding up to 95%. Image ingestion counts images"""
+        if self.status == SUCCEEDED:
+            return 100
+        counts = self.progress
+        if counts.get("images_total"):
+            return min(99, int(100 * counts.get("images_ingested", 0) / counts["images_total"]))
+        if counts.get("rows_embedded") is not None and counts.get("rows_total"):
+            return 50 + int(45 * min(1, counts["rows_embedded"] / counts["rows_total"]))
+        if self.stage in ("indexing", "writing symbols"):
+            return 95
+        if counts.get("files_total"):
+            return 5 + int(45 * counts.get("files_parsed", 0) / counts["files_total"])
+        return 0
+
+    def to_dict(self):
+        end = self.finished or time.time()
+        return {
+            "job_id": self.id,
+            "codebase": self.codebase,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": self.percent(),
+            "progress": dict(self.progress),
+            "result": self.result,
+            "error": self.error,
+            "elapsed_seconds": round(end - self.started, 1) if self.started else None,
+        }
+
+
+def _qualified_name(function):
+    return f"{getattr(function, '__module__', '')}.{getattr(function, '__qualname__', repr(function))}"
+
+
+_EXECUTOR = None
+_JOBS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def _executor():
+    global _EXECUTOR
+    if _EXECUTOR is None:
+        _EXECUTOR = ThreadPoolExecutor(max_workers=max(MAX_INGESTIONS, 1), thread_name_prefix="ingestion")
+    return _EXECUTOR
+
+
+def submit_ingestion(codebase, ingest=None, **options):
+    """
+    Queue an ingestion. A codebase that is already queued or being ingested by the same function
+    with the same options returns that job, other options get a new job that starts once the
+    current ones have finished
+    Args:
+        codebase: Path to local codebase or GitHub repository URL
+        ingest: Function run as ingest(codebase, progress=job, **options), defaults to run_ingestion.
+            Returns (project_slug, artifacts_dir) or a dict, kept as the job result
+        options: Keyword arguments of run_ingestion, e.g. full, ref, clone_mode
+    Returns:
+        IngestionJob
+    """
+    if ingest is None:
+        from basicmcp.codeqa.index.run_ingestion import run_ingestion as ingest
+
+    with _LOCK:
+        active = [job for job in _JOBS.values()
+                  if job.key == (_qualified_name(ingest), codebase) and job.status not in FINISHED]
+        for job in active:
+            if job.options == options:
+                return job
+        job = IngestionJob(codebase, options, ingest, after=active[-1] if active else None)
+        _JOBS[job.id] = job
+        finished = [job_id for job_id, other in _JOBS.items() if other.status in FINISHED]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del _JOBS[job_id]
+        job.future = _executor().submit(job._run)
+    return job
+
+
+def get_job(job_id):
+    return _JOBS.get(job_id)
+
+
+def list_jobs():
+    return list(_JOBS.values())
@@ -0,0 +1,103 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+MANIFEST_FILE = "manifest.json"
+# Random id written by every full ingestion, tells readers the tables were rebuilt
+BUILD_FILE = "build_id"
+# Bump whenever the extracted rows change shape so stale indices get rebuilt
+PARSER_VERSION = "2"
+
+
+def hash_file(file_path, chunk_size=1 << 20):
+    """Return the sha256 hex digest of a file's contents"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def build_manifest(root, file_paths, model_name, hash=hash_file):
+    """
+    Build a manifest for the given files
+    Args:
+        root: Absolute codebase path (or another stable source id), recorded so moved checkouts trigger a rebuild
+        file_paths: Paths of every file that ends up in the index
+        model_name: Embedding model the rows are embedded with
+        hash: Function returning the content hash of a file path
+    Returns:
+        dict with the parser/model versions and a file_path -> content hash map
+    """
+    return {
+        "parser_version": PARSER_VERSION,
+        "model_name": model_name,
+        "root": str(root),
+        "files": {file_path: hash(file_path) for file_path in file_paths},
+    }
+
+
+def load_manifest(artifacts_dir):
+    manifest_path = Path(artifacts_dir) / MANIFEST_FILE
+    if not manifest_path.exists():
+        return None
+    try:
+        with open(manifest_path, "r", encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError) as e:
+        logger.warning("Ignoring unreadable manifest %s: %s", manifest_path, str(e))
+        return None
+
+
+def save_manifest(artifacts_dir, manifest):
+    manifest_path = Path(artifacts_dir) / MANIFEST_FILE
+    tmp_path = manifest_path.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.replace(tmp_path, manifest_path)
+
+
+def new_build_id(artifacts_dir):
+    build_id = uuid.uuid4().hex
+    (Path(artifacts_dir) / BUILD_FILE).write_text(build_id)
+    return build_id
+
+
+def read_build_id(artifacts_dir):
+    try:
+        return (Path(artifacts_dir) / BUILD_FILE).read_text()
+    except FileNotFoundError:
+        return None
+
+
+def is_compatible(old_manifest, new_manifest):
+    """Whether rows indexed under old_manifest can be updated in place"""
+    if not old_manifest:
+        return False
+    return all(
+        old_manifest.get(key) == new_manifest.get(key)
+        for key in ("parser_version", "model_name", "root")
+    )
+
+
+def diff_manifest(old_manifest, new_manifest):
+    """
+    Compare two manifests
+    Returns:
+        tuple: (added, modified, removed) sorted lists of file paths
+    """
+    old_files = old_manifest.get("files", {}) if old_manifest else {}
+    new_files = new_manifest.get("files", {})
+
+    added = sorted(path for path in new_files if path not in old_files)
+    modified = sorted(
+        path for path in new_files
+        if path in old_files and old_files[path] != new_files[path]
+    )
+    removed = sorted(path for path in old_files if path not in new_files)
+    return added, modified, removed
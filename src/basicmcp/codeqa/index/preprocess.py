@@ -3,8 +3,12 @@
 import os
 import sys
 import logging
+import threading
+import multiprocessing
+from functools import partial
 from .treesitter import Treesitter, LanguageEnum
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import csv
 
 # Configure logging
@@ -91,120 +95,271 @@ def get_language_from_extension(file_ext):
     }
     return FILE_EXTENSION_LANGUAGE_MAP.get(file_ext)
 
+def _code_file_language(file_name, file_path):
+    file_ext = os.path.splitext(file_name)[1]
+    if file_ext in WHITELIST_FILES and file_name not in BLACKLIST_FILES:
+        language = get_language_from_extension(file_ext)
+        if language:
+            return language
+        logger.warning("Unsupported file extension %s in file %s. Skipping.", file_ext, file_path)
+    return None
+
 def load_files(codebase_path):
     file_list = []
     for root, dirs, files in os.walk(codebase_path):
         dirs[:] = [d for d in dirs if d not in BLACKLIST_DIR]
         for file in files:
-            file_ext = os.path.splitext(file)[1]
-            if file_ext in WHITELIST_FILES:
-                if file not in BLACKLIST_FILES:
-                    file_path = os.path.join(root, file)
-                    language = get_language_from_extension(file_ext)
-                    if language:
-                        file_list.append((file_path, language))
-                    else:
-                        logger.warning("Unsupported file extension %s in file %s. Skipping.", file_ext, file_path)
+            file_path = os.path.join(root, file)
+            language = _code_file_language(file, file_path)
+            if language:
+                file_list.append((file_path, language))
     return file_list
 
-def parse_code_files(file_list):
-    class_data = []
-    method_data = []
+def filter_code_files(paths):
+    """Same selection as load_files, for '/'-separated paths that are not on disk"""
+    file_list = []
+    for file_path in paths:
+        *dirs, file = file_path.split("/")
+        if any(d in BLACKLIST_DIR for d in dirs):
+            continue
+        language = _code_file_language(file, file_path)
+        if language:
+            file_list.append((file_path, language))
+    return file_list
 
-    all_class_names = set()
-    all_method_names = set()
+# Process-pool parsing. 1 keeps everything in the calling process, 0 uses one worker per core
+PARSE_WORKERS = int(os.getenv("BASICMCP_PARSE_WORKERS", "1"))
+PARSE_CHUNK_SIZE = int(os.getenv("BASICMCP_PARSE_CHUNK_SIZE", "64"))
 
+# Treesitter instances, populated lazily in the main process and in every worker. Parsers are
+# not thread-safe, so concurrent ingestion jobs each get their own per thread
+_TREESITTERS = threading.local()
+
+def _get_treesitter(language):
+    parsers = getattr(_TREESITTERS, "parsers", None)
+    if parsers is None:
+        parsers = _TREESITTERS.parsers = {}
+    treesitter_parser = parsers.get(language)
+    if treesitter_parser is None:
+        treesitter_parser = Treesitter.create_treesitter(language)
+        parsers[language] = treesitter_parser
+    return treesitter_parser
+
+def _order_by_language(file_list):
+    # Files are processed grouped by language, keep that order so every mode merges identically
     files_by_language = defaultdict(list)
     for file_path, language in file_list:
         files_by_language[language].append(file_path)
+    return [(file_path, language) for language, files in files_by_language.items() for file_path in files]
 
-    for language, files in files_by_language.items():
-        treesitter_parser = Treesitter.create_treesitter(language)
-        for file_path in files:
-            with open(file_path, "r", encoding="utf-8") as file:
-                code = file.read()
-                file_bytes = code.encode()
-                class_nodes, method_nodes = treesitter_parser.parse(file_bytes)
-
-                # Process class nodes
-                for class_node in class_nodes:
-                    class_name = class_node.name
-                    all_class_names.add(class_name)
-                    class_data.append({
-                        "file_path": file_path,
-                        "class_name": class_name,
-                        "constructor_declaration": "",  # Extract if needed
-                        "method_declarations": "\n-----\n".join(class_node.method_declarations) if class_node.method_declarations else "",
-                        "source_code": class_node.source_code,
-                        "references": []  # Will populate later
-                    })
-
-                # Process method nodes
-                for method_node in method_nodes:
-                    method_name = method_node.name
-                    all_method_names.add(method_name)
-                    method_data.append({
-                        "file_path": file_path,
-                        "class_name": method_node.class_name if method_node.class_name else "",
-                        "name": method_name,
-                        "doc_comment": method_node.doc_comment,
-                        "source_code": method_node.method_source_code,
-                        "references": []  # Will populate later
-                    })
+def _resolve_workers(workers, chunk_size, num_files):
+    workers = PARSE_WORKERS if workers is None else workers
+    chunk_size = PARSE_CHUNK_SIZE if chunk_size is None else chunk_size
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    # Not worth spinning up a pool for a single chunk
+    workers = min(workers, -(-num_files // max(chunk_size, 1)))
+    return max(workers, 1), max(chunk_size, 1)
+
+def _map_files(func, ordered_files, workers, chunk_size, prepare=None):
+    """
+    Apply func to chunks of ordered_files and yield per-file results in input order
+    Args:
+        prepare: Optional function applied to each chunk in the calling process before func
+    """
+    workers, chunk_size = _resolve_workers(workers, chunk_size, len(ordered_files))
+    chunks = (ordered_files[i:i + chunk_size] for i in range(0, len(ordered_files), chunk_size))
+    if prepare:
+        chunks = map(prepare, chunks)
+    if workers == 1:
+        for chunk in chunks:
+            yield from func(chunk)
+        return
+
+    logger.info("Parsing %d files with %d workers", len(ordered_files), workers)
+    # Spawned rather than forked, ingestion runs in job threads of the server and a fork would
+    # copy locks other threads hold
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+        # Keep a bounded number of chunks in flight so results don't pile up in memory
+        pending = deque()
+        for chunk in chunks:
+            pending.append(executor.submit(func, chunk))
+            if len(pending) >= 2 * workers:
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
+
+# Parent node types that make an identifier a candidate class / method reference
+CLASS_REFERENCE_PARENTS = ('type', 'class_type', 'object_creation_expression')
+METHOD_REFERENCE_PARENTS = ('call_expression', 'method_invocation')
+
+def extract_file(file_path, language, file_bytes=None):
+    """
+    Parse a file once and pull out everything ingestion needs from that single tree
+    Args:
+        file_bytes: Content of the file, read from file_path when not given
+    Returns:
+        dict with the file's class rows, method rows, definition positions and candidate
+        references as (kind, name, line, column, text) tuples, not yet matched against known names
+    """
+    treesitter_parser = _get_treesitter(language)
+    if file_bytes is None:
+        with open(file_path, "rb") as file:
+            file_bytes = file.read()
+    tree = treesitter_parser.parser.parse(file_bytes)
+    class_nodes, method_nodes = treesitter_parser.parse_tree(tree)
+
+    # (kind, name, class_name, line, column) of every definition, for the symbols table
+    definitions = []
+    class_rows = []
+    for class_node in class_nodes:
+        definitions.append((
+            'class', class_node.name, class_node.name,
+            class_node.node.start_point[0] + 1, class_node.node.start_point[1] + 1,
+        ))
+        class_rows.append({
+            "file_path": file_path,
+            "class_name": class_node.name,
+            "constructor_declaration": "",  # Extract if needed
+            "method_declarations": "\n-----\n".join(class_node.method_declarations) if class_node.method_declarations else "",
+            "source_code": class_node.source_code,
+            "references": []  # Will populate later
+        })
+
+    method_rows = []
+    for method_node in method_nodes:
+        definitions.append((
+            'method', method_node.name, method_node.class_name or "",
+            method_node.node.start_point[0] + 1, method_node.node.start_point[1] + 1,
+        ))
+        method_rows.append({
+            "file_path": file_path,
+            "class_name": method_node.class_name if method_node.class_name else "",
+            "name": method_node.name,
+            "doc_comment": method_node.doc_comment,
+            "source_code": method_node.method_source_code,
+            "references": []  # Will populate later
+        })
+
+    candidates = []
+    stack = [(tree.root_node, None)]
+    while stack:
+        node, parent = stack.pop()
+        if node.type == 'identifier' and parent:
+            if parent.type in CLASS_REFERENCE_PARENTS:
+                kind = 'class'
+            elif parent.type in METHOD_REFERENCE_PARENTS:
+                kind = 'method'
+            else:
+                kind = None
+            if kind:
+                candidates.append((
+                    kind,
+                    node.text.decode(),
+                    node.start_point[0] + 1,
+                    node.start_point[1] + 1,
+                    parent.text.decode(),
+                ))
+
+        # Add children to stack with their parent
+        stack.extend((child, node) for child in node.children)
+
+    return {
+        "file_path": file_path,
+        "classes": class_rows,
+        "methods": method_rows,
+        "definitions": definitions,
+        "references": candidates,
+    }
+
+def _extract_chunk(chunk):
+    return [extract_file(*item) for item in chunk]
+
+def _with_contents(read, chunk):
+    return [(file_path, language, read(file_path)) for file_path, language in chunk]
+
+def iter_extractions(file_list, workers=None, chunk_size=None, read=None):
+    """
+    Run extract_file over every file, one parse per file
+    Args:
+        file_list: (file_path, LanguageEnum) tuples as returned by load_files
+        workers: Number of parsing processes, defaults to BASICMCP_PARSE_WORKERS
+        chunk_size: Files handed to a worker at a time, defaults to BASICMCP_PARSE_CHUNK_SIZE
+        read: Optional function returning the bytes of a file_path, for files that are not on disk
+    Yields:
+        per-file extraction results, grouped by language in a deterministic order
+    """
+    ordered_files = _order_by_language(file_list)
+    prepare = None
+    if read is not None:
+        prepare = partial(_with_contents, read)
+    yield from _map_files(_extract_chunk, ordered_files, workers, chunk_size, prepare)
+
+def extract_code_files(file_list, workers=None, chunk_size=None):
+    return list(iter_extractions(file_list, workers, chunk_size))
+
+def collect_definitions(extractions):
+    """
+    Returns:
+        tuple: (class_data, method_data, all_class_names, all_method_names)
+    """
+    class_data = []
+    method_data = []
+
+    all_class_names = set()
+    all_method_names = set()
+
+    for extraction in extractions:
+        class_data.extend(extraction["classes"])
+        method_data.extend(extraction["methods"])
+        all_class_names.update(row["class_name"] for row in extraction["classes"])
+        all_method_names.update(row["name"] for row in extraction["methods"])
 
     return class_data, method_data, all_class_names, all_method_names
 
-def find_references(file_list, class_names, method_names):
+def resolve_references(extractions, class_names, method_names):
+    """
+    Match the candidate references of each extraction against the known definitions
+    Returns:
+        dict: {'class': {name: [ref, ...]}, 'method': {name: [ref, ...]}}
+    """
     references = {'class': defaultdict(list), 'method': defaultdict(list)}
-    files_by_language = defaultdict(list)
-    
-    # Convert names to sets for O(1) lookup
-    class_names = set(class_names)
-    method_names = set(method_names)
+    known_names = {'class': set(class_names), 'method': set(method_names)}
 
-    for file_path, language in file_list:
-        files_by_language[language].append(file_path)
-
-    for language, files in files_by_language.items():
-        treesitter_parser = Treesitter.create_treesitter(language)
-        for file_path in files:
-            with open(file_path, "r", encoding="utf-8") as file:
-                code = file.read()
-                file_bytes = code.encode()
-                tree = treesitter_parser.parser.parse(file_bytes)
-                
-                # Single pass through the AST
-                stack = [(tree.root_node, None)]
-                while stack:
-                    node, parent = stack.pop()
-                    
-                    # Check for identifiers
-                    if node.type == 'identifier':
-                        name = node.text.decode()
-                        
-                        # Check if it's a class reference
-                        if name in class_names and parent and parent.type in ['type', 'class_type', 'object_creation_expression']:
-                            references['class'][name].append({
-                                "file": file_path,
-                                "line": node.start_point[0] + 1,
-                                "column": node.start_point[1] + 1,
-                                "text": parent.text.decode()
-                            })
-                        
-                        # Check if it's a method reference
-                        if name in method_names and parent and parent.type in ['call_expression', 'method_invocation']:
-                            references['method'][name].append({
-                                "file": file_path,
-                                "line": node.start_point[0] + 1,
-                                "column": node.start_point[1] + 1,
-                                "text": parent.text.decode()
-                            })
-                    
-                    # Add children to stack with their parent
-                    stack.extend((child, node) for child in node.children)
+    for extraction in extractions:
+        file_path = extraction["file_path"]
+        for kind, name, line, column, text in extraction["references"]:
+            if name in known_names[kind]:
+                references[kind][name].append({
+                    "file": file_path,
+                    "line": line,
+                    "column": column,
+                    "text": text
+                })
 
     return references
 
+def attach_references(rows, references, key):
+    """Set each row's references from a name -> references map, e.g. resolve_references(...)['method']"""
+    for row in rows:
+        row["references"] = references.get(row[key], [])
+        yield row
+
+def parse_code_files(file_list, workers=None, chunk_size=None):
+    """
+    Extract class and method rows from the given files
+    Returns:
+        tuple: (class_data, method_data, all_class_names, all_method_names)
+    """
+    return collect_definitions(extract_code_files(file_list, workers, chunk_size))
+
+def find_references(file_list, class_names, method_names, workers=None, chunk_size=None):
+    """
+    Find usages of the given class and method names. Prefer resolve_references on the
+    output of extract_code_files when the definitions are extracted as well
+    """
+    return resolve_references(extract_code_files(file_list, workers, chunk_size), class_names, method_names)
+
 def create_output_directory(codebase_path):
     normalized_path = os.path.normpath(os.path.abspath(codebase_path))
     codebase_folder_name = os.path.basename(normalized_path)
@@ -212,29 +367,65 @@ def create_output_directory(codebase_path):
     os.makedirs(output_directory, exist_ok=True)
     return output_directory
 
-def write_class_data_to_csv(class_data, output_directory):
-    output_file = os.path.join(output_directory, "class_data.csv")
-    fieldnames = ["file_path", "class_name", "constructor_declaration", "method_declarations", "source_code", "references"]
+CLASS_FIELDNAMES = ["file_path", "class_name", "constructor_declaration", "method_declarations", "source_code", "references"]
+METHOD_FIELDNAMES = ["file_path", "class_name", "name", "doc_comment", "source_code", "references"]
+
+def format_references(references):
+    if isinstance(references, str):
+        return references
+    return "; ".join([f"{ref['file']}:{ref['line']}:{ref['column']}" for ref in references])
+
+def iter_rows_to_csv(rows, output_file, fieldnames):
+    """
+    Write rows to a CSV file as they stream past, flattening their references to strings
+    """
     with open(output_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
         writer.writeheader()
-        for row in class_data:
-            references = row.get("references", [])
-            row["references"] = "; ".join([f"{ref['file']}:{ref['line']}:{ref['column']}" for ref in references])
+        for row in rows:
+            row["references"] = format_references(row.get("references", []))
             writer.writerow(row)
-    logger.info("Class data written to %s", output_file)
+            yield row
+    logger.info("Data written to %s", output_file)
+
+def merge_csv(output_file, new_file, fieldnames, replaced_files, references, key):
+    """
+    Fold the rows an incremental run wrote to new_file into an existing CSV. Rows of
+    replaced_files are dropped, the others keep their place with their references updated
+    Args:
+        references: name -> formatted references of the names whose references changed
+        key: Column holding the name, class_name or name
+    """
+    # Source code columns can be longer than the default field limit
+    csv.field_size_limit(2 ** 31 - 1)
+    replaced_files = set(replaced_files)
+    merged_file = f"{output_file}.merged"
+    with open(merged_file, "w", newline="", encoding="utf-8") as file:
+        writer = csv.DictWriter(file, fieldnames=fieldnames, extrasaction="ignore")
+        writer.writeheader()
+        if os.path.exists(output_file):
+            with open(output_file, newline="", encoding="utf-8") as old:
+                for row in csv.DictReader(old):
+                    if row["file_path"] in replaced_files:
+                        continue
+                    if row[key] in references:
+                        row["references"] = references[row[key]]
+                    writer.writerow(row)
+        if os.path.exists(new_file):
+            with open(new_file, newline="", encoding="utf-8") as new:
+                writer.writerows(csv.DictReader(new))
+            os.remove(new_file)
+    os.replace(merged_file, output_file)
+
+def write_class_data_to_csv(class_data, output_directory):
+    output_file = os.path.join(output_directory, "class_data.csv")
+    for _ in iter_rows_to_csv(class_data, output_file, CLASS_FIELDNAMES):
+        pass
 
 def write_method_data_to_csv(method_data, output_directory):
     output_file = os.path.join(output_directory, "method_data.csv")
-    fieldnames = ["file_path", "class_name", "name", "doc_comment", "source_code", "references"]
-    with open(output_file, "w", newline="", encoding="utf-8") as file:
-        writer = csv.DictWriter(file, fieldnames=fieldnames)
-        writer.writeheader()
-        for row in method_data:
-            references = row.get("references", [])
-            row["references"] = "; ".join([f"{ref['file']}:{ref['line']}:{ref['column']}" for ref in references])
-            writer.writerow(row)
-    logger.info("Method data written to %s", output_file)
+    for _ in iter_rows_to_csv(method_data, output_file, METHOD_FIELDNAMES):
+        pass
 
 if __name__ == "__main__":
     if len(sys.argv) < 2:
@@ -243,28 +434,15 @@ if __name__ == "__main__":
     codebase_path = sys.argv[1]
 
     files = load_files(codebase_path)
-    class_data, method_data, class_names, method_names = parse_code_files(files)
+    extractions = extract_code_files(files)
+    class_data, method_data, class_names, method_names = collect_definitions(extractions)
 
     # Find references
-    references = find_references(files, class_names, method_names)
+    references = resolve_references(extractions, class_names, method_names)
 
     # Map references back to class and method data
-    class_data_dict = {cd['class_name']: cd for cd in class_data}
-    method_data_dict = {(md['class_name'], md['name']): md for md in method_data}
-
-    for class_name, refs in references['class'].items():
-        if class_name in class_data_dict:
-            class_data_dict[class_name]['references'] = refs
-
-    for method_name, refs in references['method'].items():
-        # Find all methods with this name (since methods might have the same name in different classes)
-        for key in method_data_dict:
-            if key[1] == method_name:
-                method_data_dict[key]['references'] = refs
-
-    # Convert dictionaries back to lists
-    class_data = list(class_data_dict.values())
-    method_data = list(method_data_dict.values())
+    class_data = list(attach_references(class_data, references['class'], 'class_name'))
+    method_data = list(attach_references(method_data, references['method'], 'name'))
 
     output_directory = create_output_directory(codebase_path)
     write_class_data_to_csv(class_data, output_directory)
@@ -1,10 +1,37 @@
-# ... existing imports ...
-import hashlib
+import os
 from pathlib import Path
-from typing import Tuple
+from typing import Optional, Tuple
 import shutil
 import sys
 import logging
+import tempfile
+import git
+from basicmcp.codeqa.index.preprocess import (
+    load_files,
+    filter_code_files,
+    iter_extractions,
+    resolve_references,
+    attach_references,
+    iter_rows_to_csv,
+    merge_csv,
+    format_references,
+    CLASS_FIELDNAMES,
+    METHOD_FIELDNAMES,
+)
+from basicmcp.codeqa.index.ingest import (
+    iter_special_files, get_special_files, ingest_to_database, refresh_references, tables_exist, MODEL_NAME
+)
+from basicmcp.codeqa.index.symbols import symbol_rows, stored_references, stored_reference_names, write_symbols
+from basicmcp.codeqa.index.handles import invalidate
+from basicmcp.codeqa.index.jobs import no_progress
+from basicmcp.codeqa.index.stream import RowSpill
+from basicmcp.codeqa.index.manifest import (
+    build_manifest, load_manifest, save_manifest, is_compatible, diff_manifest, new_build_id
+)
+from basicmcp.codeqa.util import get_central_storage_dir, get_project_slug, is_repository_url
+from basicmcp.codeqa.index.git_source import (
+    GitTree, CLONE_MODES, DEFAULT_CLONE_MODE, checkout_worktree, open_tree, repo_name, shallow_clone
+)
 
 # Add logging configuration
 logging.basicConfig(
@@ -13,89 +40,168 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from basicmcp.codeqa.index.preprocess import (
-    load_files,
-    parse_code_files,
-    find_references,
-    write_class_data_to_csv,
-    write_method_data_to_csv,
-)
-from basicmcp.codeqa.index.ingest import (
-    Method, Class, clip_text_to_max_tokens, MAX_TOKENS,
-    get_name_and_input_dir, process_special_files, get_special_files,
-    create_markdown_dataframe, ingest_to_database
-)
-from basicmcp.codeqa.util import get_central_storage_dir, get_project_slug
-import tempfile
-import git
-from urllib.parse import urlparse
-
 
-def run_ingestion(codebase_path: str) -> Tuple[str, Path]:
+def run_ingestion(codebase_path: str, full: bool = False, ref: Optional[str] = None,
+                  clone_mode: Optional[str] = None, progress=None) -> Tuple[str, Path]:
     """
     Run the ingestion process programmatically
     Args:
-        codebase_path: Path to local codebase or GitHub repository URL
+        codebase_path: Path to local codebase or repository URL (http(s):// or file://)
+        full: Rebuild the index from scratch instead of only re-ingesting changed files
+        ref: Branch, tag or commit SHA to ingest for repository URLs, defaults to the remote HEAD
+        clone_mode: How repository URLs are fetched, one of CLONE_MODES, defaults to BASICMCP_CLONE_MODE
+        progress: Optional callback progress(stage, **counts), called as the ingestion advances.
+            Exceptions it raises abort the ingestion, which is how jobs are cancelled
     Returns:
         tuple: (project_slug, artifacts_dir)
     """
-    # Handle GitHub repository URLs
-    if codebase_path.startswith(('http://', 'https://')):
+    # Handle repository URLs
+    if is_repository_url(codebase_path):
+        clone_mode = clone_mode or DEFAULT_CLONE_MODE
+        if clone_mode not in CLONE_MODES:
+            raise ValueError(f"Unknown clone mode {clone_mode}, expected one of {CLONE_MODES}")
+        progress = progress or no_progress
+        progress("fetching")
         try:
-            with tempfile.TemporaryDirectory() as tmp_dir:
-                logger.info(f"Cloning repository: {codebase_path}")
-                repo_path = Path(tmp_dir) / urlparse(codebase_path).path.split('/')[-1]
-                git.Repo.clone_from(codebase_path, repo_path)
-                return _run_ingestion(str(repo_path))
+            if clone_mode == "shallow":
+                with tempfile.TemporaryDirectory() as tmp_dir:
+                    logger.info(f"Cloning repository: {codebase_path}")
+                    repo_path = Path(tmp_dir) / repo_name(codebase_path)
+                    shallow_clone(codebase_path, repo_path, ref)
+                    return _run_ingestion(str(repo_path), full=full, progress=progress)
+            if clone_mode == "tree":
+                tree = open_tree(codebase_path, ref)
+                return _run_ingestion(tree.name, full=full, tree=tree, progress=progress)
+            return _run_ingestion(str(checkout_worktree(codebase_path, ref)), full=full, progress=progress)
         except git.GitCommandError as e:
             logger.error(f"Failed to clone repository: {e}")
             raise
     else:
-        return _run_ingestion(codebase_path)
+        return _run_ingestion(codebase_path, full=full, progress=progress)
 
-def _run_ingestion(codebase_path: str) -> Tuple[str, Path]:
-    """Internal function to handle the actual ingestion process"""
+def _run_ingestion(codebase_path: str, full: bool = False, tree: Optional[GitTree] = None,
+                   progress=None) -> Tuple[str, Path]:
+    """
+    Internal function to handle the actual ingestion process
+    Args:
+        tree: Read files from this commit's object store instead of codebase_path on disk
+    """
+    progress = progress or no_progress
+    progress("scanning")
     project_slug = get_project_slug(codebase_path)
     central_dir = get_central_storage_dir()
     artifacts_dir = central_dir / project_slug
-    
-    # Create fresh artifacts directory
-    if artifacts_dir.exists():
-        shutil.rmtree(artifacts_dir)
-    artifacts_dir.mkdir(parents=True)
-
-    # Process code files
-    files = load_files(codebase_path)
-    class_data, method_data, class_names, method_names = parse_code_files(files)
-    references = find_references(files, class_names, method_names)
-
-    # Map references
-    class_data_dict = {cd['class_name']: cd for cd in class_data}
-    method_data_dict = {(md['class_name'], md['name']): md for md in method_data}
-
-    for class_name, refs in references['class'].items():
-        if class_name in class_data_dict:
-            class_data_dict[class_name]['references'] = refs
-
-    for method_name, refs in references['method'].items():
-        for key in method_data_dict:
-            if key[1] == method_name:
-                method_data_dict[key]['references'] = refs
-
-    # Convert back to lists
-    class_data = list(class_data_dict.values())
-    method_data = list(method_data_dict.values())
-
-    # Process special files
-    special_files = get_special_files(codebase_path)
-    special_contents = process_special_files(special_files)
-
-    # Write to central storage
-    write_class_data_to_csv(class_data, artifacts_dir)
-    write_method_data_to_csv(method_data, artifacts_dir)
-
-    # Ingest data into database
-    ingest_to_database(artifacts_dir, project_slug, method_data, class_data, special_contents)
+
+    if tree is None:
+        read = None
+        files = load_files(codebase_path)
+        special_files = get_special_files(codebase_path)
+        manifest = build_manifest(os.path.abspath(codebase_path),
+                                  [fp for fp, _ in files] + special_files, MODEL_NAME)
+    else:
+        read = tree.read
+        paths = tree.paths()
+        files = filter_code_files(paths)
+        special_files = [path for path in paths if path.endswith(('.md', '.sh'))]
+        manifest = build_manifest(tree.root, [fp for fp, _ in files] + special_files, MODEL_NAME,
+                                  hash=tree.hash)
+
+    previous_manifest = None if full else load_manifest(artifacts_dir)
+    incremental = (
+        is_compatible(previous_manifest, manifest)
+        and tables_exist(artifacts_dir, project_slug)
+    )
+
+    if incremental:
+        added, modified, removed = diff_manifest(previous_manifest, manifest)
+        logger.info("Incremental ingestion: %d added, %d modified, %d removed files",
+                    len(added), len(modified), len(removed))
+        if not (added or modified or removed):
+            return project_slug, artifacts_dir
+        changed = set(added) | set(modified)
+        replaced_files = sorted(changed | set(removed))
+        parse_files = [(fp, language) for fp, language in files if fp in changed]
+        special_files = [fp for fp in special_files if fp in changed]
+        # Definitions the replaced files referenced before, their references change in unchanged files too
+        reference_names = stored_reference_names(artifacts_dir, project_slug, replaced_files)
+    else:
+        # Create fresh artifacts directory, cached handles would point at the deleted tables
+        invalidate(artifacts_dir)
+        if artifacts_dir.exists():
+            shutil.rmtree(artifacts_dir)
+        artifacts_dir.mkdir(parents=True)
+        new_build_id(artifacts_dir)
+        replaced_files = None
+        parse_files = files
+        reference_names = None
+
+    # Process code files, each file is parsed once for both definitions and references.
+    # Class and method rows are spilled to disk, only the compact symbols stay in memory
+    # until every name is known and references can be resolved
+    symbols = []
+    class_names, method_names = set(), set()
+    with RowSpill(artifacts_dir) as class_spill, RowSpill(artifacts_dir) as method_spill:
+        progress("parsing", files_total=len(parse_files), files_parsed=0)
+        for files_parsed, extraction in enumerate(iter_extractions(parse_files, read=read), 1):
+            progress("parsing", files_parsed=files_parsed)
+            class_spill.write(extraction.pop("classes"))
+            method_spill.write(extraction.pop("methods"))
+            for kind, name, *_ in extraction["definitions"]:
+                (class_names if kind == 'class' else method_names).add(name)
+            symbols.append(extraction)
+        logger.info("Extracted %d classes and %d methods", class_spill.count, method_spill.count)
+        progress("resolving references", rows_total=class_spill.count + method_spill.count + len(special_files))
+
+        if incremental:
+            # ...and those the new versions reference
+            for extraction in symbols:
+                for kind, name, *_ in extraction["references"]:
+                    reference_names[kind].add(name)
+            class_names |= reference_names['class']
+            method_names |= reference_names['method']
+
+        references = resolve_references(symbols, class_names, method_names)
+        refreshed = None
+        if incremental:
+            # References from untouched files come from the symbols table instead of re-parsing them
+            stored = stored_references(artifacts_dir, project_slug, class_names, method_names,
+                                       exclude_files=replaced_files)
+            for kind, refs_by_name in stored.items():
+                for name, refs in refs_by_name.items():
+                    references[kind][name] = refs + references[kind][name]
+            refreshed = {
+                kind: {name: format_references(references[kind].get(name, [])) for name in names}
+                for kind, names in reference_names.items()
+            }
+            refresh_references(artifacts_dir, project_slug, refreshed, exclude_files=replaced_files)
+
+        # Map references and write to central storage as the rows stream into the database.
+        # An incremental run writes the changed rows aside and merges them into the full CSVs after
+        csv_suffix = ".new" if incremental else ""
+        class_rows = iter_rows_to_csv(
+            attach_references(class_spill, references['class'], 'class_name'),
+            artifacts_dir / f"class_data.csv{csv_suffix}", CLASS_FIELDNAMES,
+        )
+        method_rows = iter_rows_to_csv(
+            attach_references(method_spill, references['method'], 'name'),
+            artifacts_dir / f"method_data.csv{csv_suffix}", METHOD_FIELDNAMES,
+        )
+
+        # Ingest data into database
+        ingest_to_database(artifacts_dir, project_slug, method_rows, class_rows,
+                           iter_special_files(special_files, read), replaced_files=replaced_files,
+                           progress=progress)
+
+    if incremental:
+        for name, fieldnames, kind, key in (("class_data.csv", CLASS_FIELDNAMES, 'class', 'class_name'),
+                                            ("method_data.csv", METHOD_FIELDNAMES, 'method', 'name')):
+            merge_csv(artifacts_dir / name, artifacts_dir / f"{name}.new", fieldnames,
+                      replaced_files, refreshed[kind], key)
+
+    progress("writing symbols")
+    write_symbols(artifacts_dir, project_slug, symbol_rows(symbols), replaced_files=replaced_files)
+    # Also tells cached table handles to check out the new versions
+    save_manifest(artifacts_dir, manifest)
 
     return project_slug, artifacts_dir
 
@@ -0,0 +1,52 @@
+import os
+import pickle
+import tempfile
+from itertools import islice
+
+# Rows embedded and written per Arrow record batch, bounds peak memory during ingestion
+INGEST_BATCH_SIZE = int(os.getenv("BASICMCP_INGEST_BATCH_SIZE", "256"))
+
+
+def batched(rows, batch_size):
+    """Yield lists of at most batch_size rows"""
+    rows = iter(rows)
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            return
+        yield batch
+
+
+class RowSpill:
+    """
+    Append-only on-disk buffer of rows, so rows extracted in one pass can be
+    replayed once every file has been seen without holding them all in memory
+    """
+
+    def __init__(self, directory=None):
+        self._file = tempfile.TemporaryFile(dir=directory)
+        self.count = 0
+
+    def write(self, rows):
+        if rows:
+            pickle.dump(rows, self._file, protocol=pickle.HIGHEST_PROTOCOL)
+            self.count += len(rows)
+
+    def __iter__(self):
+        self._file.flush()
+        self._file.seek(0)
+        while True:
+            try:
+                rows = pickle.load(self._file)
+            except EOFError:
+                return
+            yield from rows
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,148 @@
+import logging
+from collections import defaultdict
+import lancedb
+from lancedb.pydantic import LanceModel
+from basicmcp.codeqa.util import file_filter, in_filter, sql_string
+from basicmcp.codeqa.index.stream import batched
+from basicmcp.codeqa.index.handles import get_table
+from basicmcp.codeqa.index.vector_index import ensure_scalar_indices
+
+logger = logging.getLogger(__name__)
+
+SYMBOLS_SUFFIX = "_symbols"
+
+
+class Symbol(LanceModel):
+    name: str
+    kind: str  # class or method
+    role: str  # definition or reference
+    file_path: str
+    class_name: str
+    line: int
+    column: int
+    text: str
+
+
+def symbol_rows(extractions):
+    """
+    Flatten extract_file results into one row per definition and per candidate reference
+    """
+    for extraction in extractions:
+        file_path = extraction["file_path"]
+        for kind, name, class_name, line, column in extraction["definitions"]:
+            yield {
+                "name": name, "kind": kind, "role": "definition", "file_path": file_path,
+                "class_name": class_name, "line": line, "column": column, "text": "",
+            }
+        for kind, name, line, column, text in extraction["references"]:
+            yield {
+                "name": name, "kind": kind, "role": "reference", "file_path": file_path,
+                "class_name": "", "line": line, "column": column, "text": text,
+            }
+
+
+def stored_references(uri, table_name, class_names, method_names, exclude_files=()):
+    """
+    Load indexed references to the given class and method names, skipping rows of exclude_files
+    Returns:
+        dict: {'class': {name: [ref, ...]}, 'method': {name: [ref, ...]}}
+    """
+    references = {'class': defaultdict(list), 'method': defaultdict(list)}
+    clauses = [
+        f"(kind = '{kind}' AND {in_filter('name', sorted(names))})"
+        for kind, names in (('class', class_names), ('method', method_names)) if names
+    ]
+    if not clauses:
+        return references
+    db = lancedb.connect(uri)
+    table = db.open_table(table_name + SYMBOLS_SUFFIX)
+    where = f"role = 'reference' AND ({' OR '.join(clauses)})"
+    if exclude_files:
+        where += f" AND NOT ({file_filter(exclude_files)})"
+    rows = table.search().where(where).limit(None).to_arrow().to_pylist()
+    rows.sort(key=lambda row: (row["file_path"], row["line"], row["column"]))
+    for row in rows:
+        references[row["kind"]][row["name"]].append({
+            "file": row["file_path"],
+            "line": row["line"],
+            "column": row["column"],
+            "text": row["text"],
+        })
+    return references
+
+
+def stored_reference_names(uri, table_name, files):
+    """
+    Names the given files referenced when they were last indexed
+    Returns:
+        dict: {'class': set of names, 'method': set of names}
+    """
+    names = {'class': set(), 'method': set()}
+    if not files:
+        return names
+    db = lancedb.connect(uri)
+    table = db.open_table(table_name + SYMBOLS_SUFFIX)
+    rows = (table.search().where(f"role = 'reference' AND {file_filter(files)}")
+            .select(["kind", "name"]).limit(None).to_arrow().to_pylist())
+    for row in rows:
+        names[row["kind"]].add(row["name"])
+    return names
+
+
+def write_symbols(uri, table_name, rows, replaced_files=None, batch_size=10000):
+    """
+    Write symbol rows to <table_name>_symbols
+    Args:
+        rows: Iterable of symbol rows, written in batches of batch_size
+        replaced_files: If given, rows of these files are replaced in the existing table,
+            otherwise the table is recreated
+    """
+    db = lancedb.connect(uri)
+    name = table_name + SYMBOLS_SUFFIX
+    incremental = replaced_files is not None and name in db.table_names()
+    if incremental:
+        table = db.open_table(name)
+        if replaced_files:
+            table.delete(file_filter(replaced_files))
+    else:
+        table = db.create_table(name, schema=Symbol, mode="overwrite")
+
+    count = 0
+    for batch in batched(rows, batch_size):
+        table.add(batch)
+        count += len(batch)
+
+    if incremental:
+        table.optimize()
+    # Also on incremental runs, a first build without symbols has no index yet
+    ensure_scalar_indices(table, ("name",))
+    logger.info("Indexed %d symbols", count)
+    return table
+
+
+def lookup_symbol(uri, table_name, symbol, limit=100):
+    """
+    Find the definitions of and references to a symbol
+    Args:
+        symbol: A bare name or Class.method
+        limit: Maximum number of definitions and of references returned
+    Returns:
+        tuple: (definitions, references) as lists of row dicts
+    """
+    class_name = None
+    name = symbol.strip()
+    if "." in name:
+        class_name, name = name.rsplit(".", 1)
+
+    table = get_table(uri, table_name + SYMBOLS_SUFFIX)
+
+    def _query(where):
+        return table.search().where(where).limit(limit).to_arrow().to_pylist()
+
+    where = f"name = {sql_string(name)}"
+    definition_where = f"{where} AND role = 'definition'"
+    if class_name is not None:
+        definition_where += f" AND class_name = {sql_string(class_name)}"
+    definitions = _query(definition_where)
+    references = _query(f"{where} AND role = 'reference'")
+    return definitions, references
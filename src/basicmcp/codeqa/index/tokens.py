@@ -0,0 +1,94 @@
+import os
+import re
+import logging
+from functools import lru_cache
+from itertools import islice
+import tiktoken
+
+logger = logging.getLogger(__name__)
+
+# Threads tiktoken's encode_batch may use
+CLIP_THREADS = int(os.getenv("BASICMCP_CLIP_THREADS", "8"))
+WORD_PATTERN = re.compile(r"\w+")
+# Rough characters per token of source code, for budgets that don't warrant running a tokenizer
+CHARS_PER_TOKEN = 3
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name="cl100k_base"):
+    return tiktoken.get_encoding(encoding_name)
+
+
+def fits_without_encoding(text, max_tokens):
+    """
+    Cheap upper bound check: every token covers at least one UTF-8 byte (and a char is
+    at most 4 bytes), so texts this short can't exceed max_tokens whatever the tokenizer
+    """
+    if len(text) * 4 <= max_tokens:
+        return True
+    return len(text) <= max_tokens and len(text.encode("utf-8", "surrogatepass")) <= max_tokens
+
+
+def estimate_tokens(text):
+    """Approximate token count of text, errs on the high side for code"""
+    return -(-len(text) // CHARS_PER_TOKEN)
+
+
+class TiktokenClipper:
+    def __init__(self, encoding_name="cl100k_base"):
+        self.encoding = get_encoding(encoding_name)
+
+    def clip_batch(self, texts, max_tokens):
+        encoded = self.encoding.encode_batch(texts, num_threads=CLIP_THREADS, disallowed_special=())
+        return [
+            self.encoding.decode(tokens[:max_tokens]) if len(tokens) > max_tokens else text
+            for text, tokens in zip(texts, encoded)
+        ]
+
+
+class OffsetsClipper:
+    """
+    Clips with a Hugging Face fast tokenizer. Cuts the original string at the character
+    offset of the last kept token, since decoding ids can normalize the text (e.g. lowercase it)
+    """
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+
+    def clip_batch(self, texts, max_tokens):
+        encoded = self.tokenizer(texts, add_special_tokens=False, return_offsets_mapping=True)
+        return [
+            text[:offsets[max_tokens - 1][1]] if len(offsets) > max_tokens else text
+            for text, offsets in zip(texts, encoded["offset_mapping"])
+        ]
+
+
+class WordClipper:
+    """Counts every run of word characters as a token, the tokenization of the hash backend"""
+
+    def clip_batch(self, texts, max_tokens):
+        clipped = []
+        for text in texts:
+            ends = [match.end() for match in islice(WORD_PATTERN.finditer(text), max_tokens + 1)]
+            clipped.append(text[:ends[max_tokens - 1]] if len(ends) > max_tokens else text)
+        return clipped
+
+
+def clip_texts(texts, max_tokens, clipper):
+    """
+    Clip each text to max_tokens, only tokenizing the texts that may be too long
+    Args:
+        texts: List of texts
+        max_tokens: Token limit
+        clipper: Object with a clip_batch(texts, max_tokens) method
+    Returns:
+        list of clipped texts aligned with texts
+    """
+    clipped = list(texts)
+    too_long = [i for i, text in enumerate(clipped) if not fits_without_encoding(text, max_tokens)]
+    if too_long:
+        for i, text in zip(too_long, clipper.clip_batch([clipped[i] for i in too_long], max_tokens)):
+            clipped[i] = text
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Tokenized %d of %d texts for clipping", len(too_long), len(clipped))
+    return clipped
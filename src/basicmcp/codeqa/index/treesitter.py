@@ -123,7 +123,10 @@ class Treesitter(ABC):
         return Treesitter(language)
 
     def parse(self, file_bytes: bytes) -> tuple[list[TreesitterClassNode], list[TreesitterMethodNode]]:
-        tree = self.parser.parse(file_bytes)
+        return self.parse_tree(self.parser.parse(file_bytes))
+
+    def parse_tree(self, tree) -> tuple[list[TreesitterClassNode], list[TreesitterMethodNode]]:
+        """Extract classes and methods from an already parsed tree"""
         root_node = tree.root_node
 
         class_results = []
@@ -0,0 +1,99 @@
+import os
+import math
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Tables smaller than this are searched with a flat scan, which is exact and fast enough
+ANN_MIN_ROWS = int(os.getenv("BASICMCP_ANN_MIN_ROWS", "50000"))
+# IVF_PQ, IVF_HNSW_SQ, IVF_HNSW_PQ, ... see lancedb's Table.create_index
+ANN_INDEX_TYPE = os.getenv("BASICMCP_ANN_INDEX_TYPE", "IVF_PQ")
+# Used both to build the index and to search, lancedb searches with l2 by default
+ANN_METRIC = os.getenv("BASICMCP_ANN_METRIC", "l2")
+# Search tunables, None keeps lancedb's defaults
+DEFAULT_NPROBES = int(os.getenv("BASICMCP_NPROBES", "0")) or None
+DEFAULT_REFINE_FACTOR = int(os.getenv("BASICMCP_REFINE_FACTOR", "0")) or None
+
+
+def index_params(num_rows, dim, index_type=ANN_INDEX_TYPE):
+    """
+    Partition and sub-vector counts for a vector index
+    Args:
+        num_rows: Rows in the table
+        dim: Vector dimension
+        index_type: lancedb vector index type
+    Returns:
+        dict of create_index keyword arguments
+    """
+    if "HNSW" in index_type:
+        # The HNSW graph does the fine-grained search, partitions only keep graphs small
+        params = {"num_partitions": max(1, num_rows // 1_048_576)}
+    else:
+        params = {"num_partitions": max(1, int(math.sqrt(num_rows)))}
+    if index_type.endswith("PQ"):
+        # 16 dimensions per sub-vector where the dimension allows it, smaller otherwise
+        sub_vector_dim = next(d for d in (16, 8, 4, 2, 1) if dim % d == 0)
+        params["num_sub_vectors"] = dim // sub_vector_dim
+    return params
+
+
+def ensure_scalar_indices(table, columns):
+    """
+    Create the missing scalar indices, existing ones are kept up to date by table.optimize().
+    Empty tables are left alone and get theirs on a later call
+    """
+    if table.count_rows() == 0:
+        return
+    indexed = {tuple(index.columns) for index in table.list_indices()}
+    for column in columns:
+        if (column,) not in indexed:
+            table.create_scalar_index(column, index_type="BTREE", replace=True)
+
+
+def has_vector_index(table, column):
+    return any(index.columns == [column] for index in table.list_indices())
+
+
+def ensure_vector_index(table, column, dim, min_rows=None):
+    """
+    Build an ANN index on column once the table reaches min_rows. Existing indices are
+    kept up to date by table.optimize() after incremental updates
+    Args:
+        table: lancedb table
+        column: Vector column name
+        dim: Vector dimension
+        min_rows: Row threshold, defaults to BASICMCP_ANN_MIN_ROWS
+    Returns:
+        True if an index was created
+    """
+    num_rows = table.count_rows()
+    if num_rows < (ANN_MIN_ROWS if min_rows is None else min_rows) or has_vector_index(table, column):
+        return False
+    params = index_params(num_rows, dim)
+    logger.info("Creating %s index on %s (%d rows, %s)", ANN_INDEX_TYPE, column, num_rows, params)
+    table.create_index(
+        metric=ANN_METRIC,
+        vector_column_name=column,
+        index_type=ANN_INDEX_TYPE,
+        replace=True,
+        **params,
+    )
+    return True
+
+
+def tune_search(query, nprobes=None, refine_factor=None):
+    """
+    Apply the distance metric and ANN tunables to a vector or hybrid query
+    Args:
+        query: lancedb query builder
+        nprobes: IVF partitions to probe, more is slower and more accurate
+        refine_factor: Re-rank refine_factor * limit candidates with the full vectors
+    """
+    query = query.distance_type(ANN_METRIC)
+    nprobes = nprobes or DEFAULT_NPROBES
+    refine_factor = refine_factor or DEFAULT_REFINE_FACTOR
+    if nprobes:
+        query = query.nprobes(nprobes)
+    if refine_factor:
+        query = query.refine_factor(refine_factor)
+    return query
@@ -1,7 +1,31 @@
+import os
 from pathlib import Path
+from urllib.parse import urlparse
+
+# Codebases given as one of these are repositories to fetch rather than local directories
+REPOSITORY_URL_SCHEMES = ('http://', 'https://', 'file://')
+
+
+def is_repository_url(codebase_path: str) -> bool:
+    return codebase_path.startswith(REPOSITORY_URL_SCHEMES)
+
+
+def repo_path(url):
+    """owner/name of a repository URL, without a trailing .git"""
+    path = urlparse(url).path.strip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    return path
+
+
+def repo_name(url):
+    return repo_path(url).split("/")[-1]
+
 
 def get_project_slug(codebase_path: str) -> str:
-    """Generate a unique project slug based on the path"""
+    """Generate a unique project slug based on the path, repository URLs are named after the repository"""
+    if is_repository_url(codebase_path):
+        return repo_name(codebase_path)
     #path_hash = hashlib.md5(codebase_path.encode()).hexdigest()[:8]
     base_name = Path(codebase_path).name
     #return f"{base_name}_{path_hash}"
@@ -9,9 +33,11 @@ def get_project_slug(codebase_path: str) -> str:
 
 
 def get_central_storage_dir() -> Path:
-    """Get the central storage directory for all project artifacts"""
-    home_dir = Path.home()
-    storage_dir = home_dir / ".basicmcp" / "codeqa_indices"
+    """Get the central storage directory for all project artifacts, BASICMCP_STORAGE_DIR overrides it"""
+    if os.getenv("BASICMCP_STORAGE_DIR"):
+        storage_dir = Path(os.getenv("BASICMCP_STORAGE_DIR"))
+    else:
+        storage_dir = Path.home() / ".basicmcp" / "codeqa_indices"
     storage_dir.mkdir(parents=True, exist_ok=True)
     return storage_dir
 
@@ -24,4 +50,21 @@ def list_codebases():
         
     folders = [folder.name for folder in storage_path.iterdir() if folder.is_dir()]
 
-    return folders
\ No newline at end of file
+    return folders
+
+
+# Markdown/shell rows and the empty-table placeholder of a class table, every column "empty"
+SPECIAL_ROWS = "class_name = 'empty' AND constructor_declaration = 'empty'"
+
+
+def sql_string(value: str) -> str:
+    """Quote a value for use in a LanceDB filter expression"""
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def in_filter(column: str, values) -> str:
+    return f"{column} IN ({', '.join(sql_string(value) for value in values)})"
+
+
+def file_filter(file_paths, column: str = "file_path") -> str:
+    return in_filter(column, file_paths)
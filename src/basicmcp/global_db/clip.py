@@ -0,0 +1,92 @@
+"""
+open-clip loaded through its public API, so that embedding whole batches does not depend on the
+private attributes of lancedb's open-clip embedding function
+"""
+
+
+class OpenClipEncoder:
+    """
+    An open-clip model with its image transform and tokenizer, run on whole batches of tensors. Offers
+    ndims and compute_query_embeddings like a lancedb embedding function
+    """
+
+    def __init__(self, name="ViT-B-32", pretrained="laion2b_s34b_b79k", device="cpu", normalize=True, **options):
+        """
+        Args:
+            name: open-clip architecture
+            pretrained: open-clip checkpoint tag, "" for random weights
+            device: Torch device the model runs on
+            normalize: Scale the vectors to unit length
+            options: Options of the lancedb embedding function (max_retries, batch_size), not used here
+        """
+        import open_clip
+
+        self.name = name
+        self.device = device
+        self.normalize = normalize
+        self.model, _, self.preprocess = open_clip.create_model_and_transforms(name, pretrained=pretrained,
+                                                                               device=device)
+        self.model.eval()
+        self.tokenizer = open_clip.get_tokenizer(name)
+        self._ndims = None
+
+    def ndims(self):
+        if self._ndims is None:
+            self._ndims = len(self.encode_texts(["foo"])[0])
+        return self._ndims
+
+    def encode_texts(self, texts, batch_size=64):
+        """
+        Args:
+            texts: List of strings
+            batch_size: Texts per forward pass
+        Returns:
+            list: One numpy vector per text
+        """
+        return self._encode(self.model.encode_text, texts, self.tokenizer, batch_size)
+
+    def encode_images(self, pixels, batch_size=64):
+        """
+        Args:
+            pixels: Image tensors, as returned by preprocess
+            batch_size: Images per forward pass
+        Returns:
+            list: One numpy vector per image
+        """
+        import torch
+
+        return self._encode(self.model.encode_image, pixels, torch.stack, batch_size)
+
+    def compute_query_embeddings(self, query, *args, **kwargs):
+        """
+        Args:
+            query: A text or a PIL image
+        Returns:
+            list: The query's vector
+        """
+        if isinstance(query, str):
+            return self.encode_texts([query])
+        return self.encode_images([self.preprocess(query)])
+
+    def _encode(self, encode, inputs, collate, batch_size):
+        """
+        Run encode once per batch_size inputs
+        Args:
+            collate: Turns a list of inputs into the model's batch tensor, e.g. the tokenizer or torch.stack
+        """
+        import torch
+
+        vectors = []
+        batch_size = max(1, batch_size)
+        for offset in range(0, len(inputs), batch_size):
+            batch = collate(inputs[offset:offset + batch_size])
+            with torch.no_grad():
+                features = encode(batch.to(self.device))
+                if self.normalize:
+                    features = features / features.norm(dim=-1, keepdim=True)
+            vectors.extend(features.cpu().numpy())
+        return vectors
+
+
+# lancedb registry names loaded through an encoder of this module instead of the registry
+ENCODERS = {"open-clip": OpenClipEncoder}
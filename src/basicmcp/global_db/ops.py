@@ -1,38 +1,20 @@
-import lancedb
-import logging
 import base64
-import re
-import mcp
-from pathlib import Path
+import binascii
+import glob
+from mcp import types
 from io import BytesIO
+from pathlib import Path
 from PIL import Image
 from typing import Optional, Union, List, Tuple
-from lancedb.pydantic import LanceModel, Vector
-from lancedb.embeddings import get_registry
+from basicmcp.global_db.service import get_global_db, make_thumbnail, open_image, sniff_format
 
-## TODO: switch to cloud and figure out simple ways to allow users to provide cloud auth
-LOCAL_STORAGE_DIR = Path.home() / ".basicmcp" 
-TBL_NAME = "globalDB"
-MODEL = None
+# Image formats of MCP image content
+VIEWABLE_FORMATS = {"png", "jpeg", "gif", "webp"}
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".gif", ".bmp", ".webp", ".tif", ".tiff"}
 
 def get_global_table():
-    model = get_registry().get("open-clip").create(max_retries=0) if MODEL is None else MODEL
-
-    class Schema(LanceModel):
-        text: str = model.SourceField()
-        img: bytes = model.SourceField()
-        vector_img: Vector(model.ndims()) = model.VectorField()
-        vector_txt: Vector(model.ndims()) = model.VectorField()
-    
-    db = lancedb.connect(LOCAL_STORAGE_DIR)
-    if "globalDB" in db:
-        return db["globalDB"]
-    else:
-        try:
-            return db.create_table("globalDB", schema=Schema)
-        except Exception as e:
-            import pdb; pdb.set_trace()
-            return f"Error: {e}"
+    """The global table, opened once per process"""
+    return get_global_db().table
 
 def pil_to_bytes(pil_image, format="PNG"):
     """
@@ -50,92 +32,157 @@ def pil_to_bytes(pil_image, format="PNG"):
     img_byte_arr.seek(0)  # Move to the beginning of BytesIO object
     return img_byte_arr.getvalue()
 
-def is_base64_image(string):
-    # Check if the string matches base64 pattern
-    pattern = r'^[A-Za-z0-9+/]+={0,2}$'
-    
-    # If the string starts with a data URL prefix, remove it
+def base64_payload(string):
+    """The base64 part of a data:image URL, or the string itself"""
     if string.startswith('data:image'):
-        # Extract the base64 part
-        try:
-            string = string.split(',')[1]
-        except IndexError:
-            return False
-    
-    # Check if string matches base64 pattern
-    if not re.match(pattern, string):
-        return False
-        # Try to decode the string
+        return string.partition(',')[2]
+    return string
+
+def is_base64_image(string):
+    """
+    Cheap check of a base64 image: only the first 16 characters are decoded and their
+    magic bytes compared with the known image formats
+    """
     try:
-        image_data = base64.b64decode(string)
-        # Try to open it as an image
-        img = Image.open(BytesIO(image_data))
-        img.verify()  # Verify it's an image
-        return True
-    except Exception:
+        head = base64.b64decode(base64_payload(string)[:16], validate=True)
+    except (binascii.Error, ValueError):
         return False
-    
-    return True
-def create_empty_image(size=(1, 1), color='white'):
+    return sniff_format(head) is not None
+
+def to_image_bytes(img):
     """
-    Create an empty PIL Image.
-    
+    Encoded image of one ingest_data element, dispatched on its own type. Encoded bytes and
+    memoryviews pass through untouched, paths are read by the service as they are
     Args:
-        size: Tuple of (width, height)
-        color: Background color
-        
-    Returns:
-        PIL Image object
+        img: bytes, bytearray, memoryview, PIL image, base64 string/data URL or file path
     """
-    return Image.new('RGB', size, color)
+    if img is None or isinstance(img, (bytes, bytearray, memoryview, Path)):
+        return img
+    if isinstance(img, Image.Image):
+        return pil_to_bytes(img)
+    if isinstance(img, str):
+        if is_base64_image(img):
+            return base64.b64decode(base64_payload(img))
+        return img
+    raise TypeError(f"Unsupported image type {type(img).__name__}")
 
-def ingest_data(texts: Optional[List[str]] = None, imgs: Optional[List[Union[bytes, Image.Image, str]]] = None):
+def ingest_data(texts: Optional[List[str]] = None,
+                imgs: Optional[List[Union[bytes, memoryview, Image.Image, str]]] = None):
     if imgs is None and texts is None:
         raise ValueError("Either text or img must be provided")
-    
-    if imgs is None:
-        empty_img = create_empty_image()
-        imgs = [pil_to_bytes(empty_img)] * len(texts)
-    elif isinstance(imgs[0], Image.Image):
-        imgs = [pil_to_bytes(img) for img in imgs]
-    elif is_base64_image(imgs[0]):
-        logging.info("Decoding base64 image")
-        imgs = [base64.b64decode(img) for img in imgs]
-    elif isinstance(imgs[0], str):
-        imgs = [pil_to_bytes(Image.open(img)) for img in imgs]
 
-    if texts is None:
-        texts = [""] * len(imgs)
-        
     try:
-        table = get_global_table()
-        table.add([
-            {
-                "text": text,
-                "img": img,
-        
-            }
-            for text, img in zip(texts, imgs)
-        ])
+        if imgs is None:
+            # Text-only rows, no image is stored or embedded
+            imgs = [None] * len(texts)
+        else:
+            imgs = [to_image_bytes(img) for img in imgs]
+
+        if texts is None:
+            texts = [None] * len(imgs)
+
+        total = get_global_db().add(texts, imgs)
     except Exception as e:
         return f"Error: {e}"
     
-    return f"Data ingested successfully! total length of table is {len(table)}"
+    return f"Data ingested successfully! total length of table is {total}"
     
-def query_db(text: Optional[str] = None, img: Optional[Image] = None) -> Tuple[ List[Image], List[str] ]:
-    if img is None and text is None:
-        raise ValueError("Either text or img must be provided")
+def image_files(pattern: str) -> List[Path]:
+    """
+    Image files of a directory (recursively), a single file or a glob pattern, in sorted order
+    """
+    path = Path(pattern).expanduser()
+    if path.is_dir():
+        candidates = path.rglob("*")
+    elif path.is_file():
+        return [path]
+    else:
+        candidates = map(Path, glob.glob(str(path), recursive=True))
+    return sorted(p for p in candidates if p.suffix.lower() in IMAGE_SUFFIXES and p.is_file())
 
-    query = text or img
-    vector_column_name = "vector_txt" if text else "vector_img"
-    table = get_global_table()
-    rs = table.search(query, vector_column_name=vector_column_name, query_type="vector").limit(10).to_df()
+def ingest_images(source, progress=None, **options) -> dict:
+    """
+    Bulk image ingestion into the global database
+    Args:
+        source: Directory, image file or glob pattern, or an iterable of image paths, encoded bytes
+            or (image, text) pairs
+        progress: Optional callback progress(stage, **counts)
+        options: Keyword arguments of GlobalDB.ingest_images, e.g. batch_size, workers, max_side
+    Returns:
+        dict: images_ingested, images_failed and total_rows
+    """
+    if isinstance(source, (str, Path)):
+        files = image_files(str(source))
+        if not files:
+            raise ValueError(f"No images found at {source}")
+        options.setdefault("total", len(files))
+        source = files
+    return get_global_db().ingest_images(source, progress=progress, **options)
 
-    images = rs["img"].tolist()
-    texts = rs["text"].tolist()
-    images = [Image.open(BytesIO(img)) for img in images if img != b""]
-    texts = [txt for txt in texts if txt!= ""]
-    
-    return images, texts
+def viewable_image(data, format=None):
+    """
+    A stored image in a format MCP clients display, other formats are converted to PNG
+    Returns:
+        tuple: (encoded bytes, format)
+    """
+    format = format or sniff_format(data)
+    if format in VIEWABLE_FORMATS:
+        return data, format
+    return pil_to_bytes(open_image(data)), "png"
 
+def query_db(text: Optional[str] = None, img: Optional[Image.Image] = None, limit: int = 10, offset: int = 0,
+             max_distance: Optional[float] = None, full_images: bool = False) -> Tuple[List[dict], List[dict]]:
+    """
+    Search the global database without reading vectors. Image matches carry their stored thumbnail,
+    rows stored before thumbnails get one made from their image, and full_images returns the stored
+    images (BMP and TIFF as PNG, which MCP clients can show); open_image decodes one when needed
+    Args:
+        text: Text query
+        img: Image query, used when no text is given
+        limit: Matches per modality
+        offset: Matches to skip per modality, for paging
+        max_distance: Leave out matches further than this, None keeps all
+        full_images: Return the stored images instead of thumbnails
+    Returns:
+        tuple: (image matches, text matches) as lists of dicts with text, _distance and for images
+            preview (encoded bytes) and preview_format
+    """
+    if img is None and text is None:
+        raise ValueError("Either text or img must be provided")
+
+    # CLIP embeds texts and images into one space, images and texts are each matched on their own vectors
+    global_db = get_global_db()
+    image_rows, text_rows = (
+        rows.to_pylist() for rows in global_db.search_modalities(text or img, limit, offset, max_distance)
+    )
+    stored = global_db.images([row["_rowid"] for row in image_rows if full_images or row["thumbnail"] is None])
+    for row in image_rows:
+        thumbnail = row.pop("thumbnail")
+        if full_images:
+            row["preview"], row["preview_format"] = viewable_image(*stored[row["_rowid"]])
+        elif thumbnail is None:
+            row["preview"], row["preview_format"] = make_thumbnail(open_image(stored[row["_rowid"]][0])), "jpeg"
+        else:
+            row["preview"], row["preview_format"] = thumbnail, "jpeg"
+    return image_rows, text_rows
 
+def result_content(image_rows: List[dict], text_rows: List[dict], offset: int = 0) -> list:
+    """
+    MCP content of query_db results: a caption and an image per image match, then the text matches.
+    The previews are sent without re-encoding them
+    """
+    content = []
+    for rank, row in enumerate(image_rows, start=offset + 1):
+        caption = f"Image match {rank} (distance {row['_distance']:.3f})"
+        if row["text"]:
+            caption += f": {row['text']}"
+        content.append(types.TextContent(type="text", text=caption))
+        content.append(types.ImageContent(type="image", data=base64.b64encode(row["preview"]).decode(),
+                                          mimeType=f"image/{row['preview_format']}"))
+    if text_rows:
+        lines = [f"{rank}. (distance {row['_distance']:.3f}) {row['text']}"
+                 for rank, row in enumerate(text_rows, start=offset + 1)]
+        content.append(types.TextContent(type="text", text="Text matches:\n" + "\n".join(lines)))
+    if not content:
+        content.append(types.TextContent(type="text", text="No matches."))
+    return content
@@ -0,0 +1,554 @@
+import os
+import time
+import logging
+import threading
+from io import BytesIO
+from pathlib import Path
+from typing import Any, NamedTuple, Optional
+from functools import partial
+from itertools import islice
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+import lancedb
+import pyarrow as pa
+from lancedb.pydantic import LanceModel, Vector
+from lancedb.embeddings import get_registry
+from basicmcp.global_db.clip import ENCODERS, OpenClipEncoder
+
+logger = logging.getLogger(__name__)
+
+## TODO: switch to cloud and figure out simple ways to allow users to provide cloud auth
+LOCAL_STORAGE_DIR = Path.home() / ".basicmcp"
+TBL_NAME = "globalDB"
+# lancedb embedding registry name of the multimodal model
+GLOBALDB_MODEL = os.getenv("BASICMCP_GLOBALDB_MODEL", "open-clip")
+# Load the model at server start, off by default since CLIP takes hundreds of MB
+GLOBALDB_WARM_UP = os.getenv("BASICMCP_GLOBALDB_WARM_UP", "0") == "1"
+# Images embedded and written per batch by ingest_images
+GLOBALDB_BATCH_SIZE = int(os.getenv("BASICMCP_GLOBALDB_BATCH_SIZE", "64"))
+# Threads decoding and resizing images, PIL releases the GIL while it does
+GLOBALDB_WORKERS = int(os.getenv("BASICMCP_GLOBALDB_WORKERS", str(min(8, os.cpu_count() or 1))))
+# Longest side of images stored by ingest_images, 0 keeps the original size. CLIP sees 224px
+GLOBALDB_IMAGE_SIZE = int(os.getenv("BASICMCP_GLOBALDB_IMAGE_SIZE", "512"))
+# Longest side of the JPEG thumbnail stored with every image for result previews
+THUMBNAIL_SIZE = int(os.getenv("BASICMCP_GLOBALDB_THUMBNAIL_SIZE", "128"))
+# Leading bytes of the formats stored as they are, WEBP is checked separately (RIFF....WEBP)
+IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp"),
+    (b"II*\x00", "tiff"),
+    (b"MM\x00*", "tiff"),
+)
+# Columns returned by search_modalities, the vectors and full images stay on disk
+RESULT_COLUMNS = ("text", "format", "thumbnail")
+# Table the rows of a legacy table are migrated into before they replace it
+MIGRATION_SUFFIX = "_migrating"
+# Formats a resized image is written back in, the others become PNG
+SAVE_FORMATS = {"png": "PNG", "jpeg": "JPEG", "webp": "WEBP"}
+
+
+def no_progress(stage, **counts):
+    """Progress callback used when nobody is listening"""
+
+
+class PreparedImage(NamedTuple):
+    """An image as stored: encoded bytes, their format and a JPEG thumbnail, plus the model input if prepared for it"""
+    data: bytes
+    format: str
+    thumbnail: bytes
+    pixels: Any = None
+
+
+class GlobalDB:
+    """
+    The global table with its embedding model and connection, created on first use and then kept
+    for the life of the process. Records the latency of every operation
+    """
+
+    def __init__(self, uri=LOCAL_STORAGE_DIR, table_name=TBL_NAME, model_name=GLOBALDB_MODEL, model_options=None):
+        """
+        Args:
+            uri: LanceDB directory
+            table_name: Name of the table
+            model_name: Embedding function name in the lancedb registry
+            model_options: Keyword arguments of the embedding function
+        """
+        self.uri = uri
+        self.table_name = table_name
+        self.model_name = model_name
+        self.model_options = {"max_retries": 0} if model_options is None else model_options
+        self._model = None
+        self._schema = None
+        self._db = None
+        self._table = None
+        self._lock = threading.RLock()
+        # Held while the table is opened (and migrated), apart from _lock so latency() and the model stay usable
+        self._open_lock = threading.Lock()
+        self._latency = {}
+
+    @contextmanager
+    def timed(self, operation):
+        """Record the wall time of the block under operation"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            with self._lock:
+                stats = self._latency.setdefault(operation, {"count": 0, "total_ms": 0.0, "last_ms": 0.0})
+                stats["count"] += 1
+                stats["total_ms"] += elapsed_ms
+                stats["last_ms"] = elapsed_ms
+
+    def latency(self):
+        """
+        Returns:
+            dict: operation -> {count, last_ms, mean_ms}
+        """
+        with self._lock:
+            return {
+                operation: {
+                    "count": stats["count"],
+                    "last_ms": round(stats["last_ms"], 1),
+                    "mean_ms": round(stats["total_ms"] / stats["count"], 1),
+                }
+                for operation, stats in self._latency.items()
+            }
+
+    @property
+    def model(self):
+        with self._lock:
+            if self._model is None:
+                encoder = ENCODERS.get(self.model_name)
+                with self.timed("load_model"):
+                    if encoder is not None:
+                        self._model = encoder(**self.model_options)
+                    else:
+                        self._model = get_registry().get(self.model_name).create(**self.model_options)
+                logger.info("Loaded %s in %.0f ms", self.model_name, self._latency["load_model"]["last_ms"])
+                if encoder is None:
+                    logger.warning("%s has no batched encoder, images and texts are embedded one at a time",
+                                   self.model_name)
+            return self._model
+
+    @property
+    def schema(self):
+        with self._lock:
+            if self._schema is None:
+                ndims = self.model.ndims()
+
+                # Plain vector columns: lancedb would create a new instance of the embedding function
+                # from the table metadata on every add, the vectors are computed with self.model instead.
+                # A row holds a text, an image or both, the vector of a missing modality is null and
+                # vector search skips it
+                class Schema(LanceModel):
+                    text: Optional[str] = None
+                    img: Optional[bytes] = None
+                    format: Optional[str] = None
+                    thumbnail: Optional[bytes] = None
+                    vector_img: Optional[Vector(ndims)] = None
+                    vector_txt: Optional[Vector(ndims)] = None
+
+                self._schema = Schema
+            return self._schema
+
+    @property
+    def table(self):
+        if self._table is None:
+            self.open()
+        return self._table
+
+    def _connect(self):
+        if self._db is None:
+            self._db = lancedb.connect(self.uri)
+        return self._db
+
+    def open(self):
+        """
+        Open or create the table, migrating a table of an earlier version first. Runs once, threads
+        arriving meanwhile wait for it and get the opened table
+        Returns:
+            The lancedb table
+        """
+        with self._open_lock:
+            if self._table is None:
+                with self.timed("open_table"):
+                    db = self._connect()
+                    if self.table_name in db:
+                        table = db.open_table(self.table_name)
+                        if is_legacy_table(table):
+                            with self.timed("migrate"):
+                                table = self._migrate(table)
+                            logger.info("Migrated %s in %.0f ms", self.table_name, self._latency["migrate"]["last_ms"])
+                        elif "thumbnail" not in table.schema.names:
+                            # Rows written before formats and thumbnails were stored keep nulls there
+                            table.add_columns({"format": "CAST(NULL AS STRING)",
+                                               "thumbnail": "CAST(NULL AS BINARY)"})
+                    else:
+                        table = db.create_table(self.table_name, schema=self.schema)
+                    self._table = table
+            return self._table
+
+    def migrate_legacy(self):
+        """
+        Open the table now if an earlier version left it to migrate, called at server start so that
+        no request waits on the migration. Does not load the model otherwise
+        Returns:
+            bool: Whether the table was migrated
+        """
+        with self._open_lock:
+            if self._table is not None or self.table_name not in self._connect():
+                return False
+            if not is_legacy_table(self._connect().open_table(self.table_name)):
+                return False
+        self.open()
+        return True
+
+    @property
+    def preprocess(self):
+        """The model's image transform, run by the decode threads, None when the model has no batch path"""
+        model = self.model
+        return model.preprocess if is_batched(model) else None
+
+    def embed_texts(self, texts, batch_size=GLOBALDB_BATCH_SIZE):
+        model = self.model
+        with self.timed("embed"):
+            if not is_batched(model):
+                return [model.compute_query_embeddings(text)[0] for text in texts]
+            return model.encode_texts(texts, batch_size)
+
+    def embed_images(self, images, batch_size=GLOBALDB_BATCH_SIZE):
+        """
+        Args:
+            images: PreparedImages, or encoded bytes, bytearray or memoryview read in place
+            batch_size: Images per forward pass
+        """
+        model = self.model
+        data = [image.data if isinstance(image, PreparedImage) else image for image in images]
+        with self.timed("embed"):
+            if not is_batched(model):
+                return model.compute_source_embeddings([open_image(image) for image in data])
+            # Images prepared in the decode pool already carry their tensors
+            pixels = [image.pixels if isinstance(image, PreparedImage) and image.pixels is not None
+                      else model.preprocess(open_image(image_data)) for image, image_data in zip(images, data)]
+            return model.encode_images(pixels, batch_size)
+
+    def rows(self, texts, imgs, batch_size=GLOBALDB_BATCH_SIZE):
+        """
+        Table rows with the vectors of the modalities present, each encoder only sees its own inputs
+        Args:
+            texts: List of texts, None or "" where a row has no text
+            imgs: List of PreparedImages, encoded images or image paths, None where a row has no image
+            batch_size: Inputs per forward pass of the model
+        """
+        texts = [text or None for text in texts]
+        preprocess = self.preprocess
+        images = [img if img is None or isinstance(img, PreparedImage)
+                  else prepare_image(img, max_side=0, preprocess=preprocess) for img in imgs]
+        vectors_txt = _embed_present(texts, partial(self.embed_texts, batch_size=batch_size))
+        vectors_img = _embed_present(images, partial(self.embed_images, batch_size=batch_size))
+        return [
+            {
+                "text": text,
+                "img": image and image.data,
+                "format": image and image.format,
+                "thumbnail": image and image.thumbnail,
+                "vector_txt": vector_txt,
+                "vector_img": vector_img,
+            }
+            for text, image, vector_txt, vector_img in zip(texts, images, vectors_txt, vectors_img)
+        ]
+
+    def add(self, texts, imgs):
+        """
+        Embed and add rows
+        Args:
+            texts: List of texts, None or "" where a row has no text
+            imgs: List of encoded images or image paths aligned with texts, None where a row has no image
+        Returns:
+            int: Row count of the table
+        """
+        rows = self.rows(texts, imgs)
+        table = self.table
+        with self.timed("add"):
+            table.add(rows)
+            return table.count_rows()
+
+    def ingest_images(self, sources, batch_size=GLOBALDB_BATCH_SIZE, workers=GLOBALDB_WORKERS,
+                      max_side=GLOBALDB_IMAGE_SIZE, total=None, progress=None):
+        """
+        Bulk ingestion. Images are decoded, resized and turned into model inputs in a thread pool one
+        batch ahead of the batch being embedded in one forward pass, and every batch is written as it
+        is done, so memory stays at about two batches
+        Args:
+            sources: Iterable of image paths or encoded bytes/memoryviews, or (image, text) pairs
+            batch_size: Images embedded and written at a time
+            workers: Decoding threads
+            max_side: Longest side of the stored images, 0 keeps the original size
+            total: Number of sources if known, reported with the progress
+            progress: Optional callback progress(stage, **counts), called after every batch
+        Returns:
+            dict: images_ingested, images_failed and total_rows
+        """
+        progress = progress or no_progress
+        counts = {"images_total": total, "images_ingested": 0, "images_failed": 0}
+        progress("ingesting images", **counts)
+        table = self.table
+        arrow_schema = self.schema.to_arrow_schema()
+        preprocess = self.preprocess
+        sources = iter(sources)
+
+        def submit(pool):
+            batch = [source if isinstance(source, tuple) else (source, None)
+                     for source in islice(sources, max(1, batch_size))]
+            return [(pool.submit(prepare_image, image, max_side, preprocess), image, text) for image, text in batch]
+
+        with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="globaldb-decode") as pool:
+            pending = submit(pool)
+            try:
+                while pending:
+                    current, pending = pending, submit(pool)
+                    texts, imgs = [], []
+                    for future, image, text in current:
+                        try:
+                            imgs.append(future.result())
+                            texts.append(text)
+                        except Exception as e:
+                            counts["images_failed"] += 1
+                            logger.warning("Skipping image %s: %s", _describe(image), str(e))
+                    if imgs:
+                        batch = pa.Table.from_pylist(self.rows(texts, imgs, batch_size), schema=arrow_schema)
+                        with self.timed("add"):
+                            table.add(batch)
+                        counts["images_ingested"] += len(imgs)
+                    progress("ingesting images", **counts)
+            finally:
+                for future, _, _ in pending:
+                    future.cancel()
+
+        logger.info("Ingested %d images into %s, %d failed", counts["images_ingested"], self.table_name,
+                    counts["images_failed"])
+        return {"images_ingested": counts["images_ingested"], "images_failed": counts["images_failed"],
+                "total_rows": table.count_rows()}
+
+    def search(self, query, vector_column_name, limit=10):
+        """
+        Vector search
+        Args:
+            query: A text or a PIL image
+            vector_column_name: vector_txt or vector_img
+        Returns:
+            pandas.DataFrame
+        """
+        model = self.model
+        with self.timed("embed"):
+            vector = model.compute_query_embeddings(query)[0]
+        table = self.table
+        with self.timed("search"):
+            return table.search(vector, vector_column_name=vector_column_name).limit(limit).to_df()
+
+    def search_modalities(self, query, limit=10, offset=0, max_distance=None, columns=RESULT_COLUMNS):
+        """
+        Embed the query once and search the image and text vectors, rows without the modality are skipped
+        Args:
+            query: A text or a PIL image
+            limit: Matches per modality
+            offset: Matches to skip per modality, for paging
+            max_distance: Leave out matches further than this (squared L2 distance), None keeps all
+            columns: Columns to read, _distance and _rowid are always included
+        Returns:
+            tuple: (image matches, text matches) as pyarrow Tables
+        """
+        model = self.model
+        with self.timed("embed"):
+            vector = model.compute_query_embeddings(query)[0]
+        table = self.table
+
+        def run(column):
+            builder = (table.search(vector, vector_column_name=column)
+                       .select([*columns, "_distance"]).with_row_id(True).offset(offset).limit(limit))
+            if max_distance is not None:
+                builder = builder.distance_range(upper_bound=max_distance)
+            return builder.to_arrow()
+
+        with self.timed("search"):
+            return run("vector_img"), run("vector_txt")
+
+    def images(self, row_ids):
+        """
+        Stored images of rows found by search_modalities
+        Args:
+            row_ids: _rowid values
+        Returns:
+            dict: row id -> (encoded image, format)
+        """
+        if not row_ids:
+            return {}
+        with self.timed("take"):
+            rows = self.table.take_row_ids(list(row_ids)).with_row_id().select(["img", "format"]).to_arrow()
+        return {row["_rowid"]: (row["img"], row["format"]) for row in rows.to_pylist()}
+
+    def _migrate(self, legacy, batch_size=None):
+        """
+        Rewrite a table created by earlier versions: placeholder images and empty texts become nulls,
+        and the vectors are recomputed per modality (both used to come from the image). Rows are
+        re-embedded a batch at a time into a staging table, which then replaces the old table in a
+        single overwrite, a failure leaves the old table as it was
+        Args:
+            legacy: The table to migrate
+            batch_size: Rows re-embedded per batch
+        Returns:
+            The migrated table
+        """
+        batch_size = batch_size or GLOBALDB_BATCH_SIZE
+        total = legacy.count_rows()
+        logger.info("Migrating %d rows of %s to per-modality vectors", total, self.table_name)
+        arrow_schema = self.schema.to_arrow_schema()
+        staging_name = self.table_name + MIGRATION_SUFFIX
+        staging = self._db.create_table(staging_name, schema=self.schema, mode="overwrite")
+        migrated = 0
+        for batch in legacy.search().select(["text", "img"]).limit(None).to_batches(batch_size):
+            rows = self.rows(
+                batch.column("text").to_pylist(),
+                [None if is_placeholder_image(img) else img for img in batch.column("img").to_pylist()],
+                batch_size,
+            )
+            staging.add(pa.Table.from_pylist(rows, schema=arrow_schema))
+            migrated += len(rows)
+            logger.info("Migrated %d of %d rows", migrated, total)
+        data = staging.search().limit(None).to_batches(batch_size) if migrated else None
+        table = self._db.create_table(self.table_name, data=data, schema=self.schema, mode="overwrite")
+        self._db.drop_table(staging_name)
+        return table
+
+    def warm_up(self, background=True):
+        """
+        Load the model and open the table ahead of the first request
+        Args:
+            background: Load in a daemon thread instead of blocking the caller
+        """
+        def _load():
+            try:
+                _ = self.model, self.table
+            except Exception as e:
+                logger.warning("Global database warm-up failed: %s", str(e))
+
+        if not background:
+            _load()
+            return None
+        thread = threading.Thread(target=_load, name="globaldb-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+
+def is_batched(model):
+    """Models loaded through an encoder of ours are run on whole batches of tensors instead of one input per call"""
+    return isinstance(model, OpenClipEncoder)
+
+
+def _embed_present(values, embed):
+    """embed the values that are not None, None for the others"""
+    present = [i for i, value in enumerate(values) if value is not None]
+    vectors = [None] * len(values)
+    if present:
+        for i, vector in zip(present, embed([values[i] for i in present])):
+            vectors[i] = vector
+    return vectors
+
+
+def sniff_format(data):
+    """Image format from the leading bytes, None when it is not a stored format"""
+    head = bytes(memoryview(data)[:12])
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "webp"
+    for signature, format in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return format
+    return None
+
+
+def open_image(data):
+    """PIL image over encoded bytes, bytearray or memoryview without copying them"""
+    from PIL import Image
+
+    return Image.open(pa.BufferReader(data))
+
+
+def make_thumbnail(image, size=THUMBNAIL_SIZE):
+    """JPEG thumbnail of a PIL image, which is downscaled in place"""
+    image.draft("RGB", (size, size))
+    image.thumbnail((size, size))
+    if image.mode not in ("RGB", "L"):
+        image = image.convert("RGB")
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=80)
+    return buffer.getvalue()
+
+
+def prepare_image(source, max_side=GLOBALDB_IMAGE_SIZE, preprocess=None):
+    """
+    Encoded bytes, format and thumbnail of an image. The bytes are kept as they are unless the
+    image is larger than max_side, then it is downscaled and written in its own format where possible.
+    The image is decoded once for all of it
+    Args:
+        source: Image path, or encoded bytes, bytearray or memoryview
+        max_side: Longest side of the stored image, 0 keeps the original size
+        preprocess: Optional model transform, its result is kept as the pixels
+    Returns:
+        PreparedImage
+    """
+    data = Path(source).read_bytes() if isinstance(source, (str, Path)) else source
+    format = sniff_format(data)
+    if format is None:
+        raise ValueError("Not a PNG, JPEG, GIF, WEBP, BMP or TIFF image")
+    image = open_image(data)
+    if max_side and max(image.size) > max_side:
+        # JPEGs are decoded at a reduced scale straight away, other formats ignore the draft
+        image.draft("RGB", (max_side, max_side))
+        image.thumbnail((max_side, max_side))
+        format = format if format in SAVE_FORMATS else "png"
+        if format == "jpeg" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+        buffer = BytesIO()
+        image.save(buffer, format=SAVE_FORMATS[format], **({"quality": 90} if format == "jpeg" else {}))
+        data = buffer.getvalue()
+    pixels = preprocess(image) if preprocess is not None else None
+    return PreparedImage(data, format, make_thumbnail(image), pixels)
+
+
+def _describe(image):
+    return f"<{len(image)} bytes>" if isinstance(image, (bytes, bytearray, memoryview)) else str(image)
+
+
+def is_legacy_table(table):
+    """Tables of earlier versions embed through lancedb, or require an image (and a text) in every row"""
+    schema = table.schema
+    return b"embedding_functions" in (schema.metadata or {}) or not schema.field("img").nullable
+
+
+def is_placeholder_image(img):
+    """The 1x1 image earlier versions stored in text-only rows"""
+    if not img:
+        return True
+    from PIL import Image
+
+    try:
+        return Image.open(BytesIO(img)).size == (1, 1)
+    except Exception:
+        return False
+
+
+_GLOBAL_DB = None
+_LOCK = threading.Lock()
+
+
+def get_global_db():
+    """The process-wide GlobalDB shared by the globaldb tools"""
+    global _GLOBAL_DB
+    with _LOCK:
+        if _GLOBAL_DB is None:
+            _GLOBAL_DB = GlobalDB()
+        return _GLOBAL_DB
@@ -1,12 +1,16 @@
-from mcp.server.fastmcp import FastMCP
-from basicmcp.codeqa.index.run_ingestion import run_ingestion
-from basicmcp.codeqa.util import list_codebases
-from basicmcp.codeqa.chat.search import generate_context
-from basicmcp.global_db.ops import ingest_data, query_db, pil_to_bytes
+from mcp.server.fastmcp import FastMCP, Context
+from mcp import types
+from basicmcp.codeqa.util import list_codebases, get_central_storage_dir, get_project_slug
 from typing import List, Tuple, Union, Optional
-from pathlib import Path
+from contextlib import asynccontextmanager
+import os
+import threading
+import asyncio
 import logging
 
+# Tool implementations pull in lancedb, tree-sitter and the embedding backend, so they are
+# imported on first use (or by warm_up) to keep the stdio handshake fast
+
 # Configure logging
 logging.basicConfig(
     level=logging.INFO,
@@ -14,48 +18,208 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-mcp = FastMCP("codeqa")
+# Load the embedding backend in the background once the server is up, BASICMCP_WARMUP=0 disables it
+WARM_UP = os.getenv("BASICMCP_WARMUP", "1") != "0"
+
+@asynccontextmanager
+async def lifespan(server):
+    """Runs once the transport is up, so warming up does not hold back the server start"""
+    if WARM_UP:
+        warm_up()
+    yield {}
+
+mcp = FastMCP("codeqa", lifespan=lifespan)
+
+def warm_up(background: bool = True):
+    """
+    Import the ingestion and search stack and load the embedding backend and reranker ahead of the first tool call
+    Args:
+        background: Load in a daemon thread instead of blocking the caller
+    """
+    def _load():
+        try:
+            import basicmcp.codeqa.index.run_ingestion  # noqa: F401
+            import basicmcp.codeqa.chat.search  # noqa: F401
+            from basicmcp.codeqa.index.embeddings import warm_up as warm_up_embeddings
+            warm_up_embeddings(background=False)
+            from basicmcp.codeqa.chat.rerank import warm_up as warm_up_reranker
+            warm_up_reranker()
+            from basicmcp.global_db.service import GLOBALDB_WARM_UP, get_global_db
+            if GLOBALDB_WARM_UP:
+                get_global_db().warm_up(background=False)
+            else:
+                # A table left by an earlier version is migrated now rather than by the first request
+                get_global_db().migrate_legacy()
+            logger.info("Warm-up finished")
+        except Exception as e:
+            logger.warning("Warm-up failed: %s", str(e))
+
+    if not background:
+        _load()
+        return None
+    thread = threading.Thread(target=_load, name="basicmcp-warm-up", daemon=True)
+    thread.start()
+    return thread
 
 @mcp.tool()
-async def ingest_codebase(dir: str="/Users/ayushchaurasia/Documents/trolo") -> str:
+async def ingest_codebase(dir: str="/Users/ayushchaurasia/Documents/trolo", full: bool = False,
+                          ref: Optional[str] = None, clone_mode: Optional[str] = None,
+                          wait: bool = False, ctx: Context = None) -> str:
     """
-    Add a new codebase to the vector database
+    Add a new codebase to the vector database. Runs in the background and returns a job id,
+    check on it with ingestion_status. Re-ingesting only processes files that changed since the last run
     Args:
         dir: Local path to codebase or github link to public repo
+        full: Rebuild the whole index instead of updating it incrementally
+        ref: Branch, tag or commit SHA to ingest for github links, defaults to the default branch
+        clone_mode: For github links, "mirror" (cached mirror, default), "shallow" (one-off depth-1 clone)
+            or "tree" (read files from the cached mirror without checking them out)
+        wait: Wait for the ingestion to finish, sending progress notifications, instead of returning right away
     """
     try:
-        content = run_ingestion(dir)
-        return f"Added codebase: {content}"
+        from basicmcp.codeqa.index.jobs import submit_ingestion
+        job = submit_ingestion(dir, full=full, ref=ref, clone_mode=clone_mode)
+        if not wait:
+            if job.after is not None:
+                return (f"Queued ingestion job {job.id} for {dir}, it starts once job {job.after.id} with "
+                        f"other options has finished. Check on it with ingestion_status.")
+            return f"Started ingestion job {job.id} for {dir}. Check on it with ingestion_status."
+        await follow_job(job, ctx)
+        return format_job(job)
     except Exception as e:
         logger.error("Error in add_codebase: %s", str(e))
         raise
 
+async def follow_job(job, ctx: Optional[Context] = None, interval: float = 1.0):
+    """Wait for a job without blocking the event loop, reporting its progress to the client"""
+    from basicmcp.codeqa.index.jobs import FINISHED
+    last = None
+    while job.status not in FINISHED:
+        await asyncio.to_thread(job.wait, interval)
+        percent = job.percent()
+        if ctx is not None and percent != last:
+            await ctx.report_progress(percent, 100)
+            last = percent
+
+def format_job(job) -> str:
+    state = job.to_dict()
+    lines = [f"Job {state['job_id']} ({state['codebase']}): {state['status']}"]
+    if state["status"] in ("queued", "running"):
+        lines.append(f"Stage: {state['stage']}, about {state['percent']}% done")
+    lines += [f"{name}: {value}" for name, value in state["progress"].items()]
+    if state["result"] and "project_slug" in state["result"]:
+        lines.append(f"Added codebase: {state['result']['project_slug']}")
+    elif state["result"]:
+        lines += [f"{name}: {value}" for name, value in state["result"].items()]
+    if state["error"]:
+        lines.append(f"Error: {state['error']}")
+    if state["elapsed_seconds"] is not None:
+        lines.append(f"Elapsed: {state['elapsed_seconds']}s")
+    return "\n".join(lines)
+
+@mcp.tool()
+async def ingestion_status(job_id: Optional[str] = None) -> str:
+    """
+    Status and progress of ingestion jobs
+    Args:
+        job_id: Job id returned by ingest_codebase, lists every recent job if omitted
+    """
+    from basicmcp.codeqa.index.jobs import get_job, list_jobs
+    if job_id is None:
+        jobs = list_jobs()
+        return "\n\n".join(format_job(job) for job in jobs) if jobs else "No ingestion jobs."
+    job = get_job(job_id)
+    if job is None:
+        return f"No ingestion job with id {job_id}."
+    return format_job(job)
+
+@mcp.tool()
+async def cancel_ingestion(job_id: str) -> str:
+    """
+    Cancel an ingestion job. A cancelled incremental ingestion keeps the previous index,
+    a cancelled full ingestion leaves the codebase to be ingested again
+    Args:
+        job_id: Job id returned by ingest_codebase
+    """
+    from basicmcp.codeqa.index.jobs import get_job
+    job = get_job(job_id)
+    if job is None:
+        return f"No ingestion job with id {job_id}."
+    job.cancel()
+    return f"Cancellation requested for job {job_id} ({job.status})."
+
+def get_codebase_name(codebase: str) -> str:
+    # The slug ingestion stored the codebase under, repository URLs are named after the repository
+    return get_project_slug(codebase)
+
+def check_codebase(codebase: str) -> Optional[str]:
+    """Return an error message if the codebase has not been ingested"""
+    codebase_name = get_codebase_name(codebase)
+    if (get_central_storage_dir() / codebase_name).is_dir():
+        return None
+
+    # Only list the available codebases for the error message
+    available_codebases = list_codebases()
+    if codebase_name not in available_codebases:
+        available_msg = "\nAvailable codebases:\n" + "\n".join(available_codebases) if available_codebases else "\nNo codebases are currently ingested."
+        return f"Codebase '{codebase_name}' not found. Please ingest it first using ingest_codebase.{available_msg}"
+    return None
+
+async def send_chunk(ctx: Context, progress: int, message: str):
+    """Progress notification carrying partial results, for clients that asked for progress"""
+    meta = ctx.request_context.meta
+    if meta is None or meta.progressToken is None:
+        return
+    await ctx.request_context.session.send_notification(
+        types.ServerNotification(
+            types.ProgressNotification(
+                method="notifications/progress",
+                params=types.ProgressNotificationParams(
+                    progressToken=meta.progressToken, progress=progress, message=message,
+                ),
+            )
+        )
+    )
+
+def chunk_sender(ctx: Optional[Context]):
+    """Thread-safe callback that streams each chunk to the client, None without a request context"""
+    if ctx is None:
+        return None
+    loop = asyncio.get_running_loop()
+    sent = []
+
+    def on_chunk(message):
+        sent.append(message)
+        try:
+            asyncio.run_coroutine_threadsafe(send_chunk(ctx, len(sent), message), loop).result()
+        except Exception as e:
+            logger.warning("Could not stream partial results: %s", str(e))
+    return on_chunk
+
 @mcp.tool()
-async def codeqa(codebase: str, query: str, rerank=True) -> str:
+async def codeqa(codebase: str, query: str, rerank=True, nprobes: Optional[int] = None,
+                 refine_factor: Optional[int] = None, max_tokens: Optional[int] = None,
+                 ctx: Context = None) -> str:
     """
     Talk with codebase
     Args:
         codebase: The codebase to query. Can be a name, github link, or local path
         query: The search query
+        nprobes: Optional, index partitions to search on large codebases. Higher is more accurate but slower
+        refine_factor: Optional, re-rank this many times more candidates with exact distances on large codebases
+        max_tokens: Optional, approximate size limit of the answer. Long code is cut down to signatures to fit
     """
     try:        
-        # Get available codebases
-        available_codebases = list_codebases()
-        
-        # Extract codebase name/slug
-        if codebase.startswith(('http://', 'https://')):
-            # For GitHub URLs, use the repo name as slug
-            codebase_name = codebase.rstrip('/').split('/')[-1]
-        else:
-            # For local paths or names, use the last part of the path
-            codebase_name = Path(codebase).name
-            
-        # Check if codebase is already ingested
-        if codebase_name not in available_codebases:
-            available_msg = "\nAvailable codebases:\n" + "\n".join(available_codebases) if available_codebases else "\nNo codebases are currently ingested."
-            return f"Codebase '{codebase_name}' not found. Please ingest it first using ingest_codebase.{available_msg}"
+        not_found = check_codebase(codebase)
+        if not_found:
+            return not_found
         
-        context = generate_context(codebase, query, rerank=rerank)
+        from basicmcp.codeqa.chat.search import generate_context
+        # Off the event loop so other tool calls (and ingestion progress) are served meanwhile.
+        # The results of the first table searched are streamed as a progress notification
+        context = await asyncio.to_thread(generate_context, codebase, query, rerank=rerank, nprobes=nprobes,
+                                          refine_factor=refine_factor, max_tokens=max_tokens,
+                                          on_chunk=chunk_sender(ctx))
         if not context:
             return "No relevant context found for the query."
         return context
@@ -64,6 +228,44 @@ async def codeqa(codebase: str, query: str, rerank=True) -> str:
         logger.error("Error in codeqa: %s", str(e))
         return f"Error processing query: {str(e)}"
 
+@mcp.tool()
+async def query_cache_stats() -> str:
+    """
+    Hit and miss counters of the codeqa query cache
+    """
+    from basicmcp.codeqa.chat.cache import QUERY_CACHE
+    return "\n".join(f"{name}: {value}" for name, value in QUERY_CACHE.stats().items())
+
+@mcp.tool()
+async def find_references(codebase: str, symbol: str) -> str:
+    """
+    Find where a class or method is defined and referenced, using the symbol index instead of semantic search
+    Args:
+        codebase: The codebase to query. Can be a name, github link, or local path
+        symbol: A class or method name, or Class.method
+    """
+    try:
+        not_found = check_codebase(codebase)
+        if not_found:
+            return not_found
+
+        from basicmcp.codeqa.index.symbols import lookup_symbol
+        codebase_name = get_codebase_name(codebase)
+        definitions, references = await asyncio.to_thread(
+            lookup_symbol, get_central_storage_dir() / codebase_name, codebase_name, symbol
+        )
+        if not definitions and not references:
+            return f"No definitions or references found for '{symbol}'."
+
+        lines = [f"Definitions of '{symbol}':"]
+        lines += [f"{row['file_path']}:{row['line']}:{row['column']} ({row['kind']})" for row in definitions] or ["none"]
+        lines.append(f"References to '{symbol}':")
+        lines += [f"{row['file_path']}:{row['line']}:{row['column']} {row['text']}" for row in references] or ["none"]
+        return "\n".join(lines)
+    except Exception as e:
+        logger.error("Error in find_references: %s", str(e))
+        return f"Error finding references: {str(e)}"
+
 @mcp.tool()
 async def list_codebases_mcp():
     """
@@ -87,20 +289,61 @@ async def globaldb_ingest(texts: Optional[List[str]] = None, imgs: Optional[List
         texts: List of texts
         imgs: List of images
     """
+    from basicmcp.global_db.ops import ingest_data
+    return await asyncio.to_thread(ingest_data, texts, imgs)
 
-    return ingest_data(texts, imgs)
+@mcp.tool()
+async def globaldb_ingest_images(path: str, batch_size: Optional[int] = None, wait: bool = False,
+                                 ctx: Context = None) -> str:
+    """
+    Bulk ingest images into the global database. Runs in the background and returns a job id,
+    check on it with ingestion_status or stop it with cancel_ingestion
+    Args:
+        path: Directory (searched recursively), image file or glob pattern such as photos/**/*.jpg
+        batch_size: Images embedded and written at a time
+        wait: Wait for the ingestion to finish, sending progress notifications, instead of returning right away
+    """
+    from basicmcp.codeqa.index.jobs import submit_ingestion
+    from basicmcp.global_db.ops import ingest_images
+    options = {"batch_size": batch_size} if batch_size else {}
+    job = submit_ingestion(path, ingest=ingest_images, **options)
+    if not wait:
+        return f"Started image ingestion job {job.id} for {path}. Check on it with ingestion_status."
+    await follow_job(job, ctx)
+    return format_job(job)
 
 @mcp.tool()
-async def globaldb_query(query: str):
+async def globaldb_query(query: str, limit: int = 10, offset: int = 0, max_distance: Optional[float] = None,
+                         full_images: bool = False) -> list:
     """
-    Query the global database
+    Query the global database. Returns the matching images as thumbnails with their captions, then the matching texts
     Args:
         query: The search query
+        limit: Matches per page, for images and texts each
+        offset: Matches to skip, e.g. 10 for the second page of 10
+        max_distance: Leave out matches further than this distance
+        full_images: Return the stored images instead of thumbnails
+    """
+    from basicmcp.global_db.ops import query_db, result_content
+    image_rows, text_rows = await asyncio.to_thread(query_db, query, None, limit, offset, max_distance, full_images)
+    return result_content(image_rows, text_rows, offset)
+
+@mcp.tool()
+async def globaldb_latency() -> str:
+    """
+    Latency of the global database operations (model load, embedding, add, search) since the server started
     """
-    return query_db(query)
+    from basicmcp.global_db.service import get_global_db
+    latency = get_global_db().latency()
+    if not latency:
+        return "The global database has not been used yet."
+    return "\n".join(f"{operation}: {stats['count']} calls, last {stats['last_ms']} ms, mean {stats['mean_ms']} ms"
+                     for operation, stats in latency.items())
 
 
 if __name__ == "__main__":
+    from basicmcp.codeqa.index.run_ingestion import run_ingestion
+    from basicmcp.codeqa.chat.search import generate_context
     try:
         context = run_ingestion("https://github.com/lancedb/lancedb")
         context = generate_context("lancedb", "what is lancedb")
@@ -0,0 +1,5 @@
+import os
+
+# Offline, deterministic embeddings and no shared embedding cache for tests that ingest codebases
+os.environ.setdefault("BASICMCP_EMBEDDING_BACKEND", "hash")
+os.environ.setdefault("BASICMCP_EMBEDDING_CACHE", "0")
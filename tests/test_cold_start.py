@@ -0,0 +1,60 @@
+import os
+import subprocess
+import sys
+
+# Generous by default so slow CI machines pass, tighten locally with BASICMCP_COLD_START_BUDGET_MS
+COLD_START_BUDGET_MS = int(os.getenv("BASICMCP_COLD_START_BUDGET_MS", "2500"))
+HEAVY_MODULES = ["lancedb", "torch", "sentence_transformers", "open_clip", "tree_sitter_languages", "pandas"]
+
+
+def import_times(module):
+    """Run `python -X importtime -c 'import module'` and return {module: cumulative microseconds}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        try:
+            times[name.strip()] = int(cumulative.strip())
+        except ValueError:
+            continue  # header line
+    return times
+
+
+def test_server_import_skips_heavy_modules():
+    times = import_times("basicmcp.mcp_server")
+    loaded = [module for module in HEAVY_MODULES if module in times]
+    assert loaded == []
+
+
+def test_server_cold_start_budget():
+    # Best of a few runs to smooth out noise from a cold disk cache
+    cold_start_ms = min(
+        import_times("basicmcp.mcp_server")["basicmcp.mcp_server"] for _ in range(3)
+    ) / 1000
+    assert cold_start_ms < COLD_START_BUDGET_MS, (
+        f"Importing the MCP server took {cold_start_ms:.0f}ms, budget is {COLD_START_BUDGET_MS}ms"
+    )
+
+
+def test_warm_up_starts_with_the_server_not_at_import(monkeypatch):
+    import anyio
+    from mcp.shared.memory import create_connected_server_and_client_session
+    from basicmcp import mcp_server
+
+    started = []
+    monkeypatch.setattr(mcp_server, "warm_up", lambda: started.append(1))
+    assert started == []
+
+    async def connect():
+        async with create_connected_server_and_client_session(mcp_server.mcp._mcp_server) as client:
+            await client.initialize()
+            return len(started)
+
+    assert anyio.run(connect) == 1
@@ -0,0 +1,39 @@
+from basicmcp.codeqa.chat.context import assemble_context, signature, SECTION_SEPARATOR
+from basicmcp.codeqa.index.tokens import estimate_tokens
+
+LEDGER = "class Ledger:\n    def deposit(self, amount):\n        self.total += amount\n"
+
+
+def method(name, score, class_name="", body_lines=1):
+    body = "\n".join(f"        step_{i}()" for i in range(body_lines))
+    return {"file_path": "ledger.py", "class_name": class_name, "_relevance_score": score,
+            "source_code": f"def {name}(self,\n        amount):\n{body}"}
+
+
+def ledger(score):
+    return {"file_path": "ledger.py", "class_name": "Ledger", "_relevance_score": score, "source_code": LEDGER,
+            "method_declarations": "def deposit(self, amount):\n        self.total += amount", "references": "app.py"}
+
+
+def test_signature():
+    assert signature("def parse(\n    text,\n):\n    return text") == "def parse(\n    text,\n):"
+    assert signature("public int size() {\n  return n;\n}") == "public int size() {"
+
+
+def test_methods_of_included_classes_are_collapsed():
+    context = assemble_context([method("deposit", 0.9, "Ledger"), method("audit", 0.5)], [ledger(0.8)])
+    methods, classes = context.split(SECTION_SEPARATOR)
+    assert "def audit" in methods and "def deposit" not in methods
+    assert "class Ledger" in classes and "References: \napp.py" in classes
+
+
+def test_budget_is_filled_by_score_with_signatures_when_tight():
+    long_method = method("reconcile", 0.9, body_lines=200)
+    context = assemble_context([long_method, method("audit", 0.1)], [], max_tokens=100)
+    assert estimate_tokens(context) <= 100 + estimate_tokens(SECTION_SEPARATOR)
+    # Too long for the budget in full, kept as its signature
+    assert "def reconcile(self,\n        amount):\n    ..." in context and "step_199" not in context
+    assert "step_0()" in context.split("def audit")[1]
+
+    assert "def reconcile" in assemble_context([long_method], [], max_tokens=10000).split("step_199")[0]
+    assert assemble_context([long_method], [], max_tokens=1) == SECTION_SEPARATOR
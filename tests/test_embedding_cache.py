@@ -0,0 +1,90 @@
+from basicmcp.codeqa.index.embedding_cache import EmbeddingCache
+
+
+class CountingEmbedder:
+    def __init__(self):
+        self.texts = []
+
+    def __call__(self, texts):
+        self.texts.extend(texts)
+        return [[float(len(text)), 1.0, 0.0] for text in texts]
+
+
+def test_repeat_texts_are_not_recomputed(tmp_path):
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path)
+
+    first = cache.embed(["def a(): pass", "def b(): pass", "def a(): pass"], embedder)
+    assert embedder.texts == ["def a(): pass", "def b(): pass"]
+
+    second = EmbeddingCache("test-model", 3, uri=tmp_path).embed(["def b(): pass", "def a(): pass"], embedder)
+    assert len(embedder.texts) == 2
+    assert second == [first[1], first[0]]
+
+
+def test_cache_is_keyed_by_model(tmp_path):
+    embedder = CountingEmbedder()
+    EmbeddingCache("model-a", 3, uri=tmp_path).embed(["x"], embedder)
+    EmbeddingCache("model-b", 3, uri=tmp_path).embed(["x"], embedder)
+    assert embedder.texts == ["x", "x"]
+
+
+def test_failed_embeddings_are_not_cached(tmp_path):
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path)
+    assert cache.embed(["x"], lambda texts: [None]) == [None]
+    assert cache.get_many([cache.key("x")]) == {}
+
+
+def test_evict_keeps_most_recently_used(tmp_path):
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path, max_entries=1)
+    cache.embed(["old"], embedder)
+    cache.embed(["new"], embedder)
+    cache.evict()
+    assert list(cache.get_many([cache.key("old"), cache.key("new")])) == [cache.key("new")]
+
+
+def test_hits_are_written_once_on_flush(tmp_path):
+    embedder = CountingEmbedder()
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path, max_entries=1)
+    cache.embed(["old"], embedder)
+    cache.embed(["new"], embedder)
+    version = cache._table.version
+    cache.embed(["old"], embedder)
+    # Lookups do not commit
+    assert cache._table.version == version
+    cache.flush()
+    cache.evict()
+    assert list(cache.get_many([cache.key("old"), cache.key("new")])) == [cache.key("old")]
+
+
+def test_evict_drops_exactly_the_overflow(tmp_path):
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path, max_entries=2)
+    # One batch, one shared timestamp
+    cache.embed(["a", "b", "c", "d"], CountingEmbedder())
+    cache.evict()
+    assert cache._table.count_rows() == 2
+
+
+def test_evict_only_compacts_after_deleting(tmp_path, monkeypatch):
+    cache = EmbeddingCache("test-model", 3, uri=tmp_path, max_entries=2)
+    cache.embed(["a", "b"], CountingEmbedder())
+    optimized = []
+    monkeypatch.setattr(type(cache._table), "optimize", lambda table, *args, **kwargs: optimized.append(1))
+    cache.evict()
+    assert optimized == []
+    cache.embed(["c"], CountingEmbedder())
+    cache.evict()
+    assert optimized == [1] and cache.counts() == (0, 3)
+
+
+def test_one_cache_per_model_across_threads(tmp_path, monkeypatch):
+    from concurrent.futures import ThreadPoolExecutor
+    from basicmcp.codeqa.index import embedding_cache
+
+    monkeypatch.setattr(embedding_cache, "CACHE_DIR", tmp_path)
+    monkeypatch.setattr(embedding_cache, "CACHE_ENABLED", True)
+    monkeypatch.setattr(embedding_cache, "_CACHES", {})
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        caches = list(pool.map(lambda _: embedding_cache.get_embedding_cache("test-model", 3), range(8)))
+    assert all(cache is caches[0] for cache in caches)
@@ -0,0 +1,98 @@
+import git
+from pathlib import Path
+import pytest
+from basicmcp.codeqa.index import git_source
+
+
+@pytest.fixture
+def origin(tmp_path, monkeypatch):
+    """A local repository served over file://, with mirrors and checkouts kept in tmp_path"""
+    monkeypatch.setattr(git_source, "MIRRORS_DIR", tmp_path / "mirrors")
+    monkeypatch.setattr(git_source, "CHECKOUTS_DIR", tmp_path / "checkouts")
+    path = tmp_path / "origin" / "owner" / "app"
+    repo = git.Repo.init(path, initial_branch="main")
+    with repo.config_writer() as config:
+        config.set_value("user", "name", "test")
+        config.set_value("user", "email", "test@example.com")
+        # Lets the blobless shallow clone use its filter over file://
+        config.set_value("uploadpack", "allowFilter", "true")
+    repo.url = f"file://{path}"
+    return repo
+
+
+def commit(repo, files, message="change"):
+    for name, source in files.items():
+        if source is None:
+            repo.index.remove([name], working_tree=True)
+            continue
+        path = Path(repo.working_tree_dir) / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(source)
+        repo.index.add([name])
+    return repo.index.commit(message).hexsha
+
+
+def test_mirror_worktree_is_reused_and_follows_new_commits(origin):
+    first = commit(origin, {"a.py": "one\n", "b.py": "two\n"})
+    path = git_source.checkout_worktree(origin.url)
+    assert path == git_source.CHECKOUTS_DIR / git_source.repo_path(origin.url)
+    assert (path / "a.py").read_text() == "one\n"
+    assert git_source.mirror_dir(origin.url).joinpath("HEAD").exists()
+
+    commit(origin, {"a.py": "changed\n", "b.py": None})
+    (path / "untracked.py").write_text("left over\n")
+    # The mirror fetches the new commit and the same worktree is moved to it and cleaned
+    assert git_source.checkout_worktree(origin.url) == path
+    assert (path / "a.py").read_text() == "changed\n"
+    assert not (path / "b.py").exists() and not (path / "untracked.py").exists()
+
+    git_source.checkout_worktree(origin.url, ref=first)
+    assert (path / "b.py").read_text() == "two\n" and git.Repo(path).head.commit.hexsha == first
+
+
+def test_shallow_clone_fetches_only_the_ref(origin, tmp_path):
+    first = commit(origin, {"a.py": "one\n"})
+    commit(origin, {"a.py": "two\n"})
+    origin.create_tag("v1", ref=first)
+
+    target = git_source.shallow_clone(origin.url, tmp_path / "clone")
+    assert (target / "a.py").read_text() == "two\n"
+    assert git.Repo(target).git.rev_list("--count", "HEAD") == "1"
+
+    tagged = git_source.shallow_clone(origin.url, tmp_path / "tagged", ref="v1")
+    assert (tagged / "a.py").read_text() == "one\n"
+
+
+def test_tree_reads_files_from_the_mirror_without_a_checkout(origin):
+    sha = commit(origin, {"a.py": "one\n", "pkg/b.py": "two\n"})
+    tree = git_source.open_tree(origin.url)
+    assert tree.sha == sha and tree.root == f"{origin.url}@tree"
+    assert tree.paths() == ["app/a.py", "app/pkg/b.py"]
+    assert tree.read("app/pkg/b.py") == b"two\n"
+    assert tree.hash("app/a.py") == origin.commit(sha).tree["a.py"].hexsha
+    assert not git_source.CHECKOUTS_DIR.exists()
+
+    commit(origin, {"a.py": "changed\n"})
+    # Blob hashes change with the content only
+    updated = git_source.open_tree(origin.url)
+    assert updated.hash("app/a.py") != tree.hash("app/a.py")
+    assert updated.hash("app/pkg/b.py") == tree.hash("app/pkg/b.py")
+
+
+@pytest.mark.parametrize("clone_mode", git_source.CLONE_MODES)
+def test_repository_urls_are_queried_under_the_slug_they_were_ingested_as(origin, tmp_path, monkeypatch,
+                                                                          clone_mode):
+    from basicmcp.mcp_server import check_codebase, get_codebase_name
+    from basicmcp.codeqa.chat.search import generate_context
+    from basicmcp.codeqa.index.run_ingestion import run_ingestion
+
+    monkeypatch.setenv("BASICMCP_STORAGE_DIR", str(tmp_path / "indices"))
+    commit(origin, {"ledger.py": "class Ledger:\n    def deposit(self, amount):\n        return amount\n"})
+    # Served from a directory named like the URLs of hosted repositories, with the .git suffix
+    served = Path(origin.working_tree_dir).rename(Path(origin.working_tree_dir).with_name("app.git"))
+    url = f"file://{served}"
+
+    slug, _ = run_ingestion(url, clone_mode=clone_mode)
+    assert slug == get_codebase_name(url) == "app"
+    assert check_codebase(url) is None
+    assert "def deposit" in generate_context(url, "Ledger.deposit", rerank=False)
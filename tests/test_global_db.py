@@ -0,0 +1,302 @@
+import base64
+from io import BytesIO
+import numpy as np
+import pyarrow as pa
+import pytest
+import threading
+from PIL import Image
+from types import SimpleNamespace
+import torch
+from lancedb.embeddings import EmbeddingFunction, register
+from basicmcp.global_db.clip import ENCODERS, OpenClipEncoder
+from basicmcp.global_db.service import GlobalDB
+
+
+@register("basicmcp-test-clip")
+class FakeClip(EmbeddingFunction):
+    """Texts embed by length, images by their mean colour"""
+
+    def ndims(self):
+        return 3
+
+    def compute_query_embeddings(self, query, *args, **kwargs):
+        if isinstance(query, str):
+            return [np.array([len(query), 1.0, 0.0], dtype=np.float32)]
+        return [np.asarray(query.convert("RGB")).reshape(-1, 3).mean(axis=0).astype(np.float32)]
+
+    def compute_source_embeddings(self, images, *args, **kwargs):
+        # Encoded bytes or PIL images, like open-clip
+        images = [image if isinstance(image, Image.Image) else Image.open(BytesIO(image)) for image in images]
+        return [self.compute_query_embeddings(image)[0] for image in images]
+
+
+class FakeBatchedClip(OpenClipEncoder):
+    """OpenClipEncoder over a fake model embedding like FakeClip, a call per batch"""
+
+    def __init__(self, **options):
+        self.device = "cpu"
+        self.normalize = False
+        self._ndims = None
+        self.model = SimpleNamespace(calls=[], encode_image=self._encode_batch, encode_text=self._encode_batch)
+        self.preprocess = lambda image: torch.tensor(np.asarray(image.convert("RGB"), dtype=np.float32)
+                                                     .reshape(-1, 3).mean(axis=0))
+        self.tokenizer = lambda texts: torch.tensor([[len(text), 1.0, 0.0] for text in texts])
+
+    def _encode_batch(self, batch):
+        self.model.calls.append(len(batch))
+        return batch
+
+
+def png(color):
+    buffer = BytesIO()
+    Image.new("RGB", (2, 2), color).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def global_db(tmp_path, monkeypatch):
+    loads = []
+    original = FakeClip.__init__
+
+    def counting_init(self, *args, **kwargs):
+        loads.append(1)
+        original(self, *args, **kwargs)
+
+    monkeypatch.setattr(FakeClip, "__init__", counting_init)
+    db = GlobalDB(uri=tmp_path, model_name="basicmcp-test-clip", model_options={})
+    db.loads = loads
+    return db
+
+
+def test_model_and_table_are_loaded_once(global_db):
+    assert global_db.add(["a", "abc"], [png("red"), png("blue")]) == 2
+    assert global_db.add(["abcdef"], [png("green")]) == 3
+    results = global_db.search("abcdef", "vector_txt", limit=1)
+    assert results["text"].tolist() == ["abcdef"]
+    results = global_db.search(Image.new("RGB", (2, 2), "blue"), "vector_img", limit=1)
+    assert results["text"].tolist() == ["abc"]
+
+    assert len(global_db.loads) == 1
+    latency = global_db.latency()
+    assert latency["load_model"]["count"] == 1 and latency["open_table"]["count"] == 1
+    assert latency["add"]["count"] == 2 and latency["search"]["count"] == 2
+
+
+def test_rows_only_embed_the_modalities_they_have(global_db, monkeypatch):
+    embedded_images = []
+    original = FakeClip.compute_source_embeddings
+
+    def counting(self, images, *args, **kwargs):
+        embedded_images.extend(images)
+        return original(self, images, *args, **kwargs)
+
+    monkeypatch.setattr(FakeClip, "compute_source_embeddings", counting)
+    global_db.add(["a caption", "only some text", ""], [png("red"), None, png("blue")])
+    # The model gets the stored bytes opened in place
+    assert [image.convert("RGB").getpixel((0, 0)) for image in embedded_images] == [(255, 0, 0), (0, 0, 255)]
+
+    rows = global_db.table.to_arrow().to_pylist()
+    assert [row["img"] is None for row in rows] == [False, True, False]
+    assert [row["vector_txt"] is None for row in rows] == [False, False, True]
+    assert [row["text"] for row in rows] == ["a caption", "only some text", None]
+
+    images, texts = global_db.search_modalities("only some text", limit=10)
+    # Rows without an image (or text) never show up in that modality's matches
+    assert len(images) == 2 and images["thumbnail"].null_count == 0
+    assert texts["text"].to_pylist()[0] == "only some text" and len(texts) == 2
+
+
+def test_legacy_tables_are_migrated(tmp_path, monkeypatch):
+    import lancedb
+    from basicmcp.global_db import service
+    from lancedb.pydantic import LanceModel, Vector
+
+    class LegacySchema(LanceModel):
+        text: str
+        img: bytes
+        vector_img: Vector(3)
+        vector_txt: Vector(3)
+
+    placeholder = BytesIO()
+    Image.new("RGB", (1, 1), "white").save(placeholder, format="PNG")
+    table = lancedb.connect(tmp_path).create_table("globalDB", schema=LegacySchema)
+    table.add([
+        {"text": "note", "img": placeholder.getvalue(), "vector_img": [0, 0, 0], "vector_txt": [0, 0, 0]},
+        {"text": "", "img": png("red"), "vector_img": [0, 0, 0], "vector_txt": [0, 0, 0]},
+    ])
+
+    batches = []
+    rows_of = GlobalDB.rows
+    monkeypatch.setattr(GlobalDB, "rows", lambda self, texts, *args: (batches.append(len(texts)),
+                                                                      rows_of(self, texts, *args))[1])
+    monkeypatch.setattr(service, "GLOBALDB_BATCH_SIZE", 1)
+    global_db = GlobalDB(uri=tmp_path, model_name="basicmcp-test-clip", model_options={})
+    # Started at server start while a request opens the table, it runs once and the request waits for it
+    threads = [threading.Thread(target=global_db.migrate_legacy), threading.Thread(target=lambda: global_db.table)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    rows = global_db.table.to_arrow().to_pylist()
+    # Re-embedded a batch at a time through a staging table that is gone afterwards
+    assert batches == [1, 1] and global_db.latency()["migrate"]["count"] == 1
+    assert "globalDB_migrating" not in lancedb.connect(tmp_path)
+    assert [(row["text"], row["img"] is None) for row in rows] == [("note", True), (None, False)]
+    assert rows[0]["vector_txt"] == [4.0, 1.0, 0.0] and rows[0]["vector_img"] is None
+    assert rows[1]["vector_img"] == [255.0, 0.0, 0.0] and rows[1]["vector_txt"] is None
+    assert global_db.add(["more"], [None]) == 3
+
+    # Nothing left to migrate: the next start neither migrates nor loads the model
+    restarted = GlobalDB(uri=tmp_path, model_name="basicmcp-test-clip", model_options={})
+    assert restarted.migrate_legacy() is False and restarted._model is None
+
+
+def test_ingest_images_in_batches(global_db, tmp_path, monkeypatch):
+    from basicmcp.global_db import ops
+
+    images = tmp_path / "photos"
+    (images / "nested").mkdir(parents=True)
+    for i, color in enumerate(("red", "green", "blue", "white", "black")):
+        Image.new("RGB", (40, 20), color).save(images / ("nested" if i % 2 else ".") / f"{i}.png")
+    (images / "notes.txt").write_text("not an image")
+    (images / "broken.jpg").write_bytes(b"not a jpeg")
+    assert len(ops.image_files(str(images))) == 6
+    assert len(ops.image_files(str(images / "*.png"))) == 3
+
+    monkeypatch.setattr(ops, "get_global_db", lambda: global_db)
+    reports = []
+    result = ops.ingest_images(str(images), batch_size=2, workers=2, max_side=10,
+                               progress=lambda stage, **counts: reports.append(counts))
+
+    assert result == {"images_ingested": 5, "images_failed": 1, "total_rows": 5}
+    # Every batch is written on its own, the unreadable file is skipped
+    assert global_db.latency()["add"]["count"] == 3
+    assert reports[0] == {"images_total": 6, "images_ingested": 0, "images_failed": 0}
+    assert reports[-1] == {"images_total": 6, "images_ingested": 5, "images_failed": 1}
+    stored = global_db.table.to_arrow().column("img").to_pylist()
+    assert {Image.open(BytesIO(img)).size for img in stored} == {(10, 5)}
+
+    # Iterators of encoded images with texts work as well
+    result = global_db.ingest_images(iter([(png("red"), "a red square"), png("blue")]), batch_size=8)
+    assert result["images_ingested"] == 2 and result["total_rows"] == 7
+    results = global_db.search("a red square", "vector_txt", limit=1)
+    assert results["text"].tolist() == ["a red square"]
+
+
+def test_images_are_stored_as_encoded_with_format_and_thumbnail(global_db, tmp_path, monkeypatch):
+    from basicmcp.global_db import ops
+
+    buffer = BytesIO()
+    Image.new("RGB", (400, 300), "red").save(buffer, format="JPEG")
+    jpeg = buffer.getvalue()
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(jpeg)
+    data_url = "data:image/png;base64," + base64.b64encode(png("blue")).decode()
+
+    assert ops.is_base64_image(data_url) and ops.is_base64_image(base64.b64encode(jpeg).decode())
+    assert not ops.is_base64_image(str(path)) and not ops.is_base64_image(base64.b64encode(b"hello").decode())
+
+    monkeypatch.setattr(ops, "get_global_db", lambda: global_db)
+    # Every element is dispatched on its own type
+    result = ops.ingest_data(["file", "view", "url", "pil"],
+                             [str(path), memoryview(jpeg), data_url, Image.new("RGB", (2, 2), "green")])
+    assert result.endswith("is 4")
+
+    rows = global_db.table.to_arrow().select(["text", "img", "format", "thumbnail"]).to_pylist()
+    stored = {row["text"]: row for row in rows}
+    # Encoded files are stored byte for byte, JPEGs are not turned into PNGs
+    assert stored["file"]["img"] == jpeg and stored["view"]["img"] == jpeg
+    assert [stored[text]["format"] for text in ("file", "view", "url", "pil")] == ["jpeg", "jpeg", "png", "png"]
+    thumbnail = Image.open(BytesIO(stored["file"]["thumbnail"]))
+    assert thumbnail.format == "JPEG" and max(thumbnail.size) <= 128
+
+    assert ops.ingest_data(["bad"], [b"not an image"]).startswith("Error")
+
+
+def test_tables_without_thumbnails_gain_the_columns(tmp_path, monkeypatch):
+    import lancedb
+    from basicmcp.global_db import ops
+
+    db = lancedb.connect(tmp_path)
+    db.create_table("globalDB", data=[{"text": "old", "img": png("red"), "vector_img": [1.0, 0, 0],
+                                        "vector_txt": [3.0, 1, 0]}], schema=pa.schema([
+        pa.field("text", pa.string()), pa.field("img", pa.binary()),
+        pa.field("vector_img", pa.list_(pa.float32(), 3)), pa.field("vector_txt", pa.list_(pa.float32(), 3)),
+    ]))
+    global_db = GlobalDB(uri=tmp_path, model_name="basicmcp-test-clip", model_options={})
+    assert global_db.add(["new"], [png("blue")]) == 2
+    rows = global_db.table.to_arrow().select(["text", "format"]).to_pylist()
+    assert rows == [{"text": "old", "format": None}, {"text": "new", "format": "png"}]
+
+    # Rows without a thumbnail are previewed with one made from the stored image
+    monkeypatch.setattr(ops, "get_global_db", lambda: global_db)
+    image_rows, _ = ops.query_db(img=Image.new("RGB", (2, 2), "red"), limit=1)
+    assert image_rows[0]["text"] == "old" and image_rows[0]["preview_format"] == "jpeg"
+    assert Image.open(BytesIO(image_rows[0]["preview"])).format == "JPEG"
+
+
+def test_full_images_in_formats_clients_cannot_show_are_sent_as_png(global_db, monkeypatch):
+    from basicmcp.global_db import ops
+
+    monkeypatch.setattr(ops, "get_global_db", lambda: global_db)
+    buffer = BytesIO()
+    Image.new("RGB", (2, 2), "red").save(buffer, format="BMP")
+    global_db.add(["bitmap"], [buffer.getvalue()])
+
+    image_rows, _ = ops.query_db("bitmap", limit=1, full_images=True)
+    assert image_rows[0]["preview_format"] == "png"
+    assert Image.open(BytesIO(image_rows[0]["preview"])).format == "PNG"
+    assert ops.result_content(image_rows, [])[1].mimeType == "image/png"
+
+
+def test_query_pages_without_vectors_and_returns_previews(global_db, monkeypatch):
+    from basicmcp.global_db import ops
+
+    monkeypatch.setattr(ops, "get_global_db", lambda: global_db)
+    texts = ["a", "ccc", "dddd", "ffffff", "jjjjjjjjjj"]
+    global_db.add(texts, [png((40 * i, 0, 0)) for i in range(len(texts))])
+
+    image_rows, text_rows = ops.query_db("dddd", limit=2)
+    assert [row["text"] for row in text_rows] == ["dddd", "ccc"]
+    assert not any(column.startswith("vector") or column == "img" for column in text_rows[0])
+    assert all(row["preview_format"] == "jpeg" and row["preview"][:3] == b"\xff\xd8\xff" for row in image_rows)
+
+    _, page = ops.query_db("dddd", limit=2, offset=2)
+    assert [row["text"] for row in page] == ["ffffff", "a"]
+    _, close = ops.query_db("dddd", max_distance=5)
+    assert [row["text"] for row in close] == ["dddd", "ccc", "ffffff"]
+
+    image_rows, _ = ops.query_db("dddd", limit=1, full_images=True)
+    assert image_rows[0]["preview_format"] == "png" and image_rows[0]["preview"] in [png((40 * i, 0, 0)) for i in range(5)]
+
+    content = ops.result_content(image_rows, page, offset=2)
+    assert [item.type for item in content] == ["text", "image", "text"]
+    assert content[1].mimeType == "image/png" and base64.b64decode(content[1].data) == image_rows[0]["preview"]
+    assert content[2].text.splitlines()[1].startswith("3. (distance")
+
+
+def test_batched_models_embed_each_batch_in_one_pass(tmp_path, monkeypatch):
+    from basicmcp.global_db import service
+
+    opened = []
+    open_image = service.open_image
+    monkeypatch.setattr(service, "open_image", lambda data: (opened.append(1), open_image(data))[1])
+    monkeypatch.setitem(ENCODERS, "basicmcp-test-clip-batched", FakeBatchedClip)
+    global_db = GlobalDB(uri=tmp_path, model_name="basicmcp-test-clip-batched", model_options={"max_retries": 0})
+    colors = ["red", "green", "blue", "white", "black"]
+    result = global_db.ingest_images([(png(color), color) for color in colors], batch_size=2, max_side=0)
+
+    assert result["images_ingested"] == 5
+    # After the pass finding the vector size, one per batch for images and for texts, every image decoded once
+    assert global_db.model.model.calls == [1, 2, 2, 2, 2, 1, 1]
+    assert len(opened) == 5
+    results = global_db.search(Image.new("RGB", (2, 2), "blue"), "vector_img", limit=1)
+    assert results["text"].tolist() == ["blue"]
+
+
+def test_models_without_a_batched_encoder_are_logged(global_db, caplog):
+    with caplog.at_level("WARNING", logger="basicmcp.global_db.service"):
+        assert global_db.add(["some text"], [png("red")]) == 1
+    # Embedded one input at a time through the lancedb function, said once when the model loads
+    assert [record.getMessage() for record in caplog.records] == [
+        "basicmcp-test-clip has no batched encoder, images and texts are embedded one at a time"]
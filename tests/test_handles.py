@@ -0,0 +1,37 @@
+import shutil
+import lancedb
+import pyarrow as pa
+from basicmcp.codeqa.index.handles import get_table, invalidate
+from basicmcp.codeqa.index.manifest import save_manifest, new_build_id
+
+
+def create(uri, rows):
+    new_build_id(uri)
+    lancedb.connect(uri).create_table("demo", pa.table({"id": list(range(rows))}), mode="overwrite")
+    save_manifest(uri, {"files": {}, "rows": rows})
+
+
+def test_handles_are_reused_and_refreshed(tmp_path):
+    uri = tmp_path / "codebase"
+    uri.mkdir()
+    create(uri, 3)
+    table = get_table(uri, "demo")
+    assert get_table(uri, "demo") is table
+
+    # Incremental ingestion: same handle, latest version once the manifest is rewritten
+    lancedb.connect(uri).open_table("demo").add(pa.table({"id": [3]}))
+    assert get_table(uri, "demo").count_rows() == 3
+    save_manifest(uri, {"files": {}, "rows": 4})
+    assert get_table(uri, "demo") is table
+    assert table.count_rows() == 4
+
+    # Full ingestion rebuilds the directory
+    shutil.rmtree(uri)
+    uri.mkdir()
+    create(uri, 2)
+    rebuilt = get_table(uri, "demo")
+    assert rebuilt is not table
+    assert rebuilt.count_rows() == 2
+
+    invalidate(uri)
+    assert get_table(uri, "demo") is not rebuilt
@@ -0,0 +1,166 @@
+import csv
+import lancedb
+import pytest
+from basicmcp.codeqa.index.run_ingestion import run_ingestion
+
+FILES = {
+    "a.js": "class Util {\n  helper() {\n    return 1;\n  }\n}\n",
+    "b.js": "class Runner {\n  run() {\n    return 2;\n  }\n}\n",
+    "c.js": "class Other {\n  go() {\n    return new Util();\n  }\n}\n",
+}
+
+
+def write_repo(repo, files):
+    repo.mkdir(exist_ok=True)
+    for name, source in files.items():
+        (repo / name).write_text(source)
+
+
+def table_rows(artifacts_dir, slug):
+    db = lancedb.connect(artifacts_dir)
+    rows = {}
+    for suffix, columns in (("_method", ["file_path", "class_name", "name", "references"]),
+                            ("_class", ["file_path", "class_name", "references"])):
+        data = db.open_table(slug + suffix).to_arrow().select(columns).to_pylist()
+        rows[suffix] = sorted((*(row[c] for c in columns[:-1]), sorted(row["references"].split("; ")))
+                              for row in data)
+    return rows
+
+
+def csv_rows(artifacts_dir):
+    rows = {}
+    for name in ("class_data.csv", "method_data.csv"):
+        with open(artifacts_dir / name, newline="") as file:
+            rows[name] = sorted((row["file_path"], row["class_name"], row.get("name"),
+                                 sorted(row["references"].split("; "))) for row in csv.DictReader(file))
+    return rows
+
+
+@pytest.fixture
+def storage(tmp_path, monkeypatch):
+    monkeypatch.setenv("BASICMCP_STORAGE_DIR", str(tmp_path / "indices"))
+    return tmp_path
+
+
+CALLS_HELPER = "class Runner {  run() { return helper(); }\n}\n"
+
+
+@pytest.mark.parametrize("initial, edit", [
+    # b.js starts calling a method defined in the untouched a.js
+    (FILES, {"b.js": CALLS_HELPER}),
+    # c.js stops referencing Util and b.js, the only caller of helper, is removed
+    ({**FILES, "b.js": CALLS_HELPER}, {"c.js": "class Other {\n  go() {\n    return 3;\n  }\n}\n", "b.js": None}),
+])
+def test_incremental_run_matches_full_rebuild(storage, initial, edit):
+    repo = storage / "app"
+    write_repo(repo, initial)
+    slug, artifacts_dir = run_ingestion(str(repo), full=True)
+
+    for name, source in edit.items():
+        if source is None:
+            (repo / name).unlink()
+        else:
+            (repo / name).write_text(source)
+    run_ingestion(str(repo))
+    incremental = table_rows(artifacts_dir, slug), csv_rows(artifacts_dir)
+
+    run_ingestion(str(repo), full=True)
+    assert incremental == (table_rows(artifacts_dir, slug), csv_rows(artifacts_dir))
+
+
+def test_unchanged_definitions_gain_new_references(storage):
+    repo = storage / "app"
+    write_repo(repo, FILES)
+    slug, artifacts_dir = run_ingestion(str(repo), full=True)
+    (repo / "b.js").write_text(CALLS_HELPER)
+    run_ingestion(str(repo))
+
+    db = lancedb.connect(artifacts_dir)
+    helper = db.open_table(slug + "_method").search().where("name = 'helper'").to_arrow().to_pylist()
+    assert [row["references"] for row in helper] == [f"{repo / 'b.js'}:1:32"]
+
+
+def method_rows(file_path, names):
+    return [{"file_path": file_path, "class_name": "Util", "name": name, "doc_comment": None,
+             "source_code": f"{name}() {{ return '{name}'; }}", "references": "empty"} for name in names]
+
+
+def stored_rows(table):
+    data = table.to_arrow()
+    vectors = data.column("method_embeddings").to_pylist()
+    rows = data.drop_columns(["method_embeddings"]).to_pylist()
+    return sorted((tuple(sorted(row.items())), tuple(vector)) for row, vector in zip(rows, vectors))
+
+
+def test_row_spill_replays_rows_in_order(tmp_path):
+    from basicmcp.codeqa.index.stream import RowSpill
+
+    with RowSpill(tmp_path) as spill:
+        spill.write([{"name": "a"}, {"name": "b"}])
+        spill.write([])
+        spill.write([{"name": "c"}])
+        assert spill.count == 3
+        # Replayable, every pass reads the rows back from the start
+        assert [row["name"] for row in spill] == [row["name"] for row in spill] == ["a", "b", "c"]
+
+
+def test_embed_batches_are_bounded_and_read_rows_lazily(monkeypatch):
+    from basicmcp.codeqa.index import ingest
+
+    Method, _ = ingest.get_schemas()
+    calls, drawn = [], []
+    embed_texts = ingest.embed_texts
+
+    def counting_embed(texts):
+        calls.append(len(texts))
+        vectors = embed_texts(texts)
+        # The embedding of the last text fails
+        return vectors if len(calls) < 3 else [*vectors[:-1], None]
+
+    def rows():
+        for row in ingest._method_rows(method_rows("a.js", ["a", "b", "c", "d", "e"])):
+            drawn.append(row["name"])
+            yield row
+
+    monkeypatch.setattr(ingest, "embed_texts", counting_embed)
+    batches = ingest.embed_batches(rows(), Method, "code", "method_embeddings", batch_size=2)
+    first = next(batches)
+    assert first.num_rows == 2 and drawn == ["a", "b"]
+    assert [batch.num_rows for batch in batches] == [2]
+    # The row with the failed embedding is dropped, not written with a bad vector
+    assert calls == [2, 2, 1] and first.schema == Method.to_arrow_schema()
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 256])
+def test_streamed_writes_match_the_in_memory_path(tmp_path, batch_size):
+    import pandas as pd
+    from basicmcp.codeqa.index import ingest
+
+    Method, _ = ingest.get_schemas()
+    schema = Method.to_arrow_schema()
+    db = lancedb.connect(tmp_path)
+
+    def streamed(table, rows, replaced_files=None):
+        ingest.write_batches(table, ingest.embed_batches(ingest._method_rows(rows), Method, "code",
+                                                         "method_embeddings", batch_size),
+                             schema, replaced_files)
+
+    def in_memory(table, rows):
+        # The table's embedding function embeds the whole DataFrame in one add, as ingestion used to
+        table.add(pd.DataFrame(list(ingest._method_rows(rows))).fillna("empty"))
+
+    initial = method_rows("a.js", ["a", "b", "c"]) + method_rows("b.js", ["d"])
+    stream = db.create_table("stream", schema=Method)
+    memory = db.create_table("memory", schema=Method, on_bad_vectors="drop")
+    streamed(stream, initial)
+    in_memory(memory, initial)
+    assert stored_rows(stream) == stored_rows(memory)
+
+    # a.js changes b, loses c and gains e, b.js is untouched
+    changed = method_rows("a.js", ["a", "b", "e"])
+    changed[1]["source_code"] = "b() { return 'changed'; }"
+    streamed(stream, changed, replaced_files=["a.js"])
+    memory.delete("file_path = 'a.js'")
+    in_memory(memory, changed)
+    assert stored_rows(stream) == stored_rows(memory)
+    assert sorted(stream.to_arrow().column("name").to_pylist()) == ["a", "b", "d", "e"]
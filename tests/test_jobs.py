@@ -0,0 +1,97 @@
+import threading
+from basicmcp.codeqa.index import jobs
+from basicmcp.codeqa.index.jobs import submit_ingestion, get_job, CANCELLED, QUEUED, SUCCEEDED
+
+
+def wait_for(job, status):
+    for _ in range(100):
+        if job.status == status:
+            return
+        job.wait(0.05)
+    assert job.status == status
+
+
+def blocking_ingest(release):
+    def ingest(codebase, progress, **options):
+        progress("parsing", files_total=10, files_parsed=0)
+        while not release.wait(0.01):
+            # Reporting progress is where cancellation is picked up
+            progress("parsing", files_parsed=5)
+        return codebase, f"/indices/{codebase}"
+    return ingest
+
+
+def test_jobs_report_progress_and_results():
+    release = threading.Event()
+    job = submit_ingestion("alpha", ingest=blocking_ingest(release), full=True)
+    assert get_job(job.id) is job
+    assert job.options == {"full": True}
+    # A second request for the same codebase with the same options joins the running job
+    assert submit_ingestion("alpha", ingest=blocking_ingest(release), full=True) is job
+    # Other options are not dropped, they run once the current ingestion is done
+    incremental = submit_ingestion("alpha", ingest=blocking_ingest(release))
+    assert incremental is not job and incremental.after is job and incremental.options == {}
+    assert submit_ingestion("alpha", ingest=blocking_ingest(release)) is incremental
+
+    for _ in range(100):
+        if job.progress.get("files_parsed") == 5:
+            break
+        job.wait(0.05)
+    assert job.stage == "parsing"
+    assert job.percent() == 5 + 45 * 5 // 10
+
+    for _ in range(100):
+        if incremental.stage == "waiting":
+            break
+        incremental.wait(0.05)
+    assert incremental.status == QUEUED and incremental.progress == {"waiting_for": job.id}
+
+    release.set()
+    wait_for(job, SUCCEEDED)
+    assert job.to_dict()["result"] == {"project_slug": "alpha", "artifacts_dir": "/indices/alpha"}
+    assert job.percent() == 100
+    wait_for(incremental, SUCCEEDED)
+    assert incremental.started >= job.finished
+
+
+def test_concurrency_cap_and_cancellation():
+    release = threading.Event()
+    running = [submit_ingestion(f"busy{i}", ingest=blocking_ingest(release)) for i in range(jobs.MAX_INGESTIONS)]
+    queued = submit_ingestion("waiting", ingest=blocking_ingest(release))
+    assert queued.status == QUEUED
+
+    queued.cancel()
+    assert queued.status == CANCELLED
+    running[0].cancel()
+    wait_for(running[0], CANCELLED)
+
+    release.set()
+    for job in running[1:]:
+        wait_for(job, SUCCEEDED)
+
+
+def test_jobs_keep_dict_results_and_count_images():
+    def ingest(source, progress, **options):
+        progress("ingesting images", images_total=4, images_ingested=2, images_failed=0)
+        assert job.percent() == 50
+        return {"images_ingested": 4}
+
+    job = submit_ingestion("photos/*.jpg", ingest=ingest)
+    wait_for(job, SUCCEEDED)
+    assert job.to_dict()["result"] == {"images_ingested": 4}
+
+
+def test_jobs_of_different_ingestions_for_one_path_are_separate():
+    release = threading.Event()
+
+    def ingest_images(source, progress, **options):
+        release.wait(5)
+        return {"images_ingested": 0}
+
+    codebase_job = submit_ingestion("/data/shared", ingest=blocking_ingest(release))
+    image_job = submit_ingestion("/data/shared", ingest=ingest_images)
+    assert image_job is not codebase_job
+    assert submit_ingestion("/data/shared", ingest=ingest_images) is image_job
+    release.set()
+    wait_for(codebase_job, SUCCEEDED)
+    wait_for(image_job, SUCCEEDED)
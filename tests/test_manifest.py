@@ -0,0 +1,43 @@
+import pytest
+from basicmcp.codeqa.index.manifest import (
+    build_manifest,
+    diff_manifest,
+    is_compatible,
+    load_manifest,
+    save_manifest,
+)
+
+
+@pytest.fixture
+def codebase(tmp_path):
+    (tmp_path / "a.py").write_text("def a():\n    pass\n")
+    (tmp_path / "b.py").write_text("def b():\n    pass\n")
+    return tmp_path
+
+
+def test_manifest_roundtrip(codebase, tmp_path):
+    files = [str(codebase / "a.py"), str(codebase / "b.py")]
+    manifest = build_manifest(codebase, files, "model")
+    save_manifest(tmp_path, manifest)
+    assert load_manifest(tmp_path) == manifest
+
+
+def test_diff_manifest(codebase):
+    old = build_manifest(codebase, [str(codebase / "a.py"), str(codebase / "b.py")], "model")
+
+    (codebase / "a.py").write_text("def a():\n    return 1\n")
+    (codebase / "c.py").write_text("def c():\n    pass\n")
+    new = build_manifest(codebase, [str(codebase / "a.py"), str(codebase / "c.py")], "model")
+
+    added, modified, removed = diff_manifest(old, new)
+    assert added == [str(codebase / "c.py")]
+    assert modified == [str(codebase / "a.py")]
+    assert removed == [str(codebase / "b.py")]
+
+
+def test_model_change_is_incompatible(codebase):
+    files = [str(codebase / "a.py")]
+    old = build_manifest(codebase, files, "model")
+    assert is_compatible(old, build_manifest(codebase, files, "model"))
+    assert not is_compatible(old, build_manifest(codebase, files, "other-model"))
+    assert not is_compatible(None, old)
@@ -0,0 +1,64 @@
+import copy
+import pytest
+from basicmcp.codeqa.index import preprocess
+from basicmcp.codeqa.index.preprocess import load_files, parse_code_files, find_references
+
+
+@pytest.fixture
+def codebase(tmp_path):
+    for i in range(6):
+        (tmp_path / f"module_{i}.py").write_text(
+            f"class Widget{i}:\n"
+            f"    def run_{i}(self):\n"
+            f"        return helper_{i}()\n\n"
+            f"def helper_{i}():\n"
+            f"    return Widget{i}()\n"
+        )
+    (tmp_path / "Main.java").write_text(
+        "class Main {\n"
+        "    void start() { Widget0 w = new Widget0(); w.run_0(); }\n"
+        "}\n"
+    )
+    return tmp_path
+
+
+def test_parallel_parse_matches_serial(codebase):
+    files = load_files(codebase)
+    serial = parse_code_files(files, workers=1)
+    parallel = parse_code_files(files, workers=3, chunk_size=2)
+    assert parallel == serial
+
+
+def test_parallel_references_match_serial(codebase):
+    files = load_files(codebase)
+    _, _, class_names, method_names = parse_code_files(files, workers=1)
+    serial = find_references(files, class_names, method_names, workers=1)
+    parallel = find_references(files, class_names, method_names, workers=3, chunk_size=2)
+    assert parallel == serial
+
+
+def test_definitions_and_references_come_from_one_parse_per_file(codebase, monkeypatch):
+    parsed = []
+    get_treesitter = preprocess._get_treesitter
+
+    class CountingParser:
+        def __init__(self, parser):
+            self._parser = parser
+
+        def parse(self, source):
+            parsed.append(source)
+            return self._parser.parse(source)
+
+    def counting_treesitter(language):
+        treesitter = copy.copy(get_treesitter(language))
+        treesitter.parser = CountingParser(treesitter.parser)
+        return treesitter
+
+    monkeypatch.setattr(preprocess, "_get_treesitter", counting_treesitter)
+    files = load_files(codebase)
+    extractions = preprocess.extract_code_files(files, workers=1)
+    _, _, class_names, method_names = preprocess.collect_definitions(extractions)
+    references = preprocess.resolve_references(extractions, class_names, method_names)
+
+    assert sorted(parsed) == sorted(open(file_path, "rb").read() for file_path, _ in files)
+    assert [ref["text"] for ref in references["method"]["run_0"]] == ["w.run_0()"]
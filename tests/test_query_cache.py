@@ -0,0 +1,44 @@
+from basicmcp.codeqa.chat.cache import QueryCache, normalize_query
+
+SCOPE = ("ledger", ("build", 3, 3), False, "hybrid", None, None)
+
+
+def test_exact_hits_are_case_and_whitespace_insensitive():
+    cache = QueryCache(max_size=2, ttl=0)
+    assert cache.get(SCOPE, "Deposit  amount") is None
+    cache.miss()
+    cache.put(SCOPE, "Deposit  amount", "context")
+    assert normalize_query(" deposit\namount ") == "deposit amount"
+    assert cache.get(SCOPE, " deposit\namount ") == "context"
+    # Other search options are another scope
+    assert cache.get(SCOPE[:2] + (True,) + SCOPE[3:], "deposit amount") is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_lru_eviction_ttl_and_new_versions():
+    cache = QueryCache(max_size=2, ttl=0)
+    for query in ("a", "b"):
+        cache.put(SCOPE, query, query)
+    cache.get(SCOPE, "a")
+    cache.put(SCOPE, "c", "c")
+    assert cache.get(SCOPE, "b") is None and cache.get(SCOPE, "a") == "a"
+    assert cache.stats()["evictions"] == 1
+
+    # A new table version of the codebase drops its cached contexts
+    new_version = (SCOPE[0], ("build", 4, 4)) + SCOPE[2:]
+    assert cache.get(new_version, "a") is None
+    assert cache.get(SCOPE, "a") is None
+
+    expired = QueryCache(max_size=2, ttl=-1)
+    expired.put(SCOPE, "a", "a")
+    assert expired.get(SCOPE, "a") is None
+
+
+def test_semantic_tier():
+    cache = QueryCache(max_size=4, ttl=0, similarity=0.9)
+    cache.put(SCOPE, "how are deposits stored", "deposits", vector=[1.0, 0.0, 0.0])
+    cache.put(SCOPE, "parse amounts", "parsing", vector=[0.0, 1.0, 0.0])
+    assert cache.get_similar(SCOPE, [0.95, 0.1, 0.0]) == "deposits"
+    assert cache.get_similar(SCOPE, [0.6, 0.6, 0.5]) is None
+    assert cache.stats()["semantic_hits"] == 1
+    assert QueryCache(similarity=0).get_similar(SCOPE, [1.0, 0.0, 0.0]) is None
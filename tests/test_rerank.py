@@ -0,0 +1,80 @@
+import time
+import pyarrow as pa
+import pytest
+from types import SimpleNamespace
+from basicmcp.codeqa.chat import rerank
+from basicmcp.codeqa.chat.rerank import BudgetedReranker
+
+
+class KeywordRanker:
+    """Scores a document by how often it mentions the first query word"""
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.batches = []
+
+    def rank(self, query, docs, doc_ids):
+        time.sleep(self.delay)
+        self.batches.append(len(docs))
+        word = query.split()[0]
+        scores = {doc_id: SimpleNamespace(score=float(doc.count(word))) for doc_id, doc in zip(doc_ids, docs)}
+        return SimpleNamespace(get_result_by_docid=scores.__getitem__)
+
+
+def candidates(*texts):
+    return pa.table({"source_code": list(texts), "_distance": [float(i) for i in range(len(texts))]})
+
+
+def test_scores_top_candidates_in_batches():
+    ranker = KeywordRanker()
+    reranker = BudgetedReranker(ranker, depth=3, batch_size=2, max_length=4)
+    results = reranker.rerank_vector("parse it", candidates("a", "b parse", "parse parse", "parse parse parse"))
+    # Only the depth best candidates are scored, the fourth is cut
+    assert ranker.batches == [2, 1]
+    assert results["source_code"].to_pylist() == ["parse parse", "b parse", "a"]
+    assert reranker.seconds_per_doc is not None
+
+
+def test_falls_back_to_retrieval_order_over_budget():
+    reranker = BudgetedReranker(KeywordRanker(delay=0.02), depth=4, batch_size=1, budget_ms=1)
+    results = reranker.rerank_vector("parse", candidates("a", "parse"))
+    assert results["source_code"].to_pylist() == ["a", "parse"]
+    assert reranker.fallbacks == 1
+    # Known to be too slow, the next query is not even attempted
+    reranker.rerank_vector("parse", candidates("a", "parse"))
+    assert reranker.fallbacks == 2 and len(reranker.ranker.batches) == 1
+
+
+def test_reranking_resumes_once_the_model_is_fast_again():
+    ranker = KeywordRanker(delay=0.05)
+    reranker = BudgetedReranker(ranker, depth=4, batch_size=1, budget_ms=20, probe_every=2)
+    # A slow first call, e.g. loading the model, puts the estimate over budget
+    assert reranker.rerank_vector("parse", candidates("a", "parse"))["source_code"].to_pylist() == ["a", "parse"]
+    ranker.delay = 0.0
+    reranker.rerank_vector("parse", candidates("a", "parse"))
+    assert reranker.fallbacks == 2 and len(ranker.batches) == 1
+    # Every second skipped query re-measures on one batch and reranks when it fits again
+    results = reranker.rerank_vector("parse", candidates("a", "parse"))
+    assert results["source_code"].to_pylist() == ["parse", "a"]
+    assert reranker.fallbacks == 2 and reranker.seconds_per_doc < 0.01
+
+
+@pytest.mark.parametrize("query_type", ["vector", "hybrid"])
+def test_generate_context_reranks(tmp_path, monkeypatch, query_type):
+    from basicmcp.codeqa.index.run_ingestion import run_ingestion
+    from basicmcp.codeqa.chat.search import generate_context
+
+    monkeypatch.setenv("BASICMCP_STORAGE_DIR", str(tmp_path / "indices"))
+    repo = tmp_path / "rerank_app"
+    repo.mkdir()
+    (repo / "app.py").write_text(
+        "def deposit(amount):\n    return amount\n\n\n"
+        "def withdraw(amount):\n    return -amount\n"
+    )
+    run_ingestion(str(repo), full=True)
+    monkeypatch.setattr(rerank, "_RERANKER", BudgetedReranker(KeywordRanker()))
+    timings = {}
+    context = generate_context(repo.name, "withdraw money", query_type=query_type, timings=timings, cache=False)
+    # The top method is the one the ranker prefers
+    assert "def withdraw" in context.split("\n\n")[0]
+    assert "rerank" in timings
@@ -0,0 +1,133 @@
+import pytest
+from basicmcp.codeqa.index.run_ingestion import run_ingestion
+from basicmcp.codeqa.chat.search import generate_context, QUERY_TYPES
+
+SOURCE = '''
+class Ledger:
+    """Keeps account balances."""
+
+    def __init__(self):
+        self.balances = {}
+
+    def deposit(self, account, amount):
+        """Add amount to the balance of account."""
+        self.balances[account] = self.balances.get(account, 0) + amount
+
+
+class Parser:
+    def parse_amount(self, text):
+        return int(text.strip())
+'''
+
+
+@pytest.fixture
+def codebase(tmp_path, monkeypatch):
+    monkeypatch.setenv("BASICMCP_STORAGE_DIR", str(tmp_path / "indices"))
+    repo = tmp_path / "ledger_app"
+    repo.mkdir()
+    (repo / "ledger.py").write_text(SOURCE)
+    run_ingestion(str(repo), full=True)
+    return repo.name
+
+
+@pytest.mark.parametrize("query_type", QUERY_TYPES)
+def test_generate_context_records_stage_timings(codebase, query_type):
+    timings = {}
+    context = generate_context(codebase, "deposit amount balance", rerank=False,
+                               query_type=query_type, timings=timings)
+    assert "def deposit" in context
+    assert {"setup_database", "search", "format"} <= set(timings)
+    assert ("embed_query" in timings) == (query_type != "fts")
+
+
+def test_generate_context_without_timings(codebase):
+    context = generate_context(codebase, "parse amount", rerank=False)
+    assert "File:" in context and not context.startswith("Error")
+
+
+def test_query_is_embedded_once_for_both_tables(codebase, monkeypatch):
+    from basicmcp.codeqa.index.hash_embedding import HashEmbeddings
+    calls = []
+    original = HashEmbeddings.compute_query_embeddings
+
+    def counting(self, query, *args, **kwargs):
+        calls.append(query)
+        return original(self, query, *args, **kwargs)
+
+    monkeypatch.setattr(HashEmbeddings, "compute_query_embeddings", counting)
+    context = generate_context(codebase, "deposit amount", rerank=False, query_type="vector")
+    assert "def deposit" in context
+    assert calls == ["deposit amount"]
+
+
+def test_contexts_are_cached_until_the_tables_change(codebase, tmp_path):
+    from basicmcp.codeqa.chat.cache import QUERY_CACHE
+    QUERY_CACHE.clear()
+    first = generate_context(codebase, "parse amount", rerank=False)
+    timings = {}
+    assert generate_context(codebase, "Parse  amount", rerank=False, timings=timings) == first
+    assert timings["cache_hit"] == "exact"
+
+    (tmp_path / codebase / "ledger.py").write_text(SOURCE.replace("parse_amount", "parse_total"))
+    run_ingestion(str(tmp_path / codebase))
+    timings = {}
+    assert "parse_total" in generate_context(codebase, "parse amount", rerank=False, timings=timings)
+    assert "cache_hit" not in timings
+
+
+@pytest.mark.parametrize("query_type", QUERY_TYPES)
+def test_search_returns_only_projected_columns(codebase, query_type):
+    from basicmcp.codeqa.chat.search import setup_database, embed_query, build_search, METHOD_COLUMNS
+    method_table, class_table = setup_database(codebase)
+    [(vector, vector_column)] = embed_query([method_table], "deposit")
+    results = build_search(method_table, "deposit", vector, vector_column, query_type,
+                           columns=METHOD_COLUMNS).limit(2).to_arrow()
+    assert results.num_rows <= 2
+    assert "method_embeddings" not in results.column_names and "code" not in results.column_names
+    assert set(METHOD_COLUMNS) <= set(results.column_names)
+
+
+def test_symbol_queries_take_the_exact_lookup(codebase):
+    from basicmcp.codeqa.chat.search import parse_symbol_query, setup_database
+    assert parse_symbol_query("`Ledger.deposit()`") == ("Ledger", "deposit")
+    assert parse_symbol_query("parse_amount") == (None, "parse_amount")
+    assert parse_symbol_query("Parser") == parse_symbol_query("`Parser`") == (None, "Parser")
+    assert parse_symbol_query("deposit()") == parse_symbol_query("`deposit`") == (None, "deposit")
+    # Plain words are left to semantic search
+    assert parse_symbol_query("deposit") is None and parse_symbol_query("empty") is None
+    assert parse_symbol_query("how are deposits stored") is None
+
+    method_table, class_table = setup_database(codebase)
+    indexed = {tuple(index.columns) for index in method_table.list_indices()}
+    assert {("name",), ("class_name",), ("file_path",)} <= indexed
+
+    timings = {}
+    context = generate_context(codebase, "Ledger.deposit", rerank=False, timings=timings)
+    assert timings["route"] == "symbol" and "embed_query" not in timings
+    assert "def deposit" in context and "parse_amount" not in context
+
+    timings = {}
+    assert "class Parser" in generate_context(codebase, "Parser", rerank=False, timings=timings)
+    assert timings["route"] == "symbol"
+
+    # No such definition, answered by semantic search
+    timings = {}
+    context = generate_context(codebase, "Parser.deposit", rerank=False, timings=timings)
+    assert "route" not in timings and "embed_query" in timings and "File:" in context
+
+
+def test_symbol_lookups_skip_markdown_rows(tmp_path, monkeypatch):
+    from basicmcp.codeqa.chat.search import lookup_symbol_rows, setup_database
+    monkeypatch.setenv("BASICMCP_STORAGE_DIR", str(tmp_path / "indices"))
+    repo = tmp_path / "notes_app"
+    repo.mkdir()
+    (repo / "ledger.py").write_text(SOURCE)
+    (repo / "README.md").write_text("# Ledger\n")
+    run_ingestion(str(repo), full=True)
+
+    method_table, class_table = setup_database(repo.name)
+    assert class_table.count_rows("class_name = 'empty'") == 1
+    assert lookup_symbol_rows(method_table, class_table, None, "empty") == ([], [])
+    timings = {}
+    generate_context(repo.name, "`empty`", rerank=False, timings=timings)
+    assert "route" not in timings
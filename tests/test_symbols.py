@@ -0,0 +1,69 @@
+from basicmcp.codeqa.index.symbols import (
+    lookup_symbol,
+    stored_references,
+    symbol_rows,
+    write_symbols,
+)
+
+
+def extraction(file_path, definitions, references):
+    return {
+        "file_path": file_path,
+        "classes": [],
+        "methods": [],
+        "definitions": definitions,
+        "references": references,
+    }
+
+
+EXTRACTIONS = [
+    extraction(
+        "Widget.java",
+        [("class", "Widget", "Widget", 1, 1), ("method", "run", "Widget", 2, 5)],
+        [],
+    ),
+    extraction(
+        "Main.java",
+        [("method", "main", "Main", 2, 5)],
+        [("class", "Widget", 3, 9, "Widget"), ("method", "run", 4, 11, "w.run()")],
+    ),
+]
+
+
+def test_lookup_symbol(tmp_path):
+    write_symbols(tmp_path, "demo", symbol_rows(EXTRACTIONS))
+
+    definitions, references = lookup_symbol(tmp_path, "demo", "Widget.run")
+    assert [(row["file_path"], row["line"]) for row in definitions] == [("Widget.java", 2)]
+    assert [(row["file_path"], row["text"]) for row in references] == [("Main.java", "w.run()")]
+
+    definitions, references = lookup_symbol(tmp_path, "demo", "Other.run")
+    assert definitions == []
+    assert len(references) == 1
+
+
+def test_replace_file_symbols(tmp_path):
+    write_symbols(tmp_path, "demo", symbol_rows(EXTRACTIONS))
+    write_symbols(tmp_path, "demo", [], replaced_files=["Main.java"])
+
+    _, references = lookup_symbol(tmp_path, "demo", "run")
+    assert references == []
+
+
+def test_stored_references_skip_replaced_files(tmp_path):
+    write_symbols(tmp_path, "demo", symbol_rows(EXTRACTIONS))
+
+    references = stored_references(tmp_path, "demo", {"Widget"}, {"run"})
+    assert [ref["file"] for ref in references["class"]["Widget"]] == ["Main.java"]
+    assert [ref["line"] for ref in references["method"]["run"]] == [4]
+
+    references = stored_references(tmp_path, "demo", {"Widget"}, {"run"}, exclude_files=["Main.java"])
+    assert not references["class"] and not references["method"]
+
+
+def test_name_index_is_created_once_symbols_arrive(tmp_path):
+    write_symbols(tmp_path, "demo", [])
+    table = write_symbols(tmp_path, "demo", symbol_rows(EXTRACTIONS), replaced_files=["Widget.java", "Main.java"])
+    assert [index.columns for index in table.list_indices()] == [["name"]]
+    table = write_symbols(tmp_path, "demo", [], replaced_files=["Main.java"])
+    assert [index.columns for index in table.list_indices()] == [["name"]]
@@ -0,0 +1,64 @@
+from basicmcp.codeqa.index.tokens import fits_without_encoding, clip_texts, OffsetsClipper
+
+
+class WordTokenizer:
+    """Fast-tokenizer stand-in: one token per whitespace separated word"""
+
+    def __call__(self, texts, add_special_tokens=False, return_offsets_mapping=False):
+        offsets = []
+        for text in texts:
+            spans, start = [], None
+            for i, char in enumerate(text + " "):
+                if char.isspace() and start is not None:
+                    spans.append((start, i))
+                    start = None
+                elif not char.isspace() and start is None:
+                    start = i
+            offsets.append(spans)
+        return {"offset_mapping": offsets}
+
+
+class CountingClipper:
+    def __init__(self):
+        self.seen = []
+
+    def clip_batch(self, texts, max_tokens):
+        self.seen.extend(texts)
+        return [text[:max_tokens] for text in texts]
+
+
+def test_fits_without_encoding_is_a_safe_bound():
+    assert fits_without_encoding("abcd", 4)
+    assert not fits_without_encoding("abcde", 4)
+    # Non-ASCII characters take several bytes, and may take as many tokens
+    assert not fits_without_encoding("ééé", 4)
+
+
+def test_clip_texts_only_tokenizes_long_texts():
+    clipper = CountingClipper()
+    texts = ["short", "x" * 50, "also short"]
+    assert clip_texts(texts, 20, clipper) == ["short", "x" * 20, "also short"]
+    assert clipper.seen == ["x" * 50]
+
+
+def test_offsets_clipper_keeps_original_text():
+    clipper = OffsetsClipper(WordTokenizer())
+    texts = ["Alpha Beta  Gamma Delta", "One two"]
+    assert clipper.clip_batch(texts, 3) == ["Alpha Beta  Gamma", "One two"]
+
+
+def test_sentence_transformers_are_clipped_to_their_sequence_length(monkeypatch):
+    from types import SimpleNamespace
+    from basicmcp.codeqa.index import embeddings
+
+    tokenizer = SimpleNamespace(num_special_tokens_to_add=lambda: 2)
+    model = SimpleNamespace(embedding_model=SimpleNamespace(max_seq_length=512, tokenizer=tokenizer))
+    monkeypatch.setattr(embeddings, "BACKEND", "sentence-transformers")
+    monkeypatch.setattr(embeddings, "get_model", lambda: model)
+    monkeypatch.setattr(embeddings, "_MAX_TOKENS", None)
+    assert embeddings.get_max_tokens() == 510
+
+    # A model without the attributes falls back to the usual local limit
+    monkeypatch.setattr(embeddings, "get_model", lambda: SimpleNamespace())
+    monkeypatch.setattr(embeddings, "_MAX_TOKENS", None)
+    assert embeddings.get_max_tokens() == embeddings.FALLBACK_MAX_TOKENS
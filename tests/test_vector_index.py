@@ -0,0 +1,38 @@
+import random
+import lancedb
+import pyarrow as pa
+from basicmcp.codeqa.index.vector_index import index_params, ensure_vector_index, has_vector_index, tune_search
+
+DIM = 32
+
+
+def make_table(tmp_path, num_rows):
+    rng = random.Random(0)
+    data = pa.table({
+        "id": [str(i) for i in range(num_rows)],
+        "vector": pa.array([[rng.random() for _ in range(DIM)] for _ in range(num_rows)],
+                           pa.list_(pa.float32(), DIM)),
+    })
+    return lancedb.connect(tmp_path).create_table("vectors", data)
+
+
+def test_index_params():
+    assert index_params(1_000_000, 1024, "IVF_PQ") == {"num_partitions": 1000, "num_sub_vectors": 64}
+    assert index_params(10_000, 384, "IVF_PQ") == {"num_partitions": 100, "num_sub_vectors": 24}
+    assert index_params(10_000, 100, "IVF_PQ")["num_sub_vectors"] == 25
+    assert index_params(10_000, 384, "IVF_HNSW_SQ") == {"num_partitions": 1}
+
+
+def test_ensure_vector_index_respects_threshold(tmp_path):
+    table = make_table(tmp_path, 512)
+    assert not ensure_vector_index(table, "vector", DIM, min_rows=1000)
+    assert not has_vector_index(table, "vector")
+
+    assert ensure_vector_index(table, "vector", DIM, min_rows=500)
+    assert has_vector_index(table, "vector")
+    # Already indexed, left to optimize()
+    assert not ensure_vector_index(table, "vector", DIM, min_rows=500)
+
+    query = [0.5] * DIM
+    results = tune_search(table.search(query), nprobes=4, refine_factor=2).limit(5).to_arrow()
+    assert results.num_rows == 5